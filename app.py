@@ -1,6 +1,14 @@
 import os
+import gzip
+import secrets
+import hmac
 import json
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+import queue
+import time
+from datetime import datetime, timezone
+from flask import (Flask, render_template, request, redirect, url_for, flash, session, jsonify,
+                   Response, stream_with_context, g, send_file, abort)
+from itsdangerous import BadSignature, SignatureExpired
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
@@ -8,26 +16,26 @@ from functools import wraps
 from database import (get_user, add_user, update_user_tariff, add_feedback,
                       update_module_progress, get_module_progress,
                       add_homework_submission, get_homework_submissions,
-                      get_db_connection)
+                      get_db_connection, get_user_cache_stats,
+                      get_access_code, get_access_codes, add_access_code as db_add_access_code,
+                      delete_access_code as db_delete_access_code,
+                      generate_access_codes, iter_access_code_batch, normalize_expires_at,
+                      get_users_page, get_feedback_page, get_submissions_page,
+                      EXPORTS, iter_export, get_user_summary,
+                      get_user_summary_version, save_submission_feedback, enqueue_update,
+                      change_feed, get_changes_since, get_submission_feedback,
+                      REVIEW_ORDERS, claim_next_submission, release_submission_claim,
+                      get_review_queue_stats, get_submission_file)
+from exports import iter_csv, FORMATS
 from modules_content import MODULES, MODULE_DESCRIPTIONS, HOMEWORK, ADDITIONAL_MATERIALS
 import sqlite3
-from config import ACCESS_CODES
-
-
-# Функция для сохранения кодов доступа в config.py
-def save_access_codes(access_codes):
-    config_path = 'config.py'
-    with open(config_path, 'r', encoding='utf-8') as file:
-        config_content = file.read()
-
-    # Найдем блок с ACCESS_CODES и заменим его
-    import re
-    pattern = r'ACCESS_CODES = \{[^}]*\}'
-    replacement = f'ACCESS_CODES = {json.dumps(access_codes, indent=4, ensure_ascii=False)}'
-    new_content = re.sub(pattern, replacement, config_content)
-
-    with open(config_path, 'w', encoding='utf-8') as file:
-        file.write(new_content)
+from config import (MODULE_ACCESS, BOT_MODE, WEBHOOK_PATH, WEBHOOK_SECRET, BULK_CODES_MAX,
+                    ADMIN_PAGE_SIZE, ADMIN_PAGE_SIZE_MAX, TOKEN,
+                    MINI_APP_INIT_DATA_MAX_AGE, MINI_APP_TOKEN_TTL,
+                    SSE_HEARTBEAT, SSE_MAX_DURATION, CHANGES_MAX_EVENTS,
+                    REVIEW_LEASE_SECONDS, MEDIA_ROOT)
+from media import media_path
+from webapp_auth import validate_init_data, TokenSigner
 
 
 # Initialize Flask app
@@ -42,6 +50,9 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 
+# Signed API tokens for the Telegram mini-app
+mini_app_tokens = TokenSigner(app.secret_key, MINI_APP_TOKEN_TTL)
+
 # Simple admin auth
 ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "password")
@@ -63,6 +74,9 @@ def login():
 
         if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
             session['logged_in'] = True
+            # Кураторы делят одну учетную запись, поэтому захваты в очереди
+            # проверки привязываются к сессии
+            session['curator'] = f"{username}-{secrets.token_hex(4)}"
             flash('Вы успешно вошли в систему!', 'success')
             return redirect(url_for('index'))
         else:
@@ -78,17 +92,31 @@ def logout():
     return redirect(url_for('login'))
 
 
+def get_page_args():
+    """Размер страницы, курсор и общие фильтры списков админки"""
+    limit = request.args.get('limit', ADMIN_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, ADMIN_PAGE_SIZE_MAX))
+    filters = {
+        'tariff': request.args.get('tariff') or None,
+        'date_from': request.args.get('date_from') or None,
+        'date_to': request.args.get('date_to') or None,
+    }
+    return limit, request.args.get('cursor'), filters
+
+
 @app.route('/users')
 def users():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users ORDER BY registration_date DESC")
-        users = cursor.fetchall()
+    limit, cursor, filters = get_page_args()
+    users, next_cursor = get_users_page(limit, cursor, **filters)
 
-    return render_template('users.html', users=users)
+    return render_template('users.html',
+                           users=users,
+                           next_cursor=next_cursor,
+                           limit=limit,
+                           filters=filters)
 
 
 @app.route('/user/<int:user_id>')
@@ -170,17 +198,14 @@ def feedback_list():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT f.*, u.username, u.first_name, u.last_name 
-            FROM feedback f
-            JOIN users u ON f.user_id = u.user_id
-            ORDER BY f.sent_date DESC
-        """)
-        feedback = cursor.fetchall()
+    limit, cursor, filters = get_page_args()
+    feedback, next_cursor = get_feedback_page(limit, cursor, **filters)
 
-    return render_template('feedback.html', feedback=feedback)
+    return render_template('feedback.html',
+                           feedback=feedback,
+                           next_cursor=next_cursor,
+                           limit=limit,
+                           filters=filters)
 
 
 @app.route('/submissions')
@@ -188,19 +213,19 @@ def submissions():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT s.*, u.username, u.first_name, u.last_name 
-            FROM homework_submissions s
-            JOIN users u ON s.user_id = u.user_id
-            ORDER BY s.submitted_date DESC
-        """)
-        submissions = cursor.fetchall()
+    limit, cursor, filters = get_page_args()
+    filters['module_id'] = request.args.get('module_id', type=int)
+    # reviewed=1 - проверенные, reviewed=0 - ожидающие проверки
+    reviewed = request.args.get('reviewed')
+    filters['reviewed'] = {'1': True, '0': False}.get(reviewed)
+    submissions, next_cursor = get_submissions_page(limit, cursor, **filters)
 
     return render_template('submissions.html',
                            submissions=submissions,
-                           modules=MODULES)
+                           modules=MODULES,
+                           next_cursor=next_cursor,
+                           limit=limit,
+                           filters=filters)
 
 
 @app.route('/submission/<int:submission_id>', methods=['GET', 'POST'])
@@ -209,16 +234,22 @@ def submission_detail(submission_id):
         return redirect(url_for('login'))
 
     if request.method == 'POST':
-        feedback = request.form.get('feedback')
-
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE homework_submissions SET feedback = ? WHERE id = ?",
-                (feedback, submission_id))
-            conn.commit()
+        feedback = (request.form.get('feedback') or '').strip()
+        if not feedback:
+            # Пустой отзыв убрал бы задание из очереди без проверки
+            flash('Отзыв не может быть пустым', 'danger')
+            return redirect(url_for('submission_detail', submission_id=submission_id))
+
+        notification = f"📝 Куратор оставил отзыв на ваше домашнее задание:\n\n{feedback}"
+        if save_submission_feedback(submission_id, feedback, current_curator(), notification):
+            flash('Отзыв успешно сохранен', 'success')
+        else:
+            flash('Отзыв не сохранен: задание проверяет другой куратор или произошла ошибка', 'danger')
+            return redirect(url_for('submission_detail', submission_id=submission_id))
 
-        flash('Отзыв успешно сохранен', 'success')
+        # Работа через очередь: сразу берем следующее задание
+        if request.form.get('next'):
+            return review_queue_next()
         return redirect(
             url_for('submission_detail', submission_id=submission_id))
 
@@ -226,7 +257,8 @@ def submission_detail(submission_id):
         cursor = conn.cursor()
         cursor.execute(
             """
-            SELECT s.*, u.username, u.first_name, u.last_name 
+            SELECT s.id, s.user_id, s.module_id, s.submission, s.submitted_date,
+                   s.feedback, u.username, u.first_name, u.last_name
             FROM homework_submissions s
             JOIN users u ON s.user_id = u.user_id
             WHERE s.id = ?
@@ -244,7 +276,99 @@ def submission_detail(submission_id):
     return render_template('submission_detail.html',
                            submission=submission,
                            module_name=module_name,
-                           homework=homework)
+                           homework=homework,
+                           attachment=get_submission_file(submission_id))
+
+
+# Расширения для файлов без имени (фото и голосовые сообщения)
+ATTACHMENT_EXTENSIONS = {'photo': '.jpg', 'voice': '.ogg', 'document': ''}
+
+
+@app.route('/submission/<int:submission_id>/file')
+def submission_file(submission_id):
+    """Файл домашнего задания, отдается потоком с диска"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    attachment = get_submission_file(submission_id)
+    if not attachment or attachment[5] != 'stored':
+        # Еще не скачан ботом или скачивание не удалось
+        abort(404)
+
+    file_type, file_name, mime_type, _, sha256, _ = attachment
+    path = os.path.abspath(media_path(MEDIA_ROOT, sha256))
+    if not os.path.exists(path):
+        app.logger.error(f"Файл задания {submission_id} отсутствует на диске: {sha256}")
+        abort(404)
+
+    return send_file(
+        path,
+        mimetype=mime_type or 'application/octet-stream',
+        as_attachment=bool(request.args.get('download')),
+        download_name=file_name or f"submission-{submission_id}{ATTACHMENT_EXTENSIONS[file_type]}",
+        conditional=True
+    )
+
+
+def current_curator():
+    """Идентификатор куратора для захвата заданий в очереди проверки"""
+    if 'curator' not in session:
+        session['curator'] = f"{ADMIN_USERNAME}-{secrets.token_hex(4)}"
+    return session['curator']
+
+
+@app.route('/review_queue')
+def review_queue():
+    """Очередь домашних заданий, ожидающих отзыва куратора"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    return render_template('review_queue.html',
+                           stats=get_review_queue_stats(),
+                           modules=MODULES,
+                           orders=sorted(REVIEW_ORDERS))
+
+
+@app.route('/review_queue/stats')
+def review_queue_stats():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    return jsonify(get_review_queue_stats())
+
+
+@app.route('/review_queue/next', methods=['POST'])
+def review_queue_next():
+    """Захватывает следующее задание из очереди и открывает его"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    module_id = request.form.get('module_id', type=int)
+    order = request.form.get('order', 'oldest')
+    if order not in REVIEW_ORDERS:
+        order = 'oldest'
+
+    submission_id = claim_next_submission(current_curator(), REVIEW_LEASE_SECONDS, module_id, order)
+    if not submission_id:
+        flash('Нет заданий, ожидающих проверки', 'info')
+        return redirect(url_for('review_queue'))
+
+    return redirect(url_for('submission_detail', submission_id=submission_id,
+                            module_id=module_id, order=order))
+
+
+@app.route('/submission/<int:submission_id>/release', methods=['POST'])
+def release_submission(submission_id):
+    """Возвращает захваченное задание в очередь"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    release_submission_claim(submission_id, current_curator())
+    return redirect(url_for('review_queue'))
+
+
+def get_access_codes_by_tariff():
+    return {tariff: get_access_codes(tariff) for tariff in MODULE_ACCESS}
 
 
 @app.route('/access_codes')
@@ -252,7 +376,7 @@ def access_codes():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
 
-    return render_template('access_codes.html', access_codes=ACCESS_CODES)
+    return render_template('access_codes.html', access_codes=get_access_codes_by_tariff())
 
 
 @app.route('/add_access_code', methods=['POST'])
@@ -262,32 +386,39 @@ def add_access_code():
 
     code = request.form.get('code')
     tariff = request.form.get('tariff')
+    max_uses = request.form.get('max_uses') or None  # Пусто - без ограничений
+    expires_at = request.form.get('expires_at') or None  # Например, 2025-12-31 23:59
 
     if not code or not tariff:
         flash('Необходимо указать код и тариф', 'danger')
         return redirect(url_for('access_codes'))
 
-    if tariff not in ACCESS_CODES:
+    if tariff not in MODULE_ACCESS:
         flash('Указан неверный тариф', 'danger')
         return redirect(url_for('access_codes'))
 
-    # Проверяем, не существует ли уже такой код
-    for t, codes in ACCESS_CODES.items():
-        if code in codes:
-            flash(f'Код уже существует для тарифа {t}', 'danger')
+    if max_uses is not None:
+        if not max_uses.isdigit() or int(max_uses) < 1:
+            flash('Количество использований должно быть положительным числом', 'danger')
             return redirect(url_for('access_codes'))
+        max_uses = int(max_uses)
 
-    # Добавляем код
-    current_codes = list(ACCESS_CODES[tariff])
-    current_codes.append(code)
-    ACCESS_CODES[tariff] = current_codes
-
-    # Сохраняем изменения в config.py
     try:
-        save_access_codes(ACCESS_CODES)
+        expires_at = normalize_expires_at(expires_at)
+    except ValueError:
+        flash('Неверный срок действия, укажите дату в формате ГГГГ-ММ-ДД ЧЧ:ММ', 'danger')
+        return redirect(url_for('access_codes'))
+
+    # Проверяем, не существует ли уже такой код
+    existing = get_access_code(code)
+    if existing:
+        flash(f'Код уже существует для тарифа {existing[2]}', 'danger')
+        return redirect(url_for('access_codes'))
+
+    if db_add_access_code(code, tariff, max_uses, expires_at):
         flash('Код доступа успешно добавлен', 'success')
-    except Exception as e:
-        flash(f'Ошибка при сохранении кода: {str(e)}', 'danger')
+    else:
+        flash('Ошибка при сохранении кода', 'danger')
 
     return redirect(url_for('access_codes'))
 
@@ -298,29 +429,90 @@ def delete_access_code():
         return redirect(url_for('login'))
 
     code = request.form.get('code')
+
+    if not code:
+        flash('Необходимо указать код', 'danger')
+        return redirect(url_for('access_codes'))
+
+    if db_delete_access_code(code):
+        flash('Код доступа успешно удален', 'success')
+    else:
+        flash('Указан неверный код', 'danger')
+
+    return redirect(url_for('access_codes'))
+
+
+@app.route('/access_codes/generate', methods=['POST'])
+def generate_access_codes_route():
+    """Создает пачку уникальных кодов и отдает их потоком в CSV"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
     tariff = request.form.get('tariff')
+    count = request.form.get('count', '')
+    prefix = request.form.get('prefix', '').strip()
+    max_uses = request.form.get('max_uses') or '1'
+    expires_at = request.form.get('expires_at') or None
 
-    if not code or not tariff:
-        flash('Необходимо указать код и тариф', 'danger')
+    if tariff not in MODULE_ACCESS:
+        flash('Указан неверный тариф', 'danger')
         return redirect(url_for('access_codes'))
 
-    if tariff not in ACCESS_CODES or code not in ACCESS_CODES[tariff]:
-        flash('Указан неверный код или тариф', 'danger')
+    if not count.isdigit() or not 1 <= int(count) <= BULK_CODES_MAX:
+        flash(f'Количество кодов должно быть от 1 до {BULK_CODES_MAX}', 'danger')
         return redirect(url_for('access_codes'))
 
-    # Удаляем код
-    current_codes = list(ACCESS_CODES[tariff])
-    current_codes.remove(code)
-    ACCESS_CODES[tariff] = current_codes
+    if not max_uses.isdigit() or int(max_uses) < 1:
+        flash('Количество использований должно быть положительным числом', 'danger')
+        return redirect(url_for('access_codes'))
 
-    # Сохраняем изменения в config.py
     try:
-        save_access_codes(ACCESS_CODES)
-        flash('Код доступа успешно удален', 'success')
-    except Exception as e:
-        flash(f'Ошибка при удалении кода: {str(e)}', 'danger')
+        expires_at = normalize_expires_at(expires_at)
+    except ValueError:
+        flash('Неверный срок действия, укажите дату в формате ГГГГ-ММ-ДД ЧЧ:ММ', 'danger')
+        return redirect(url_for('access_codes'))
 
-    return redirect(url_for('access_codes'))
+    batch_id = generate_access_codes(tariff, int(count), prefix, int(max_uses), expires_at)
+    if not batch_id:
+        flash('Ошибка при создании кодов', 'danger')
+        return redirect(url_for('access_codes'))
+
+    rows = iter_access_code_batch(batch_id)
+    return Response(
+        stream_with_context(iter_csv(['code', 'tariff', 'max_uses', 'expires_at'], rows)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=codes_{tariff}_{batch_id}.csv'}
+    )
+
+
+@app.route('/export/<name>')
+def export(name):
+    """Выгрузка таблицы в CSV или JSONL потоком, без загрузки в память"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    fmt = request.args.get('format', 'csv')
+    if name not in EXPORTS or fmt not in FORMATS:
+        return jsonify({'error': 'Unknown export'}), 404
+
+    writer, mimetype, extension = FORMATS[fmt]
+    rows = iter_export(name,
+                       tariff=request.args.get('tariff') or None,
+                       date_from=request.args.get('date_from') or None,
+                       date_to=request.args.get('date_to') or None)
+    return Response(
+        stream_with_context(writer(EXPORTS[name][0], rows)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={name}.{extension}'}
+    )
+
+
+@app.route('/cache_stats')
+def cache_stats():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    return jsonify({'user_cache': get_user_cache_stats()})
 
 
 # =================================================================
@@ -337,110 +529,302 @@ def get_token_from_header():
 
 
 def api_auth_required(f):
-    """Декоратор для проверки авторизации API запросов"""
+    """Декоратор для проверки подписанного токена мини-приложения"""
 
     @wraps(f)
     def decorated(*args, **kwargs):
-        user_id = request.args.get('user_id')
+        error = authenticate_token(get_token_from_header())
+        if error:
+            return error
+        return f(*args, **kwargs)
+
+    return decorated
 
-        if not user_id:
-            return jsonify({'error': 'User ID is required'}), 401
 
-        # Проверяем, существует ли пользователь
-        user = get_user(int(user_id))
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+def authenticate_token(token):
+    """Проверяет токен мини-приложения; возвращает ответ с ошибкой или None"""
+    if not token:
+        return jsonify({'error': 'Authorization token is required'}), 401
 
-        return f(*args, **kwargs)
+    # Токен проверяется по подписи, без обращения к базе
+    try:
+        payload = mini_app_tokens.load(token)
+    except SignatureExpired:
+        return jsonify({'error': 'Token expired'}), 401
+    except BadSignature:
+        return jsonify({'error': 'Invalid token'}), 401
+
+    g.user_id = payload['user_id']
+    g.tariff = payload['tariff']
+    return None
 
-    return decorated
+
+@app.route('/api/mini-app/auth', methods=['POST'])
+def api_auth():
+    """Обменивает initData Telegram WebApp на короткоживущий токен"""
+    data = request.get_json(silent=True) or {}
+    telegram_user = validate_init_data(data.get('init_data'), TOKEN, MINI_APP_INIT_DATA_MAX_AGE)
+    if not telegram_user:
+        return jsonify({'error': 'Invalid init data'}), 401
+
+    user = get_user(telegram_user['id'])
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    return jsonify({
+        'token': mini_app_tokens.issue(user[0], user[4]),
+        'expires_in': MINI_APP_TOKEN_TTL
+    })
+
+
+# Ответы меньше этого размера не сжимаются
+GZIP_MIN_BYTES = 1024
+
+
+def summary_validators(user_id, version, updated_at):
+    """ETag и Last-Modified по версии сводки пользователя"""
+    etag = f"{user_id}-{version}"
+    last_modified = datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified):
+    """Проверяет If-None-Match / If-Modified-Since запроса"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def gzip_response(response):
+    """Сжимает тело ответа, если клиент поддерживает gzip"""
+    response.vary.add('Accept-Encoding')
+    if ('gzip' not in request.accept_encodings
+            or response.content_length < GZIP_MIN_BYTES):
+        return response
+    response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 
 @app.route('/api/mini-app/user-data')
 @api_auth_required
 def api_user_data():
     """Возвращает данные пользователя для мини-приложения"""
-    user_id = int(request.args.get('user_id'))
-    user = get_user(user_id)
-
-    # Получаем данные о прогрессе пользователя
-    progress = get_module_progress(user_id)
+    user_id = g.user_id
+
+    # Если у клиента актуальная версия, отвечаем 304 без чтения сводки
+    stamp = get_user_summary_version(user_id)
+    if not stamp:
+        return jsonify({'error': 'User not found'}), 404
+    etag, last_modified = summary_validators(user_id, *stamp)
+    if is_not_modified(etag, last_modified):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    # Пользователь и сводка прогресса читаются одним запросом по ключу
+    summary = get_user_summary(user_id)
+    if not summary:
+        return jsonify({'error': 'User not found'}), 404
+    (user_id, username, first_name, last_name, tariff,
+     completed_mask, _, completed_percentage, submission_counts,
+     last_activity, version, updated_at) = summary
 
     # Определяем тариф и доступные модули
-    from config import MODULE_ACCESS
-    tariff = user[4]
-    available_modules = MODULE_ACCESS.get(tariff.lower(), [])
-
-    # Конвертируем прогресс в более удобный формат
-    completed_modules = [
-        module_id for module_id, completed in progress if completed
-    ]
-    progress_data = []
+    available_modules = MODULE_ACCESS.get((tariff or '').lower(), [])
+    submissions_count = json.loads(submission_counts)
 
+    progress_data = []
+    homework_data = []
     for module_id in available_modules:
-        module_name = MODULES.get(module_id, f"Модуль {module_id}")
-        is_completed = module_id in completed_modules
         progress_data.append({
             'module_id': module_id,
-            'name': module_name,
-            'completed': is_completed
+            'name': MODULES.get(module_id, f"Модуль {module_id}"),
+            'completed': bool(completed_mask & (1 << module_id))
         })
-
-    # Рассчитываем общий прогресс в процентах
-    completed_percentage = 0
-    if available_modules:
-        completed_percentage = round(
-            (len(completed_modules) / len(available_modules)) * 100)
-
-    # Получаем данные о выполненных домашних заданиях
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT module_id, COUNT(*) FROM homework_submissions WHERE user_id = ? GROUP BY module_id",
-            (user_id, ))
-        submissions_count = dict(cursor.fetchall())
-
-    homework_data = []
-    for module_id in available_modules:
         homework_data.append({
-            'module_id':
-            module_id,
-            'name':
-            f"Модуль {module_id}",
-            'submissions_count':
-            submissions_count.get(module_id, 0)
+            'module_id': module_id,
+            'name': f"Модуль {module_id}",
+            'submissions_count': submissions_count.get(str(module_id), 0)
         })
 
-    return jsonify({
+    response = jsonify({
         'user': {
-            'user_id': user[0],
-            'username': user[1],
-            'first_name': user[2],
-            'last_name': user[3],
+            'user_id': user_id,
+            'username': username,
+            'first_name': first_name,
+            'last_name': last_name,
             'tariff': tariff
         },
         'progress': {
             'percentage': completed_percentage,
             'modules': progress_data
         },
-        'homework': homework_data
+        'homework': homework_data,
+        'last_activity': last_activity,
+        'version': version
     })
+    etag, last_modified = summary_validators(user_id, version, updated_at)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Клиент хранит ответ, но каждый раз перепроверяет его по ETag
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return gzip_response(response)
+
+
+@app.route('/api/mini-app/changes')
+@api_auth_required
+def api_changes():
+    """Изменения данных пользователя после версии since (дельта-синхронизация)"""
+    user_id = g.user_id
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'since is required'}), 400
+
+    stamp = get_user_summary_version(user_id)
+    if not stamp:
+        return jsonify({'error': 'User not found'}), 404
+    version = stamp[0]
+    if since == version:
+        return jsonify({'version': version, 'full': False,
+                        'progress': [], 'homework': [], 'feedback': []})
+
+    events = get_changes_since(user_id, since, CHANGES_MAX_EVENTS + 1)
+    # Версии идут подряд, поэтому пропуск означает удаленный или неполный
+    # журнал; смена тарифа меняет список модулей - в обоих случаях клиент
+    # загружает данные целиком
+    if (events is None or since > version
+            or len(events) != version - since
+            or any(kind == 'tariff' for _, kind, _, _ in events)):
+        return jsonify({'version': version, 'full': True})
+
+    summary = get_user_summary(user_id)
+    (_, _, _, _, tariff, completed_mask, _, completed_percentage,
+     submission_counts, last_activity, version, _) = summary
+    available_modules = set(MODULE_ACCESS.get((tariff or '').lower(), []))
+    submissions_count = json.loads(submission_counts)
+
+    progress_modules = sorted({module_id for _, kind, module_id, _ in events
+                               if kind == 'progress' and module_id in available_modules})
+    homework_modules = sorted({module_id for _, kind, module_id, _ in events
+                               if kind == 'submission' and module_id in available_modules})
+    feedback = get_submission_feedback({ref_id for _, kind, _, ref_id in events
+                                        if kind == 'feedback'})
+
+    return jsonify({
+        'version': version,
+        'full': False,
+        'percentage': completed_percentage,
+        'last_activity': last_activity,
+        'progress': [{
+            'module_id': module_id,
+            'completed': bool(completed_mask & (1 << module_id))
+        } for module_id in progress_modules],
+        'homework': [{
+            'module_id': module_id,
+            'submissions_count': submissions_count.get(str(module_id), 0)
+        } for module_id in homework_modules],
+        'feedback': [{
+            'submission_id': submission_id,
+            'module_id': module_id,
+            'feedback': text
+        } for submission_id, (module_id, text) in sorted(feedback.items())]
+    })
+
+
+def sse_message(event):
+    """Форматирует событие изменения в формате Server-Sent Events"""
+    return (f"id: {event['version']}\n"
+            f"event: {event['kind']}\n"
+            f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+
+
+@app.route('/api/mini-app/events')
+def api_events():
+    """Поток изменений прогресса, заданий и отзывов пользователя (SSE)"""
+    # EventSource не умеет передавать заголовки, поэтому токен в параметре
+    error = authenticate_token(request.args.get('token'))
+    if error:
+        return error
+
+    subscription = change_feed.subscribe(g.user_id)
+    if subscription is None:
+        response = jsonify({'error': 'Too many live connections'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    def stream():
+        deadline = time.monotonic() + SSE_MAX_DURATION
+        try:
+            yield "retry: 5000\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    event = subscription.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    # Комментарий держит соединение открытым через прокси
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    # Клиент не успевает читать события; он переподключится
+                    return
+                yield sse_message(event)
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/live_stats')
+def live_stats():
+    """Статистика открытых SSE-соединений этого процесса"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    return jsonify(change_feed.stats())
+
+
+# =================================================================
+# Telegram webhook
+# =================================================================
+
+if BOT_MODE == 'webhook':
+    # Воркеры gunicorn только складывают обновления в очередь; обрабатывает
+    # их и отправляет ответы один процесс бота (main.py), поэтому воркеров
+    # может быть сколько угодно
+    @app.route(WEBHOOK_PATH, methods=['POST'])
+    def telegram_webhook():
+        """Принимает обновления от Telegram и ставит их в очередь для бота"""
+        secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not WEBHOOK_SECRET or not hmac.compare_digest(secret, WEBHOOK_SECRET):
+            return jsonify({'error': 'Forbidden'}), 403
+
+        payload = request.get_data(as_text=True)
+        try:
+            update_id = int(json.loads(payload)['update_id'])
+        except (ValueError, KeyError, TypeError):
+            return jsonify({'error': 'Bad update'}), 400
+
+        # Ошибка записи: Telegram повторит доставку
+        if not enqueue_update(update_id, payload):
+            return jsonify({'error': 'Update not queued'}), 500
+        return ''
 
 
 @app.route('/mini-app')
 def mini_app():
     """Страница мини-приложения для Telegram"""
-    # В URL должен быть параметр user_id
-    user_id = request.args.get('user_id')
-    if not user_id:
-        return "Требуется идентификатор пользователя", 400
-
-    # Проверяем, существует ли пользователь
-    user = get_user(int(user_id))
-    if not user:
-        return "Пользователь не найден", 404
-
-    return render_template('mini_app.html', user_id=user_id)
+    # Пользователь определяется по initData Telegram при обращении к API
+    return render_template('mini_app.html')
 
 
 if __name__ == '__main__':
@@ -451,5 +835,4 @@ def codes():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
 
-    from config import ACCESS_CODES
-    return render_template('codes.html', codes=ACCESS_CODES)
+    return render_template('codes.html', codes=get_access_codes_by_tariff())
@@ -0,0 +1,832 @@
+import asyncio
+import json
+import logging
+import os
+from functools import lru_cache
+from aiogram import Bot, Dispatcher, Router, F
+from aiogram.filters import Command
+from aiogram.types import (
+    InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove,
+    InlineKeyboardButton, WebAppInfo
+)
+from config import (
+    TOKEN, TARIFF_DESCRIPTIONS, MODULE_ACCESS, ADMIN_IDS,
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS,
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_WORKERS,
+    JOBS_BATCH_SIZE, JOBS_POLL_INTERVAL,
+    MEDIA_ROOT, MEDIA_DOWNLOAD_WORKERS, MEDIA_POLL_INTERVAL, MEDIA_MAX_BYTES
+)
+from async_database import (
+    get_user, add_feedback,
+    update_module_progress, get_module_progress, add_homework_submission,
+    get_homework_submissions, redeem_access_code, schedule_module_reminder,
+    unblock_user, create_broadcast, finish_broadcast
+)
+from database import get_db_connection
+from modules_content import MODULES, MODULE_DESCRIPTIONS, HOMEWORK, ADDITIONAL_MATERIALS
+from outbox import OutboxWorker
+from outbound import OutboundScheduler, RateLimitedBot, NOTIFY, BULK
+from broadcast import BroadcastRunner
+from jobs import JobScheduler
+from media import MediaDownloader
+from keyboards import (
+    get_main_menu_keyboard, get_back_keyboard, get_modules_keyboard,
+    get_homework_keyboard, get_module_content_keyboard, get_access_keyboard,
+    get_submit_homework_keyboard, get_additional_materials_keyboard,
+    get_feedback_confirm_keyboard, get_back_to_modules_keyboard
+)
+from handlers import (
+    BotStates, ATTACHMENT_LABELS, BROADCAST_USAGE, get_submission_attachment,
+    submission_preview, parse_broadcast_command, notify_admins
+)
+from callback_router import CallbackRouter
+from state_store import create_state_store
+
+# asyncio runtime on aiogram. The handlers mirror handlers.py one to one;
+# database calls go through async_database and keyboards are built by
+# keyboards.py and converted to aiogram models.
+
+logger = logging.getLogger(__name__)
+
+NO_ACCESS_TEXT = "У вас нет доступа к курсу. Пожалуйста, введите код доступа с помощью команды /access."
+
+# Initialize state storage (in-memory or SQLite, see STATE_STORE)
+user_states = create_state_store('user_states')
+temp_data = create_state_store('temp_data')  # For storing temporary user data during conversations
+
+
+@lru_cache(maxsize=256)
+def as_markup(markup):
+    """Convert a keyboard from keyboards.py into the aiogram model.
+
+    keyboards.py hands out shared FrozenMarkup instances, so each one is
+    converted once.
+    """
+    data = json.loads(markup.to_json())
+    if 'inline_keyboard' in data:
+        return InlineKeyboardMarkup.model_validate(data)
+    if 'keyboard' in data:
+        return ReplyKeyboardMarkup.model_validate(data)
+    return ReplyKeyboardRemove.model_validate(data)
+
+
+def mini_app_markup(user_id):
+    host = os.environ.get('REPLIT_APP_HOST', 'replit.dev')
+    mini_app_url = f"https://{host}/mini-app?user_id={user_id}"
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="📊 Открыть интерактивный прогресс", web_app=WebAppInfo(url=mini_app_url))
+    ]])
+
+
+def register_command_handlers(router, user_states, temp_data):
+    @router.message(Command('start'))
+    async def start(message):
+        user_id = message.from_user.id
+        user = await get_user(user_id)
+
+        welcome_text = (
+            "👋 *Добро пожаловать в бот курса трансформации!*\n\n"
+            "Здесь вы найдете материалы курса, домашние задания "
+            "и сможете отслеживать свой прогресс."
+        )
+
+        if user:
+            tariff = user[4]
+            if user[6]:  # blocked_at: the user had blocked the bot and is back
+                await unblock_user(user_id)
+            await message.answer(
+                f"{welcome_text}\n\nВаш текущий тариф: *{tariff}*",
+                parse_mode="Markdown"
+            )
+            await show_main_menu(message, user_id)
+        else:
+            await message.answer(
+                f"{welcome_text}\n\nУ вас нет доступа к курсу. "
+                "Пожалуйста, введите код доступа с помощью команды /access.",
+                parse_mode="Markdown"
+            )
+
+    @router.message(Command('help'))
+    async def help_command(message):
+        help_text = (
+            "*Доступные команды:*\n\n"
+            "/start - Начать работу с ботом\n"
+            "/menu - Показать главное меню\n"
+            "/access - Ввести код доступа\n"
+            "/modules - Показать доступные модули\n"
+            "/homework - Показать домашние задания\n"
+            "/progress - Показать ваш прогресс\n"
+            "/webapp - Открыть интерактивное мини-приложение\n"
+            "/feedback - Отправить обратную связь\n"
+            "/info - Информация о курсе\n"
+            "/help - Показать это сообщение"
+        )
+        await message.answer(help_text, parse_mode="Markdown")
+
+    @router.message(Command('menu'))
+    async def menu_command(message):
+        await show_main_menu(message, message.from_user.id)
+
+    @router.message(Command('access'))
+    async def access_command(message):
+        await message.answer(
+            "Пожалуйста, введите код доступа для получения доступа к курсу:",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        await user_states.aset(message.from_user.id, BotStates.AWAITING_ACCESS_CODE)
+
+    @router.message(Command('modules'))
+    async def modules_command(message):
+        await modules_list(message, message.from_user.id)
+
+    @router.message(Command('homework'))
+    async def homework_command(message):
+        await homework_list(message, message.from_user.id)
+
+    @router.message(Command('progress'))
+    async def progress(message):
+        await progress_command(message, message.from_user.id)
+
+    @router.message(Command('feedback'))
+    async def feedback(message):
+        await feedback_command(message, message.from_user.id, user_states)
+
+    @router.message(Command('info'))
+    async def info(message):
+        await info_command(message)
+
+    @router.message(Command('webapp'))
+    async def webapp_command(message):
+        user_id = message.from_user.id
+        if not await get_user(user_id):
+            await message.answer(NO_ACCESS_TEXT)
+            return
+
+        await message.answer(
+            "Нажмите на кнопку ниже, чтобы открыть интерактивное мини-приложение с вашим прогрессом по курсу:",
+            reply_markup=mini_app_markup(user_id)
+        )
+
+    # Homework submission commands
+    for module_id in range(1, len(MODULES) + 1):
+        def create_homework_handler(module_id):
+            @router.message(Command(f"homework{module_id}"))
+            async def homework_submission_handler(message):
+                user_id = message.from_user.id
+                user = await get_user(user_id)
+
+                if not user:
+                    await message.answer(NO_ACCESS_TEXT)
+                    return
+
+                available_modules = MODULE_ACCESS.get(user[4].lower(), [])
+                if module_id not in available_modules:
+                    await message.answer(
+                        f"У вас нет доступа к модулю {module_id}. Обновите ваш тариф для доступа.",
+                        reply_markup=as_markup(get_main_menu_keyboard())
+                    )
+                    return
+
+                await message.answer(
+                    f"Пожалуйста, отправьте ваше решение домашнего задания для модуля {module_id}.\n\n"
+                    f"Вы можете отправить текст, фото или документ. После отправки, "
+                    f"ваша работа будет сохранена и передана куратору для проверки.",
+                    reply_markup=as_markup(get_back_keyboard())
+                )
+
+                await user_states.aset(user_id, BotStates.AWAITING_HOMEWORK_SUBMISSION)
+                await temp_data.aset(user_id, {"module_id": module_id})
+
+        create_homework_handler(module_id)
+
+
+def register_message_handlers(router, user_states, temp_data):
+    # The state filters below run for every text message; the state is read
+    # once here and passed to them as conversation_state
+    @router.message.outer_middleware()
+    async def load_conversation_state(handler, message, data):
+        user = message.from_user
+        state = None if user is None else await user_states.aget(user.id)
+        data['conversation_state'] = state
+        return await handler(message, data)
+
+    @router.message(F.text, lambda message, conversation_state: conversation_state == BotStates.AWAITING_ACCESS_CODE)
+    async def handle_access_code(message):
+        user_id = message.from_user.id
+        access_code = message.text.strip()
+
+        await user_states.apop(user_id)
+
+        # The use of the code and the registration or tariff change are one transaction
+        redeemed = await redeem_access_code(
+            access_code, user_id,
+            message.from_user.username or "",
+            message.from_user.first_name or "",
+            message.from_user.last_name or ""
+        )
+
+        if not redeemed:
+            await message.answer(
+                "❌ Неверный код доступа. Пожалуйста, проверьте код и попробуйте снова или "
+                "свяжитесь с администратором курса.",
+                reply_markup=ReplyKeyboardRemove()
+            )
+            return
+
+        valid_tariff, created = redeemed
+        if created:
+            await message.answer(
+                f"✅ Добро пожаловать в курс! Ваш тариф: *{valid_tariff}*\n\n"
+                f"{TARIFF_DESCRIPTIONS.get(valid_tariff, '')}",
+                parse_mode="Markdown",
+                reply_markup=as_markup(get_main_menu_keyboard())
+            )
+        else:
+            await message.answer(
+                f"✅ Ваш тариф успешно обновлен до *{valid_tariff}*!",
+                parse_mode="Markdown",
+                reply_markup=as_markup(get_main_menu_keyboard())
+            )
+
+    @router.message(F.text, lambda message, conversation_state: conversation_state == BotStates.AWAITING_FEEDBACK)
+    async def handle_feedback(message):
+        user_id = message.from_user.id
+        feedback_text = message.text.strip()
+
+        await temp_data.aset(user_id, {"feedback": feedback_text})
+
+        await message.answer(
+            f"*Ваша обратная связь:*\n\n{feedback_text}\n\nОтправить?",
+            parse_mode="Markdown",
+            reply_markup=as_markup(get_feedback_confirm_keyboard())
+        )
+
+    @router.message(F.text | F.photo | F.document | F.voice,
+                    lambda message, conversation_state: conversation_state == BotStates.AWAITING_HOMEWORK_SUBMISSION)
+    async def handle_homework_submission(message):
+        user_id = message.from_user.id
+        module_id = (await temp_data.aget(user_id, {})).get("module_id")
+
+        if not module_id:
+            await message.answer(
+                "❌ Произошла ошибка. Пожалуйста, попробуйте снова.",
+                reply_markup=as_markup(get_main_menu_keyboard())
+            )
+            await user_states.apop(user_id)
+            await temp_data.apop(user_id)
+            return
+
+        attachment = get_submission_attachment(message)
+        text = (message.text or message.caption or "").strip()
+        if not text and not attachment:
+            await message.answer("Отправьте текст, фото, документ или голосовое сообщение.")
+            return
+
+        # Stores return copies, so write the updated draft back
+        draft = await temp_data.aget(user_id, {})
+        draft["submission"] = text
+        draft["attachment"] = attachment
+        await temp_data.aset(user_id, draft)
+
+        await message.answer(
+            f"*Ваше решение домашнего задания для модуля {module_id}:*\n\n"
+            f"{submission_preview(text, attachment)}\n\nОтправить?",
+            parse_mode="Markdown",
+            reply_markup=as_markup(get_submit_homework_keyboard(module_id))
+        )
+
+    @router.message(F.text == '↩️ Вернуться в главное меню')
+    async def back_to_main_menu(message):
+        user_id = message.from_user.id
+        await user_states.apop(user_id)
+        await temp_data.apop(user_id)
+        await show_main_menu(message, user_id)
+
+    @router.message(F.text)
+    async def handle_text_messages(message):
+        user_id = message.from_user.id
+        text = message.text
+
+        if text == '📚 Модули курса':
+            await modules_list(message, user_id)
+
+        elif text == '📝 Домашние задания':
+            await homework_list(message, user_id)
+
+        elif text == '🔍 Мой прогресс':
+            await progress_command(message, user_id)
+
+        elif text == '📊 Мини-приложение':
+            await message.answer(
+                "Нажмите на кнопку ниже, чтобы открыть интерактивное мини-приложение с вашим прогрессом по курсу:",
+                reply_markup=mini_app_markup(user_id)
+            )
+
+        elif text == '💬 Обратная связь':
+            await feedback_command(message, user_id, user_states)
+
+        elif text == 'ℹ️ Информация':
+            await info_command(message)
+
+        elif text == '📋 Мой тариф':
+            user = await get_user(user_id)
+            if not user:
+                await message.answer(NO_ACCESS_TEXT)
+                return
+
+            tariff = user[4]
+            tariff_description = TARIFF_DESCRIPTIONS.get(tariff.lower(), "")
+            available_modules = MODULE_ACCESS.get(tariff.lower(), [])
+
+            await message.answer(
+                f"*Ваш текущий тариф: {tariff}*\n\n"
+                f"{tariff_description}\n\n"
+                f"*Доступные модули:* {', '.join(map(str, available_modules))}\n\n"
+                f"Для повышения тарифа воспользуйтесь командой /access и введите новый код доступа.",
+                parse_mode="Markdown",
+                reply_markup=as_markup(get_main_menu_keyboard())
+            )
+
+        else:
+            await message.answer(
+                "Я не понимаю эту команду. Пожалуйста, используйте меню для навигации.",
+                reply_markup=as_markup(get_main_menu_keyboard())
+            )
+
+
+# Callback verbs for the aiogram runtime; same table layout as handlers.py
+callback_router = CallbackRouter()
+
+
+def register_callback_handlers(router, user_states, temp_data, sender=None):
+    @router.callback_query()
+    async def handle_callback_query(call):
+        pending = callback_router.dispatch(call)
+        if pending is not None:
+            await pending
+
+    @callback_router.fallback
+    async def handle_unknown_callback(call):
+        await call.answer(text="Эта кнопка больше не действует. Откройте меню заново: /menu")
+
+    @callback_router.register('locked_module', arg_type=int)
+    async def handle_locked_module(call, module_id):
+        await call.answer(
+            text=f"Модуль {module_id} недоступен на вашем тарифе. Обновите тариф для доступа.",
+            show_alert=True
+        )
+
+    @callback_router.register('locked_homework', arg_type=int)
+    async def handle_locked_homework(call, module_id):
+        await call.answer(
+            text=f"Домашнее задание {module_id} недоступно на вашем тарифе. Обновите тариф для доступа.",
+            show_alert=True
+        )
+
+    @callback_router.register('back_to_main')
+    async def handle_back_to_main(call):
+        await call.message.edit_reply_markup(reply_markup=None)
+        await show_main_menu(call.message, call.from_user.id)
+
+    @callback_router.register('back_to_modules')
+    async def handle_back_to_modules(call):
+        user = await get_user(call.from_user.id)
+        if user:
+            tariff = user[4]
+            available_modules = MODULE_ACCESS.get(tariff.lower(), [])
+            try:
+                await call.message.edit_text(
+                    "*Доступные модули курса:*",
+                    parse_mode="Markdown",
+                    reply_markup=as_markup(get_modules_keyboard(tariff, available_modules))
+                )
+            except Exception as e:
+                logger.warning(f"Ошибка при редактировании сообщения: {str(e)}")
+
+    @callback_router.register('materials', arg_type=int)
+    async def handle_materials(call, module_id):
+        materials = ADDITIONAL_MATERIALS.get(module_id, [])
+        materials_text = f"*Дополнительные материалы для модуля {module_id}:*\n\n"
+        for i, material in enumerate(materials, 1):
+            materials_text += f"{i}. {material}\n"
+
+        try:
+            await call.message.edit_text(
+                materials_text,
+                parse_mode="Markdown",
+                reply_markup=as_markup(get_additional_materials_keyboard(module_id))
+            )
+        except Exception as e:
+            logger.warning(f"Ошибка при редактировании сообщения материалов: {str(e)}")
+
+    @callback_router.register('complete_module', arg_type=int)
+    async def handle_complete_module(call, module_id):
+        if await update_module_progress(call.from_user.id, module_id, True):
+            await call.answer(text=f"Модуль {module_id} отмечен как пройденный! 🎉", show_alert=False)
+        else:
+            await call.answer(text="Произошла ошибка. Пожалуйста, попробуйте позже.", show_alert=True)
+
+    @callback_router.register('submit_homework', arg_type=int)
+    async def handle_submit_homework(call, module_id):
+        user_id = call.from_user.id
+        draft = await temp_data.aget(user_id, {})
+        submission = draft.get("submission", "")
+        attachment = draft.get("attachment")
+
+        if not submission and not attachment:
+            await call.answer(text="Домашнее задание не может быть пустым.", show_alert=True)
+            return
+
+        if await add_homework_submission(
+                user_id, module_id, submission or ATTACHMENT_LABELS[attachment["file_type"]], attachment):
+            await user_states.apop(user_id)
+            await temp_data.apop(user_id)
+            result_text = "✅ Ваше домашнее задание успешно отправлено! Куратор скоро его проверит."
+        else:
+            result_text = "❌ Произошла ошибка при отправке домашнего задания. Пожалуйста, попробуйте позже."
+
+        try:
+            await call.message.edit_text(result_text, reply_markup=None)
+        except Exception as e:
+            logger.warning(f"Ошибка при отправке домашнего задания: {str(e)}")
+        await show_main_menu(call.message, user_id)
+
+    @callback_router.register('cancel_homework', arg_type=int)
+    async def handle_cancel_homework(call, module_id):
+        user_id = call.from_user.id
+        await user_states.apop(user_id)
+        await temp_data.apop(user_id)
+        await call.message.edit_text("❌ Отправка домашнего задания отменена.", reply_markup=None)
+        await show_main_menu(call.message, user_id)
+
+    @callback_router.register('submit_feedback')
+    async def handle_submit_feedback(call):
+        user_id = call.from_user.id
+        feedback_text = (await temp_data.aget(user_id, {})).get("feedback", "")
+
+        if not feedback_text:
+            await call.answer(text="Обратная связь не может быть пустой.", show_alert=True)
+            return
+
+        if await add_feedback(user_id, feedback_text):
+            await user_states.apop(user_id)
+            await temp_data.apop(user_id)
+            try:
+                await call.message.edit_text(
+                    "✅ Ваша обратная связь успешно отправлена! Спасибо за ваш отзыв.",
+                    reply_markup=None
+                )
+            except Exception as e:
+                logger.warning(f"Ошибка при отправке сообщения об успешном отзыве: {str(e)}")
+
+            # Notify admins about new feedback: queued in the NOTIFY lane,
+            # the user's confirmation does not wait for it
+            if sender is not None:
+                notify_admins(
+                    sender,
+                    f"*Новая обратная связь от пользователя {user_id}:*\n\n{feedback_text}",
+                    parse_mode="Markdown"
+                )
+            else:
+                logger.warning(f"No outbound sender, admins not notified about feedback from {user_id}")
+        else:
+            try:
+                await call.message.edit_text(
+                    "❌ Произошла ошибка при отправке обратной связи. Пожалуйста, попробуйте позже.",
+                    reply_markup=None
+                )
+            except Exception as e:
+                logger.warning(f"Ошибка при отправке сообщения об ошибке отзыва: {str(e)}")
+        await show_main_menu(call.message, user_id)
+
+    @callback_router.register('cancel_feedback')
+    async def handle_cancel_feedback(call):
+        user_id = call.from_user.id
+        await user_states.apop(user_id)
+        await temp_data.apop(user_id)
+        await call.message.edit_text("❌ Отправка обратной связи отменена.", reply_markup=None)
+        await show_main_menu(call.message, user_id)
+
+    @callback_router.register('enter_access_code')
+    async def handle_enter_access_code(call):
+        await call.message.answer("Пожалуйста, введите код доступа:", reply_markup=ReplyKeyboardRemove())
+        await user_states.aset(call.from_user.id, BotStates.AWAITING_ACCESS_CODE)
+
+    @callback_router.register('module', arg_type=int)
+    async def handle_module_selection(call, module_id):
+        user = await get_user(call.from_user.id)
+
+        if not user:
+            await call.answer(text="У вас нет доступа к курсу. Пожалуйста, введите код доступа.", show_alert=True)
+            return
+
+        available_modules = MODULE_ACCESS.get(user[4].lower(), [])
+        if module_id not in available_modules:
+            await call.answer(
+                text=f"Модуль {module_id} недоступен на вашем тарифе. Обновите тариф для доступа.",
+                show_alert=True
+            )
+            return
+
+        await schedule_module_reminder(call.from_user.id, module_id)
+
+        module_title = MODULES.get(module_id, f"Модуль {module_id}")
+        module_description = MODULE_DESCRIPTIONS.get(module_id, "Описание отсутствует")
+
+        try:
+            await call.message.edit_text(
+                f"*{module_title}*\n\n{module_description}",
+                parse_mode="Markdown",
+                reply_markup=as_markup(get_module_content_keyboard(module_id))
+            )
+        except Exception as e:
+            logger.warning(f"Ошибка при отображении модуля: {str(e)}")
+
+    @callback_router.register('homework', arg_type=int)
+    async def handle_homework_selection(call, module_id):
+        user_id = call.from_user.id
+        user = await get_user(user_id)
+
+        if not user:
+            await call.answer(text="У вас нет доступа к курсу. Пожалуйста, введите код доступа.", show_alert=True)
+            return
+
+        available_modules = MODULE_ACCESS.get(user[4].lower(), [])
+        if module_id not in available_modules:
+            await call.answer(
+                text=f"Домашнее задание {module_id} недоступно на вашем тарифе. Обновите тариф для доступа.",
+                show_alert=True
+            )
+            return
+
+        homework_text = HOMEWORK.get(module_id, "Домашнее задание отсутствует")
+        submissions = await get_homework_submissions(user_id, module_id)
+
+        submission_text = ""
+        if submissions:
+            submission_text = "\n\n*Ваши отправленные решения:*\n"
+            for idx, submission in enumerate(submissions[:3], 1):
+                submission_date = submission[4][:16] if submission[4] else "Неизвестно"
+                submission_text += f"{idx}. Отправлено: {submission_date}\n"
+
+            if len(submissions) > 3:
+                submission_text += f"(и еще {len(submissions) - 3} отправленных решений)"
+
+        try:
+            await call.message.edit_text(
+                f"{homework_text}{submission_text}",
+                parse_mode="Markdown",
+                reply_markup=as_markup(get_back_to_modules_keyboard())
+            )
+        except Exception as e:
+            logger.warning(f"Ошибка при отображении домашнего задания: {str(e)}")
+
+
+def register_admin_handlers(router, user_states, temp_data, sender=None, broadcaster=None):
+    @router.message(Command('admin'), lambda message: message.from_user.id in ADMIN_IDS)
+    async def admin_command(message):
+        admin_text = (
+            "*Админ-панель*\n\n"
+            "Доступные команды:\n"
+            "/users - показать список пользователей\n"
+            "/feedback - показать отзывы\n"
+            "/broadcast - отправить сообщение всем пользователям\n"
+            "/broadcast_cancel - остановить рассылку\n"
+            "/outbound - статистика отправки сообщений\n"
+            "/adduser - добавить пользователя\n"
+            "/updatetariff - обновить тариф пользователя"
+        )
+        await message.answer(admin_text, parse_mode="Markdown")
+
+    @router.message(Command('outbound'), lambda message: message.from_user.id in ADMIN_IDS)
+    async def outbound_command(message):
+        if sender is None:
+            return
+        stats = sender.outbound_stats()
+        lanes = "\n".join(
+            f"{name}: в очереди {lane['queued']}, ожидание {lane['wait_avg_ms']} мс (макс. {lane['wait_max_ms']} мс)"
+            for name, lane in stats['lanes'].items()
+        )
+        await message.answer(
+            f"Отправлено: {stats['sent']}\n"
+            f"Ошибок: {stats['failed']}\n"
+            f"Ограничений 429: {stats['rate_limited']}\n\n{lanes}"
+        )
+
+    @router.message(Command('broadcast'), lambda message: message.from_user.id in ADMIN_IDS)
+    async def broadcast_command(message):
+        parsed = parse_broadcast_command(message.text)
+        if not parsed or broadcaster is None:
+            await message.answer(BROADCAST_USAGE)
+            return
+
+        options, text = parsed
+        broadcast_id = await create_broadcast(message.from_user.id, text, **options)
+        if not broadcast_id:
+            await message.answer("❌ Не удалось создать рассылку.")
+            return
+
+        await asyncio.to_thread(broadcaster.start, broadcast_id)
+        await message.answer(
+            f"📣 Рассылка #{broadcast_id} запущена. Отчет о ходе придет по мере отправки.\n"
+            f"Остановить: /broadcast_cancel {broadcast_id}"
+        )
+
+    @router.message(Command('broadcast_cancel'), lambda message: message.from_user.id in ADMIN_IDS)
+    async def broadcast_cancel_command(message):
+        parts = message.text.split()
+        if len(parts) != 2 or not parts[1].isdigit():
+            await message.answer(BROADCAST_USAGE)
+            return
+
+        if await finish_broadcast(int(parts[1]), 'cancelled'):
+            await message.answer(f"Рассылка #{parts[1]} остановлена.")
+        else:
+            await message.answer(f"Рассылка #{parts[1]} не найдена или уже завершена.")
+
+
+# Helper functions shared by commands and menu buttons
+async def show_main_menu(message, user_id):
+    if await get_user(user_id):
+        await message.answer("Выберите действие:", reply_markup=as_markup(get_main_menu_keyboard()))
+    else:
+        await message.answer(NO_ACCESS_TEXT, reply_markup=as_markup(get_access_keyboard()))
+
+
+async def modules_list(message, user_id):
+    user = await get_user(user_id)
+    if not user:
+        await message.answer(NO_ACCESS_TEXT)
+        return
+
+    tariff = user[4]
+    available_modules = MODULE_ACCESS.get(tariff.lower(), [])
+    await message.answer(
+        "*Доступные модули курса:*",
+        parse_mode="Markdown",
+        reply_markup=as_markup(get_modules_keyboard(tariff, available_modules))
+    )
+
+
+async def homework_list(message, user_id):
+    user = await get_user(user_id)
+    if not user:
+        await message.answer(NO_ACCESS_TEXT)
+        return
+
+    tariff = user[4]
+    available_modules = MODULE_ACCESS.get(tariff.lower(), [])
+    await message.answer(
+        "*Домашние задания:*",
+        parse_mode="Markdown",
+        reply_markup=as_markup(get_homework_keyboard(tariff, available_modules))
+    )
+
+
+async def progress_command(message, user_id):
+    user = await get_user(user_id)
+    if not user:
+        await message.answer(NO_ACCESS_TEXT)
+        return
+
+    available_modules = MODULE_ACCESS.get(user[4].lower(), [])
+    progress = await get_module_progress(user_id)
+    completed_modules = [module_id for module_id, completed in progress if completed]
+
+    progress_text = "*Ваш прогресс по курсу:*\n\n"
+    for module_id in available_modules:
+        module_name = MODULES.get(module_id, f"Модуль {module_id}")
+        status = "✅" if module_id in completed_modules else "⏳"
+        progress_text += f"{status} Модуль {module_id}: {module_name}\n"
+
+    completed_percentage = 0
+    if available_modules:
+        completed_percentage = (len(completed_modules) / len(available_modules)) * 100
+    progress_text += f"\n*Общий прогресс: {completed_percentage:.1f}%*"
+
+    await message.answer(progress_text, parse_mode="Markdown", reply_markup=as_markup(get_main_menu_keyboard()))
+
+
+async def feedback_command(message, user_id, user_states):
+    if not await get_user(user_id):
+        await message.answer(NO_ACCESS_TEXT)
+        return
+
+    await message.answer(
+        "Пожалуйста, напишите вашу обратную связь или вопрос. Мы ответим вам в ближайшее время:",
+        reply_markup=as_markup(get_back_keyboard())
+    )
+    await user_states.aset(user_id, BotStates.AWAITING_FEEDBACK)
+
+
+async def info_command(message):
+    info_text = (
+        "*О курсе трансформации*\n\n"
+        "Этот курс создан для глубокой личностной трансформации и раскрытия вашего потенциала. "
+        "Он состоит из 8 модулей, каждый из которых раскрывает определенный аспект вашей личности "
+        "и помогает в процессе изменений.\n\n"
+
+        "*Структура курса:*\n"
+        "• 8 модулей с теоретическими материалами\n"
+        "• Практические задания для самостоятельной работы\n"
+        "• Домашние задания для закрепления результатов\n"
+        "• Дополнительные материалы для углубления знаний\n\n"
+
+        "*Доступные тарифы:*\n"
+        "• Базовый: доступ к модулям 1-3\n"
+        "• Стандартный: доступ к модулям 1-5\n"
+        "• Премиум: доступ ко всем модулям\n"
+        "• Переход: полный доступ со всеми материалами и персональной поддержкой\n\n"
+
+        "Для получения дополнительной информации свяжитесь с нами через раздел 'Обратная связь'."
+    )
+    await message.answer(info_text, parse_mode="Markdown", reply_markup=as_markup(get_main_menu_keyboard()))
+
+
+class ThreadSafeBot:
+    """Blocking send_message for worker threads, run on the bot's event loop.
+
+    Lets the thread-based OutboundScheduler, BroadcastRunner, outbox and job
+    workers send through the aiogram Bot.
+    """
+
+    def __init__(self, bot, loop, timeout=60):
+        self.bot = bot
+        self.loop = loop
+        self.timeout = timeout
+
+    def send_message(self, chat_id, text, **kwargs):
+        coroutine = self.bot.send_message(chat_id, text, **kwargs)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout=self.timeout)
+
+
+def create_dispatcher(sender=None, broadcaster=None):
+    dp = Dispatcher()
+    router = Router(name='course_bot')
+
+    # Commands (including /admin) are matched before the catch-all text handler
+    register_command_handlers(router, user_states, temp_data)
+    register_admin_handlers(router, user_states, temp_data, sender, broadcaster)
+    register_message_handlers(router, user_states, temp_data)
+    register_callback_handlers(router, user_states, temp_data, sender)
+
+    dp.include_router(router)
+    return dp
+
+
+async def run_polling():
+    bot = Bot(TOKEN)
+    loop = asyncio.get_running_loop()
+
+    # Background sends (notifications, reminders, broadcasts) share one
+    # rate-limited scheduler, as in bot.py; replies to the user are sent
+    # directly by the handlers
+    outbound = OutboundScheduler(
+        global_rate=OUTBOUND_GLOBAL_RATE,
+        chat_rate=OUTBOUND_CHAT_RATE,
+        workers=OUTBOUND_WORKERS
+    )
+    sender = RateLimitedBot(ThreadSafeBot(bot, loop), outbound)
+    broadcaster = BroadcastRunner(sender)
+    dp = create_dispatcher(sender, broadcaster)
+
+    outbox_worker = OutboxWorker(
+        lambda chat_id, text: sender.lane(NOTIFY).send_message(chat_id, text),
+        get_db_connection,
+        batch_size=OUTBOX_BATCH_SIZE,
+        poll_interval=OUTBOX_POLL_INTERVAL,
+        max_attempts=OUTBOX_MAX_ATTEMPTS
+    )
+    job_scheduler = JobScheduler(
+        sender.lane(BULK, wait=False).send_message,
+        batch_size=JOBS_BATCH_SIZE,
+        poll_interval=JOBS_POLL_INTERVAL
+    )
+
+    def resolve_file_url(file_id):
+        file = asyncio.run_coroutine_threadsafe(bot.get_file(file_id), loop).result(timeout=60)
+        return bot.session.api.file_url(bot.token, file.file_path)
+
+    media_downloader = MediaDownloader(
+        resolve_file_url,
+        get_db_connection,
+        MEDIA_ROOT,
+        workers=MEDIA_DOWNLOAD_WORKERS,
+        poll_interval=MEDIA_POLL_INTERVAL,
+        max_bytes=MEDIA_MAX_BYTES
+    )
+    try:
+        await bot.delete_webhook()
+        outbox_worker.start()
+        job_scheduler.start()
+        media_downloader.start()
+        broadcaster.start_resuming()
+        logger.info("Starting aiogram bot...")
+        await dp.start_polling(bot)
+    finally:
+        await asyncio.to_thread(outbox_worker.stop)
+        await asyncio.to_thread(job_scheduler.stop)
+        await asyncio.to_thread(media_downloader.stop)
+        await asyncio.to_thread(broadcaster.stop)
+        await asyncio.to_thread(outbound.shutdown)
+        await bot.session.close()
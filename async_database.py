@@ -0,0 +1,70 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import database
+from config import DB_POOL_SIZE
+
+# SQLite has no async driver in our dependencies, so blocking calls run on a
+# small executor sized to the connection pool. Telegram API calls stay on the
+# event loop; only the short database calls leave it.
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix='db')
+
+
+async def _run(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+# User-related database operations
+async def get_user(user_id):
+    # Cache hits are served without leaving the event loop
+    user = database.user_cache.get(user_id)
+    if user is not None:
+        return user
+    return await _run(database.get_user, user_id)
+
+async def add_user(user_id, username, first_name, last_name, tariff):
+    return await _run(database.add_user, user_id, username, first_name, last_name, tariff)
+
+async def update_user_tariff(user_id, tariff):
+    return await _run(database.update_user_tariff, user_id, tariff)
+
+async def unblock_user(user_id):
+    return await _run(database.unblock_user, user_id)
+
+# Feedback-related database operations
+async def add_feedback(user_id, message):
+    return await _run(database.add_feedback, user_id, message)
+
+# Module progress database operations
+async def update_module_progress(user_id, module_id, completed=True):
+    return await _run(database.update_module_progress, user_id, module_id, completed)
+
+async def get_module_progress(user_id):
+    return await _run(database.get_module_progress, user_id)
+
+async def schedule_module_reminder(user_id, module_id):
+    return await _run(database.schedule_module_reminder, user_id, module_id)
+
+# Homework submission database operations
+async def add_homework_submission(user_id, module_id, submission, attachment=None):
+    return await _run(database.add_homework_submission, user_id, module_id, submission, attachment)
+
+async def get_homework_submissions(user_id, module_id=None):
+    return await _run(database.get_homework_submissions, user_id, module_id)
+
+# Access code database operations
+async def redeem_access_code(code, user_id, username='', first_name='', last_name=''):
+    return await _run(database.redeem_access_code, code, user_id, username, first_name, last_name)
+
+
+# Broadcasts
+async def create_broadcast(admin_id, text, tariff=None, min_completed=None, max_completed=None):
+    return await _run(database.create_broadcast, admin_id, text, tariff, min_completed, max_completed)
+
+async def finish_broadcast(broadcast_id, status='done'):
+    return await _run(database.finish_broadcast, broadcast_id, status)
+
+
+def shutdown():
+    _executor.shutdown(wait=True)
@@ -0,0 +1,87 @@
+"""Dispatch cost per button press: CallbackRouter vs. the old startswith chain.
+
+"router" is the steady state (the press was seen before and is memoised),
+"cold" resolves every press from scratch (cache_size=0).
+
+Run from the repository root:
+
+    python benchmarks/callback_router_bench.py
+"""
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from callback_router import CallbackRouter
+
+PRESSES = [
+    'module_3', 'locked_module_7', 'homework_2', 'locked_homework_8',
+    'back_to_main', 'back_to_modules', 'materials_4', 'complete_module_5',
+    'submit_homework_1', 'cancel_homework_1', 'submit_feedback',
+    'cancel_feedback', 'enter_access_code'
+]
+
+
+def noop(call, *args):
+    pass
+
+
+def chain_dispatch(call):
+    # The if/elif chain handle_callback_query used before the router
+    callback_data = call.data
+    if callback_data.startswith('module_'):
+        noop(call, int(callback_data.split('_')[1]))
+    elif callback_data.startswith('locked_module_'):
+        noop(call, int(callback_data.split('_')[2]))
+    elif callback_data.startswith('homework_'):
+        noop(call, int(callback_data.split('_')[1]))
+    elif callback_data.startswith('locked_homework_'):
+        noop(call, int(callback_data.split('_')[2]))
+    elif callback_data == 'back_to_main':
+        noop(call)
+    elif callback_data == 'back_to_modules':
+        noop(call)
+    elif callback_data.startswith('materials_'):
+        noop(call, int(callback_data.split('_')[1]))
+    elif callback_data.startswith('complete_module_'):
+        noop(call, int(callback_data.split('_')[2]))
+    elif callback_data.startswith('submit_homework_'):
+        noop(call, int(callback_data.split('_')[2]))
+    elif callback_data.startswith('cancel_homework_'):
+        noop(call)
+    elif callback_data == 'submit_feedback':
+        noop(call)
+    elif callback_data == 'cancel_feedback':
+        noop(call)
+    elif callback_data == 'enter_access_code':
+        noop(call)
+
+
+def build_router(cache_size=4096):
+    router = CallbackRouter(cache_size)
+    for verb in ('module', 'locked_module', 'homework', 'locked_homework', 'materials',
+                 'complete_module', 'submit_homework', 'cancel_homework'):
+        router.register(verb, noop, arg_type=int)
+    for verb in ('back_to_main', 'back_to_modules', 'submit_feedback',
+                 'cancel_feedback', 'enter_access_code'):
+        router.register(verb, noop)
+    return router
+
+
+def main(number=200000):
+    router = build_router()
+    cold_router = build_router(cache_size=0)
+    calls = [SimpleNamespace(data=data) for data in PRESSES]
+
+    print(f"{'callback_data':<20} {'chain ns':>10} {'router ns':>10} {'cold ns':>10}")
+    for call in calls:
+        chain = timeit.timeit(lambda: chain_dispatch(call), number=number) / number * 1e9
+        routed = timeit.timeit(lambda: router.dispatch(call), number=number) / number * 1e9
+        cold = timeit.timeit(lambda: cold_router.dispatch(call), number=number) / number * 1e9
+        print(f"{call.data:<20} {chain:>10.0f} {routed:>10.0f} {cold:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,32 @@ import logging
 import os
 import telebot
 from telebot import types
-from config import TOKEN, ACCESS_CODES, TARIFF_DESCRIPTIONS, MODULE_ACCESS, ADMIN_IDS
-from database import get_user, add_user, update_user_tariff
+from config import (
+    TOKEN, ACCESS_CODES, TARIFF_DESCRIPTIONS, MODULE_ACCESS, ADMIN_IDS,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    BOT_DISPATCH_MODE, BOT_WORKERS, BOT_WORKER_QUEUE_SIZE,
+    UPDATE_QUEUE_BATCH_SIZE, UPDATE_QUEUE_POLL_INTERVAL,
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS,
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_WORKERS,
+    JOBS_BATCH_SIZE, JOBS_POLL_INTERVAL,
+    MEDIA_ROOT, MEDIA_DOWNLOAD_WORKERS, MEDIA_POLL_INTERVAL, MEDIA_MAX_BYTES
+)
+from database import get_user, add_user, update_user_tariff, get_db_connection
+from dispatcher import OrderedTeleBot
+from outbox import OutboxWorker
+from update_queue import UpdateQueueWorker
+from outbound import OutboundScheduler, RateLimitedBot, NOTIFY, BULK
+from broadcast import BroadcastRunner
+from jobs import JobScheduler
+from media import MediaDownloader
+from state_store import create_state_store
 import handlers
 
 # Initialize the bot
-bot = telebot.TeleBot(TOKEN)
+if BOT_DISPATCH_MODE == 'ordered':
+    bot = OrderedTeleBot(TOKEN, num_workers=BOT_WORKERS, queue_size=BOT_WORKER_QUEUE_SIZE)
+else:
+    bot = telebot.TeleBot(TOKEN)
 
 # Configure logging
 logging.basicConfig(
@@ -32,15 +52,110 @@ class BotStates:
     AWAITING_HOMEWORK_SUBMISSION = 'awaiting_homework_submission'
     CURRENT_MODULE = 'current_module'  # Stores the current module ID for context
 
-# Initialize state storage
-user_states = {}
-temp_data = {}  # For storing temporary user data during conversations
+# Initialize state storage (in-memory or SQLite, see STATE_STORE)
+user_states = create_state_store('user_states')
+temp_data = create_state_store('temp_data')  # For storing temporary user data during conversations
+
+# Outgoing messages go through one rate-limited scheduler; handlers get a
+# proxy that sends in the interactive lane
+outbound = OutboundScheduler(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    chat_rate=OUTBOUND_CHAT_RATE,
+    workers=OUTBOUND_WORKERS
+)
+sender = RateLimitedBot(bot, outbound)
+
+# /broadcast jobs, checkpointed in the broadcasts table
+broadcaster = BroadcastRunner(sender)
 
 # Register all handlers
-register_command_handlers(bot, user_states, temp_data)
-register_message_handlers(bot, user_states, temp_data)
-register_callback_handlers(bot, user_states, temp_data)
-register_admin_handlers(bot, user_states, temp_data)
-register_state_handlers(bot, user_states, temp_data)
+register_command_handlers(sender, user_states, temp_data)
+register_message_handlers(sender, user_states, temp_data)
+register_callback_handlers(sender, user_states, temp_data)
+register_admin_handlers(sender, user_states, temp_data, broadcaster)
+register_state_handlers(sender, user_states, temp_data)
 
 logger.info("Bot initialized successfully")
+
+# Webhook mode: handles the updates the web workers queued
+update_worker = UpdateQueueWorker(
+    lambda payloads: bot.process_new_updates(
+        [update for update in map(types.Update.de_json, payloads) if update]
+    ),
+    get_db_connection,
+    batch_size=UPDATE_QUEUE_BATCH_SIZE,
+    poll_interval=UPDATE_QUEUE_POLL_INTERVAL
+)
+
+# Delivers notifications queued by the admin web app (curator feedback)
+outbox_worker = OutboxWorker(
+    lambda chat_id, text: sender.lane(NOTIFY).send_message(chat_id, text),
+    get_db_connection,
+    batch_size=OUTBOX_BATCH_SIZE,
+    poll_interval=OUTBOX_POLL_INTERVAL,
+    max_attempts=OUTBOX_MAX_ATTEMPTS
+)
+
+# Reminders and maintenance from the jobs table; reminders go out in the
+# bulk lane so they never hold up replies or notifications
+job_scheduler = JobScheduler(
+    sender.lane(BULK, wait=False).send_message,
+    batch_size=JOBS_BATCH_SIZE,
+    poll_interval=JOBS_POLL_INTERVAL
+)
+
+# Downloads homework photos/documents/voice messages after submission
+media_downloader = MediaDownloader(
+    bot.get_file_url,
+    get_db_connection,
+    MEDIA_ROOT,
+    workers=MEDIA_DOWNLOAD_WORKERS,
+    poll_interval=MEDIA_POLL_INTERVAL,
+    max_bytes=MEDIA_MAX_BYTES
+)
+
+
+_workers_pid = None
+
+
+def start_background_workers():
+    """Start outbox delivery, scheduled jobs, media downloads and the
+    resuming of interrupted broadcasts, once per process.
+
+    Only the process that sends for the bot calls this: main.py, in both
+    polling and webhook mode.
+    """
+    global _workers_pid
+    if _workers_pid == os.getpid():
+        return
+    _workers_pid = os.getpid()
+    outbox_worker.start()
+    job_scheduler.start()
+    media_downloader.start()
+    broadcaster.start_resuming()
+
+
+def setup_webhook():
+    """Point Telegram at the Flask webhook route instead of long polling."""
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_URL and WEBHOOK_SECRET must be set in webhook mode")
+
+    bot.remove_webhook()
+    bot.set_webhook(
+        url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET
+    )
+    logger.info(f"Webhook set to {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+
+
+def shutdown_bot():
+    """Finish processing updates that were already accepted."""
+    update_worker.stop()
+    outbox_worker.stop()
+    job_scheduler.stop()
+    media_downloader.stop()
+    # Releases broadcast leases so the next process resumes them at once
+    broadcaster.stop()
+    if isinstance(bot, OrderedTeleBot):
+        bot.dispatcher.shutdown()
+    outbound.shutdown()
@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import wait
+from database import (
+    get_broadcast, get_running_broadcast_ids, claim_broadcast, release_broadcast,
+    get_broadcast_recipients, checkpoint_broadcast, finish_broadcast
+)
+from outbound import BULK, NOTIFY
+from outbox import is_blocked_error
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastRunner:
+    """Runs broadcasts in background threads through the bulk lane.
+
+    Recipients are read in batches in user_id order. A batch is queued on
+    the rate-limited sender at once, and when every message of it has an
+    outcome the checkpoint and counters are written in one transaction, so
+    a restart resumes after the last finished batch (at most one batch is
+    sent twice). Users who blocked the bot are marked and skipped from then
+    on. The admin gets a progress report every ``report_interval`` seconds
+    and a summary at the end.
+
+    ``start_resuming()`` looks for running broadcasts every
+    ``resume_interval`` seconds, so one left behind by a crashed process
+    is picked up once its lease expires. ``stop()`` ends the running
+    broadcasts after their current batch and releases their leases, so
+    after a clean restart they resume right away.
+    """
+
+    def __init__(self, sender, batch_size=100, lease_seconds=120, report_interval=60,
+                 resume_interval=60):
+        self.sender = sender
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.report_interval = report_interval
+        self.resume_interval = resume_interval
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._resume_thread = None
+        self._pid = None
+
+    @property
+    def owner(self):
+        # Per process, so forked gunicorn workers hold separate leases
+        return f"{os.uname().nodename}-{os.getpid()}"
+
+    def start(self, broadcast_id):
+        """Run a broadcast unless this or another process already does."""
+        with self._lock:
+            if self._stop.is_set():
+                return False
+            thread = self._threads.get(broadcast_id)
+            if thread is not None and thread.is_alive():
+                return False
+            if not claim_broadcast(broadcast_id, self.owner, self.lease_seconds):
+                return False
+            thread = threading.Thread(target=self._run, args=(broadcast_id,),
+                                      name=f'broadcast-{broadcast_id}', daemon=True)
+            self._pid = os.getpid()
+            self._threads[broadcast_id] = thread
+            thread.start()
+            return True
+
+    def resume(self):
+        """Pick up running broadcasts that no live process holds."""
+        for broadcast_id in get_running_broadcast_ids():
+            if self.start(broadcast_id):
+                logger.info(f"Resumed broadcast {broadcast_id}")
+
+    def start_resuming(self):
+        if (self._resume_thread is not None and self._resume_thread.is_alive()
+                and self._pid == os.getpid()):
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._resume_thread = threading.Thread(target=self._resume_loop, name='broadcast-resume',
+                                               daemon=True)
+        self._resume_thread.start()
+
+    def stop(self, timeout=30):
+        """Stop resuming and let running broadcasts finish their batch and
+        release their leases."""
+        self._stop.set()
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            threads = list(self._threads.values())
+        if self._resume_thread is not None:
+            threads.append(self._resume_thread)
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+    def _resume_loop(self):
+        while not self._stop.is_set():
+            self.resume()
+            self._stop.wait(self.resume_interval)
+
+    def _report(self, admin_id, text):
+        self.sender.lane(NOTIFY, wait=False).send_message(admin_id, text)
+
+    def _run(self, broadcast_id):
+        broadcast = get_broadcast(broadcast_id)
+        if broadcast is None:
+            return
+        admin_id, text = broadcast[1], broadcast[2]
+        last_user_id = broadcast[7]
+        started = time.monotonic()
+        last_report = started
+        sent_here = 0
+        bulk = self.sender.lane(BULK, wait=False)
+
+        while True:
+            if self._stop.is_set():
+                release_broadcast(broadcast_id, self.owner)
+                logger.info(f"Broadcast {broadcast_id} paused for shutdown")
+                return
+
+            # Also notices /broadcast_cancel from any process
+            if not claim_broadcast(broadcast_id, self.owner, self.lease_seconds):
+                logger.info(f"Broadcast {broadcast_id} stopped")
+                return
+
+            recipients = get_broadcast_recipients(broadcast, last_user_id, self.batch_size)
+            if recipients is None:
+                self._stop.wait(5)
+                continue
+            if not recipients:
+                break
+
+            futures = [bulk.send_message(user_id, text) for user_id in recipients]
+            wait(futures)
+
+            sent = failed = 0
+            blocked = []
+            for user_id, future in zip(recipients, futures):
+                error = future.exception()
+                if error is None:
+                    sent += 1
+                elif is_blocked_error(error):
+                    blocked.append(user_id)
+                else:
+                    failed += 1
+                    logger.warning(f"Broadcast {broadcast_id} to {user_id} failed: {error}")
+
+            last_user_id = recipients[-1]
+            while not checkpoint_broadcast(broadcast_id, last_user_id, sent, failed, blocked):
+                time.sleep(1)
+            sent_here += sent
+
+            if time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                self._report(admin_id, self._summary(broadcast_id, "Рассылка идет", started, sent_here))
+
+        finish_broadcast(broadcast_id)
+        self._report(admin_id, self._summary(broadcast_id, "Рассылка завершена", started, sent_here))
+
+    def _summary(self, broadcast_id, title, started, sent_here):
+        broadcast = get_broadcast(broadcast_id)
+        elapsed = time.monotonic() - started
+        rate = sent_here / elapsed if elapsed else 0
+        return (
+            f"{title} #{broadcast_id}\n\n"
+            f"Доставлено: {broadcast[8]}\n"
+            f"Ошибок: {broadcast[9]}\n"
+            f"Заблокировали бота: {broadcast[10]}\n"
+            f"Скорость: {rate:.1f} сообщ./с за {elapsed:.0f} с"
+        )
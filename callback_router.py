@@ -0,0 +1,82 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackRouter:
+    """Dispatch table for inline keyboard callbacks.
+
+    callback_data is either a bare verb (``back_to_main``) or a verb and one
+    argument joined by an underscore (``module_3``, ``complete_module_3``).
+    A press is resolved with at most two dict lookups: the full data as a
+    bare verb, then the part before the last underscore as a verb taking an
+    argument, which is decoded with the ``arg_type`` given at registration.
+    Registration order does not matter, so ``module_`` and ``locked_module_``
+    can never shadow each other.
+
+    Keyboards only ever produce a few hundred distinct callback_data
+    strings, so resolved presses are memoised (up to ``cache_size``
+    entries) and a repeated press costs a single dict lookup. Data that
+    matches no verb goes to the ``fallback`` handler, which should answer
+    the callback so the client stops its spinner.
+    """
+
+    def __init__(self, cache_size=4096):
+        self._routes = {}
+        self._resolved = {}
+        self.cache_size = cache_size
+        self._fallback = None
+
+    def register(self, verb, handler=None, arg_type=None):
+        """Register ``handler(call)`` or ``handler(call, arg)`` for ``verb``.
+
+        Can be used as a decorator: ``@router.register('module', arg_type=int)``.
+        """
+        if handler is None:
+            def decorator(fn):
+                self.register(verb, fn, arg_type)
+                return fn
+            return decorator
+
+        if verb in self._routes:
+            raise ValueError(f"Callback verb '{verb}' is already registered")
+        self._routes[verb] = (handler, arg_type)
+        self._resolved.clear()
+        return handler
+
+    def fallback(self, handler):
+        """Register ``handler(call)`` for unknown callback data (decorator)."""
+        self._fallback = handler
+        return handler
+
+    def resolve(self, data):
+        """Return ``(handler, args)`` for callback data, or ``(None, ())``."""
+        route = self._routes.get(data)
+        if route is not None and route[1] is None:
+            return route[0], ()
+
+        verb, _, raw = data.rpartition('_')
+        route = self._routes.get(verb)
+        if route is not None and route[1] is not None:
+            try:
+                return route[0], (route[1](raw),)
+            except ValueError:
+                pass
+        return None, ()
+
+    def dispatch(self, call):
+        """Run the handler for ``call.data`` and return its result.
+
+        Async handlers return their coroutine, which the caller awaits.
+        """
+        data = call.data or ''
+        resolved = self._resolved.get(data)
+        if resolved is None:
+            resolved = self.resolve(data)
+            if resolved[0] is None:
+                logger.warning(f"Unknown callback data: {call.data!r}")
+                return self._fallback(call) if self._fallback is not None else None
+            if len(self._resolved) < self.cache_size:
+                self._resolved[data] = resolved
+        handler, args = resolved
+        return handler(call, *args)
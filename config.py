@@ -3,8 +3,44 @@ import os
 # Bot configuration
 TOKEN = os.getenv('BOT_TOKEN')
 
+# Update delivery: 'polling' (main.py long-polls getUpdates) or
+# 'webhook' (Telegram posts updates to the Flask app)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Public base URL of the Flask app, e.g. https://example.com
+WEBHOOK_PATH = '/telegram/webhook'
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token
+
+# Bot runtime: 'telebot' (synchronous pyTelegramBotAPI) or 'aiogram' (asyncio,
+# polling only; see async_bot.py)
+BOT_RUNTIME = os.getenv('BOT_RUNTIME', 'telebot')
+
+# Update processing: 'default' (telebot's thread pool, no ordering) or
+# 'ordered' (sharded worker pool, updates of one user handled in order)
+BOT_DISPATCH_MODE = os.getenv('BOT_DISPATCH_MODE', 'default')
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '8'))
+BOT_WORKER_QUEUE_SIZE = int(os.getenv('BOT_WORKER_QUEUE_SIZE', '1000'))
+
+# Conversation state (user_states / temp_data): 'memory' or 'sqlite'.
+# The SQLite store survives restarts and is shared between bot processes.
+STATE_STORE = os.getenv('STATE_STORE', 'memory')
+STATE_TTL = int(os.getenv('STATE_TTL', '86400'))  # Seconds an abandoned flow is kept
+STATE_MAX_SIZE = int(os.getenv('STATE_MAX_SIZE', '100000'))  # Entries per in-memory store
+STATE_EXPIRY_INTERVAL = int(os.getenv('STATE_EXPIRY_INTERVAL', '300'))
+
 # Database configuration
 DATABASE_URL = 'sqlite:///course_bot.db'
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'course_bot.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))  # Max open connections per process
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # Seconds to wait for a free connection
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+
+# In-process cache for get_user (entries, seconds)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
+# Group commit for submissions, feedback and progress writes
+WRITE_FLUSH_INTERVAL_MS = int(os.getenv('WRITE_FLUSH_INTERVAL_MS', '5'))
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '500'))
 
 # Admin user IDs (for special commands)
 ADMIN_IDS = [
@@ -19,6 +55,68 @@ ACCESS_CODES = {
     'transition': ['transition123', 'transition456']
 }
 
+# Mini-app authentication (seconds)
+MINI_APP_INIT_DATA_MAX_AGE = int(os.getenv('MINI_APP_INIT_DATA_MAX_AGE', '86400'))  # Age of Telegram initData
+MINI_APP_TOKEN_TTL = int(os.getenv('MINI_APP_TOKEN_TTL', '3600'))  # Lifetime of issued API tokens
+
+# Web server (gunicorn.conf.py): gthread workers, one thread per request.
+# With BOT_MODE=webhook the workers only queue updates for main.py, so
+# any number of them can run.
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', '1'))
+WEB_THREADS = int(os.getenv('WEB_THREADS', '64'))
+
+# Live mini-app updates over Server-Sent Events. Every open stream holds a
+# gunicorn thread, so the cap leaves threads for the admin panel, the API
+# and the webhook. Small thread pools still allow one stream.
+SSE_MAX_CONNECTIONS = max(1, min(
+    int(os.getenv('SSE_MAX_CONNECTIONS', str(WEB_THREADS * 3 // 4))),
+    WEB_THREADS - 8
+))  # Open streams per process
+SSE_MAX_PER_USER = int(os.getenv('SSE_MAX_PER_USER', '3'))
+SSE_HEARTBEAT = int(os.getenv('SSE_HEARTBEAT', '25'))  # Seconds between keep-alive comments
+SSE_MAX_DURATION = int(os.getenv('SSE_MAX_DURATION', '600'))  # Streams are closed and re-opened by the client
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv('CHANGE_FEED_POLL_INTERVAL', '1'))  # Picks up other processes' writes
+
+# Mini-app delta sync
+CHANGES_MAX_EVENTS = int(os.getenv('CHANGES_MAX_EVENTS', '200'))  # Beyond this the client reloads in full
+CHANGE_EVENTS_RETENTION_DAYS = int(os.getenv('CHANGE_EVENTS_RETENTION_DAYS', '30'))
+
+# Curator review queue
+REVIEW_LEASE_SECONDS = int(os.getenv('REVIEW_LEASE_SECONDS', '900'))  # How long a claimed submission stays reserved
+
+# Outbound rate limits (Telegram allows ~30 messages/s overall, ~1/s per chat)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', '4'))  # Concurrent Bot API calls
+
+# Webhook updates queued by the web workers for the bot process
+UPDATE_QUEUE_BATCH_SIZE = int(os.getenv('UPDATE_QUEUE_BATCH_SIZE', '100'))
+UPDATE_QUEUE_POLL_INTERVAL = float(os.getenv('UPDATE_QUEUE_POLL_INTERVAL', '0.2'))  # Seconds between checks when idle
+
+# Outbox delivery of notifications queued by the web app
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '2'))  # Seconds between checks when idle
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+
+# Scheduled jobs (reminders, maintenance)
+JOBS_BATCH_SIZE = int(os.getenv('JOBS_BATCH_SIZE', '200'))  # Due jobs claimed per query
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '30'))  # Longest sleep between checks
+MODULE_REMINDER_DAYS = int(os.getenv('MODULE_REMINDER_DAYS', '7'))  # Nudge if an opened module is still not completed
+
+# Homework attachments (photos, documents, voice), stored by content hash
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', 'media')
+MEDIA_DOWNLOAD_WORKERS = int(os.getenv('MEDIA_DOWNLOAD_WORKERS', '2'))  # Concurrent downloads
+MEDIA_POLL_INTERVAL = float(os.getenv('MEDIA_POLL_INTERVAL', '5'))
+MEDIA_MAX_BYTES = int(os.getenv('MEDIA_MAX_BYTES', str(20 * 1024 * 1024)))  # Bot API download limit
+
+# Admin list pagination (rows per page)
+ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', '50'))
+ADMIN_PAGE_SIZE_MAX = int(os.getenv('ADMIN_PAGE_SIZE_MAX', '200'))
+
+# Bulk access code generation
+BULK_CODES_MAX = int(os.getenv('BULK_CODES_MAX', '100000'))  # Codes per request
+BULK_CODES_LENGTH = 10  # Random characters after the prefix
+
 # Tariff descriptions
 TARIFF_DESCRIPTIONS = {
     'basic': 'Базовый тариф: доступ к модулям 1-3',
@@ -1,95 +1,174 @@
+import atexit
+import base64
+import hashlib
+import json
 import logging
+import os
+import queue
+import secrets
 import sqlite3
+import threading
 from contextlib import contextmanager
+from datetime import datetime
+from config import (
+    DATABASE_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_BUSY_TIMEOUT_MS,
+    USER_CACHE_SIZE, USER_CACHE_TTL, WRITE_FLUSH_INTERVAL_MS, WRITE_BATCH_SIZE,
+    BULK_CODES_LENGTH, MODULE_ACCESS,
+    CHANGE_FEED_POLL_INTERVAL, SSE_MAX_CONNECTIONS, SSE_MAX_PER_USER,
+    MODULE_REMINDER_DAYS
+)
+from cache import TTLCache
+from pubsub import ChangeFeed
+from write_queue import WriteQueue
+from migrations import run_migrations
 
 # Create a database connection
-def create_connection():
+def create_connection(database=DATABASE_PATH):
     try:
-        conn = sqlite3.connect('course_bot.db')
+        conn = sqlite3.connect(
+            database,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+        # WAL lets the bot process and the gunicorn workers read while
+        # another process writes instead of fighting over the rollback journal
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous=NORMAL")
         return conn
     except sqlite3.Error as e:
         logging.error(f"Database error: {e}")
         return None
 
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to ``size`` and returned to the pool
+    instead of being closed. The pool is per process: after a fork (gunicorn
+    workers) inherited connections are dropped and new ones are opened.
+    """
+
+    def __init__(self, database=DATABASE_PATH, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+        self._pid = os.getpid()
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            conn = create_connection(self.database)
+            if conn is None:
+                with self._lock:
+                    self._created -= 1
+                raise sqlite3.OperationalError(f"Unable to open database {self.database}")
+            return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logging.warning(f"Discarding broken database connection: {e}")
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+# Shared by the bot handlers and the Flask routes in this process
+db_pool = ConnectionPool()
+atexit.register(db_pool.close_all)
+
 # Context manager for database connection
 @contextmanager
 def get_db_connection():
-    conn = create_connection()
+    conn = db_pool.acquire()
     try:
         yield conn
     finally:
-        if conn:
-            conn.close()
+        db_pool.release(conn)
 
 # Initialize database tables
 def init_db():
-    create_users_table_query = '''
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        username TEXT,
-        first_name TEXT,
-        last_name TEXT,
-        tariff TEXT,
-        registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    '''
-    
-    create_feedback_table_query = '''
-    CREATE TABLE IF NOT EXISTS feedback (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        message TEXT,
-        sent_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (user_id)
-    );
-    '''
-    
-    create_module_progress_table_query = '''
-    CREATE TABLE IF NOT EXISTS module_progress (
-        user_id INTEGER,
-        module_id INTEGER,
-        completed BOOLEAN DEFAULT 0,
-        completion_date TIMESTAMP,
-        PRIMARY KEY (user_id, module_id),
-        FOREIGN KEY (user_id) REFERENCES users (user_id)
-    );
-    '''
-    
-    create_homework_submissions_table_query = '''
-    CREATE TABLE IF NOT EXISTS homework_submissions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        module_id INTEGER,
-        submission TEXT,
-        submitted_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        feedback TEXT,
-        FOREIGN KEY (user_id) REFERENCES users (user_id)
-    );
-    '''
-    
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(create_users_table_query)
-            cursor.execute(create_feedback_table_query)
-            cursor.execute(create_module_progress_table_query)
-            cursor.execute(create_homework_submissions_table_query)
-            conn.commit()
-            logging.info("Database initialized successfully")
+    try:
+        with get_db_connection() as conn:
+            version = run_migrations(conn)
+            logging.info(f"Database initialized successfully (schema version {version})")
     except sqlite3.Error as e:
         logging.error(f"Error initializing database: {e}")
 
+# User rows are read on nearly every update but change only on registration
+# and tariff updates. Writes in this process invalidate the entry; writes made
+# by the other process (bot vs. web) become visible after USER_CACHE_TTL.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def get_user_cache_stats():
+    return user_cache.stats()
+
 # User-related database operations
 def get_user(user_id):
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    # Taken before the read: a write committed after this point invalidates
+    # the entry and bumps the generation, so our possibly stale row is dropped
+    generation = user_cache.generation()
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-            return cursor.fetchone()
+            user = cursor.fetchone()
     except sqlite3.Error as e:
         logging.error(f"Error getting user: {e}")
         return None
 
+    # Unknown users are not cached so a fresh registration is seen immediately
+    if user is not None:
+        user_cache.set(user_id, user, generation)
+    return user
+
 def add_user(user_id, username, first_name, last_name, tariff):
     try:
         with get_db_connection() as conn:
@@ -99,6 +178,7 @@ def add_user(user_id, username, first_name, last_name, tariff):
                 (user_id, username, first_name, last_name, tariff)
             )
             conn.commit()
+            user_cache.invalidate(user_id)
             return True
     except sqlite3.Error as e:
         logging.error(f"Error adding user: {e}")
@@ -112,47 +192,198 @@ def update_user_tariff(user_id, tariff):
                 "UPDATE users SET tariff = ? WHERE user_id = ?",
                 (tariff, user_id)
             )
+            updated = cursor.rowcount > 0
+            if updated:
+                _update_user_summary(cursor, user_id, 'tariff')
             conn.commit()
-            return cursor.rowcount > 0
+            user_cache.invalidate(user_id)
+            change_feed.wake()
+            return updated
     except sqlite3.Error as e:
         logging.error(f"Error updating user tariff: {e}")
         return False
 
-# Feedback-related database operations
-def add_feedback(user_id, message):
+# Live updates: every user-visible change bumps the user's summary version
+# and appends a change_events row in the same transaction. Each process
+# tails that table and pushes the rows to the user's open SSE streams.
+change_feed = ChangeFeed(
+    get_db_connection,
+    poll_interval=CHANGE_FEED_POLL_INTERVAL,
+    max_subscribers=SSE_MAX_CONNECTIONS,
+    max_per_user=SSE_MAX_PER_USER
+)
+
+def _record_change(cursor, user_id, kind, module_id=None, ref_id=None):
+    cursor.execute("INSERT OR IGNORE INTO user_summary (user_id) VALUES (?)", (user_id,))
+    cursor.execute(
+        "UPDATE user_summary SET version = version + 1, updated_at = CURRENT_TIMESTAMP "
+        "WHERE user_id = ?",
+        (user_id,)
+    )
+    cursor.execute(
+        "INSERT INTO change_events (user_id, version, kind, module_id, ref_id) "
+        "SELECT user_id, version, ?, ?, ? FROM user_summary WHERE user_id = ?",
+        (kind, module_id, ref_id, user_id)
+    )
+
+def get_changes_since(user_id, since, limit):
+    """Change events of a user newer than version `since`, oldest first:
+    [(version, kind, module_id, ref_id), ...]
+    """
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO feedback (user_id, message) VALUES (?, ?)",
-                (user_id, message)
+                "SELECT version, kind, module_id, ref_id FROM change_events "
+                "WHERE user_id = ? AND version > ? ORDER BY version LIMIT ?",
+                (user_id, since, limit)
             )
-            conn.commit()
-            return True
+            return cursor.fetchall()
     except sqlite3.Error as e:
-        logging.error(f"Error adding feedback: {e}")
-        return False
+        logging.error(f"Error getting changes: {e}")
+        return None
 
-# Module progress database operations
-def update_module_progress(user_id, module_id, completed=True):
+def get_submission_feedback(submission_ids):
+    """{submission_id: (module_id, feedback)} for the given submissions"""
+    if not submission_ids:
+        return {}
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            if completed:
-                cursor.execute(
-                    "INSERT OR REPLACE INTO module_progress (user_id, module_id, completed, completion_date) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
-                    (user_id, module_id, completed)
-                )
-            else:
-                cursor.execute(
-                    "INSERT OR REPLACE INTO module_progress (user_id, module_id, completed, completion_date) VALUES (?, ?, ?, NULL)",
-                    (user_id, module_id, completed)
-                )
+            placeholders = ', '.join('?' * len(submission_ids))
+            cursor.execute(
+                f"SELECT id, module_id, feedback FROM homework_submissions WHERE id IN ({placeholders})",
+                list(submission_ids)
+            )
+            return {row[0]: row[1:] for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        logging.error(f"Error getting submission feedback: {e}")
+        return {}
+
+def prune_change_events(retention_days):
+    """Delete change events older than retention_days; returns the number removed."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM change_events WHERE created_at < datetime('now', ?)",
+                (f'-{int(retention_days)} days',)
+            )
             conn.commit()
-            return True
+            return cursor.rowcount
     except sqlite3.Error as e:
-        logging.error(f"Error updating module progress: {e}")
-        return False
+        logging.error(f"Error pruning change events: {e}")
+        return 0
+
+# user_summary holds everything the mini-app shows, kept current by the
+# same transaction that changes progress, submissions or the tariff so the
+# API answers with one primary-key read instead of re-aggregating.
+def _update_user_summary(cursor, user_id, kind, module_id=None, completed=None,
+                         submitted=False, ref_id=None):
+    cursor.execute("INSERT OR IGNORE INTO user_summary (user_id) VALUES (?)", (user_id,))
+    cursor.execute(
+        "SELECT s.completed_mask, s.submission_counts, u.tariff "
+        "FROM user_summary s LEFT JOIN users u ON u.user_id = s.user_id WHERE s.user_id = ?",
+        (user_id,)
+    )
+    mask, counts, tariff = cursor.fetchone()
+
+    if completed is not None:
+        bit = 1 << module_id
+        mask = mask | bit if completed else mask & ~bit
+    counts = json.loads(counts)
+    if submitted:
+        counts[str(module_id)] = counts.get(str(module_id), 0) + 1
+
+    completed_count = bin(mask).count('1')
+    available = MODULE_ACCESS.get((tariff or '').lower(), [])
+    percentage = round(completed_count / len(available) * 100) if available else 0
+
+    cursor.execute(
+        "UPDATE user_summary SET completed_mask = ?, completed_count = ?, percentage = ?, "
+        "submission_counts = ?, last_activity = CURRENT_TIMESTAMP WHERE user_id = ?",
+        (mask, completed_count, percentage, json.dumps(counts), user_id)
+    )
+    _record_change(cursor, user_id, kind, module_id, ref_id)
+
+def get_user_summary(user_id):
+    """User row joined with its summary:
+    (user_id, username, first_name, last_name, tariff,
+     completed_mask, completed_count, percentage, submission_counts, last_activity,
+     version, updated_at)
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT u.user_id, u.username, u.first_name, u.last_name, u.tariff, "
+                "COALESCE(s.completed_mask, 0), COALESCE(s.completed_count, 0), "
+                "COALESCE(s.percentage, 0), COALESCE(s.submission_counts, '{}'), s.last_activity, "
+                "COALESCE(s.version, 0), COALESCE(s.updated_at, u.registration_date, '1970-01-01 00:00:00') "
+                "FROM users u LEFT JOIN user_summary s ON s.user_id = u.user_id "
+                "WHERE u.user_id = ?",
+                (user_id,)
+            )
+            return cursor.fetchone()
+    except sqlite3.Error as e:
+        logging.error(f"Error getting user summary: {e}")
+        return None
+
+def get_user_summary_version(user_id):
+    """(version, updated_at) of a user's summary, for conditional requests"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT COALESCE(s.version, 0), COALESCE(s.updated_at, u.registration_date, '1970-01-01 00:00:00') "
+                "FROM users u LEFT JOIN user_summary s ON s.user_id = u.user_id "
+                "WHERE u.user_id = ?",
+                (user_id,)
+            )
+            return cursor.fetchone()
+    except sqlite3.Error as e:
+        logging.error(f"Error getting user summary version: {e}")
+        return None
+
+# Bursts of feedback, progress and homework writes are group-committed by a
+# single background writer. Pass wait=False to return as soon as the write is
+# queued; by default the call blocks until its batch is committed.
+write_queue = WriteQueue(
+    get_db_connection,
+    flush_interval=WRITE_FLUSH_INTERVAL_MS / 1000,
+    max_batch=WRITE_BATCH_SIZE,
+    on_commit=change_feed.wake
+)
+atexit.register(write_queue.shutdown)
+
+# Feedback-related database operations
+def _insert_feedback(cursor, user_id, message):
+    cursor.execute(
+        "INSERT INTO feedback (user_id, message) VALUES (?, ?)",
+        (user_id, message)
+    )
+
+def add_feedback(user_id, message, wait=True):
+    return write_queue.submit(_insert_feedback, user_id, message, wait=wait)
+
+# Module progress database operations
+def _upsert_module_progress(cursor, user_id, module_id, completed):
+    if completed:
+        cursor.execute(
+            "INSERT OR REPLACE INTO module_progress (user_id, module_id, completed, completion_date) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+            (user_id, module_id, completed)
+        )
+    else:
+        cursor.execute(
+            "INSERT OR REPLACE INTO module_progress (user_id, module_id, completed, completion_date) VALUES (?, ?, ?, NULL)",
+            (user_id, module_id, completed)
+        )
+    _update_user_summary(cursor, user_id, 'progress', module_id, completed=bool(completed))
+    if completed:
+        _cancel_job(cursor, _module_reminder_key(user_id, module_id))
+
+def update_module_progress(user_id, module_id, completed=True, wait=True):
+    return write_queue.submit(_upsert_module_progress, user_id, module_id, completed, wait=wait)
 
 def get_module_progress(user_id):
     try:
@@ -168,20 +399,203 @@ def get_module_progress(user_id):
         return []
 
 # Homework submission database operations
-def add_homework_submission(user_id, module_id, submission):
+def _insert_homework_submission(cursor, user_id, module_id, submission, attachment=None):
+    cursor.execute(
+        "INSERT INTO homework_submissions (user_id, module_id, submission) VALUES (?, ?, ?)",
+        (user_id, module_id, submission)
+    )
+    submission_id = cursor.lastrowid
+    if attachment:
+        _insert_submission_file(cursor, submission_id, attachment)
+    _update_user_summary(cursor, user_id, 'submission', module_id, submitted=True,
+                         ref_id=submission_id)
+
+def add_homework_submission(user_id, module_id, submission, attachment=None, wait=True):
+    """Save a submission; `attachment` is the Telegram file of a photo,
+    document or voice submission (see handlers.get_submission_attachment).
+    Only the file_id is stored here, the bot downloads the file later.
+    """
+    return write_queue.submit(_insert_homework_submission, user_id, module_id, submission,
+                              attachment, wait=wait)
+
+def _insert_submission_file(cursor, submission_id, attachment):
+    # A file Telegram already gave us (same file_unique_id) is reused as is
+    cursor.execute(
+        "SELECT sha256 FROM submission_files WHERE file_unique_id = ? AND status = 'stored' LIMIT 1",
+        (attachment['file_unique_id'],)
+    )
+    row = cursor.fetchone()
+    cursor.execute(
+        "INSERT INTO submission_files (submission_id, file_type, file_id, file_unique_id, "
+        "file_name, mime_type, file_size, sha256, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (submission_id, attachment['file_type'], attachment['file_id'], attachment['file_unique_id'],
+         attachment.get('file_name'), attachment.get('mime_type'), attachment.get('file_size'),
+         row[0] if row else None, 'stored' if row else 'pending')
+    )
+
+def get_submission_file(submission_id):
+    """(file_type, file_name, mime_type, file_size, sha256, status) of a
+    submission's attachment, or None"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT file_type, file_name, mime_type, file_size, sha256, status "
+                "FROM submission_files WHERE submission_id = ?",
+                (submission_id,)
+            )
+            return cursor.fetchone()
+    except sqlite3.Error as e:
+        logging.error(f"Error getting submission file: {e}")
+        return None
+
+def enqueue_message(cursor, idempotency_key, chat_id, kind, text):
+    """Append a message to the outbox inside the caller's transaction.
+
+    The bot-side OutboxWorker delivers it; a second enqueue with the same
+    key is ignored.
+    """
+    cursor.execute(
+        "INSERT OR IGNORE INTO outbox (idempotency_key, chat_id, kind, payload) VALUES (?, ?, ?, ?)",
+        (idempotency_key, chat_id, kind, json.dumps({'text': text}, ensure_ascii=False))
+    )
+
+def enqueue_update(update_id, payload):
+    """Store a webhook update for the bot process (UpdateQueueWorker).
+
+    Web workers only ingest; the single bot process handles and sends,
+    so Telegram's rate limits are kept in one place.
+    """
+    try:
+        with get_db_connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO telegram_updates (update_id, payload) VALUES (?, ?)",
+                (update_id, payload)
+            )
+            conn.commit()
+            return True
+    except sqlite3.Error as e:
+        logging.error(f"Error queueing update {update_id}: {e}")
+        return False
+
+def save_submission_feedback(submission_id, feedback, curator, notification=None):
+    """Store the curator's feedback on a submission, release its claim and
+    notify the student's mini-app. `notification` is queued for delivery to
+    the student in the same transaction.
+
+    The save is refused (False) while another curator holds an unexpired
+    claim on the submission, so two reviews cannot overwrite each other."""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO homework_submissions (user_id, module_id, submission) VALUES (?, ?, ?)",
-                (user_id, module_id, submission)
+                "UPDATE homework_submissions SET feedback = ?, reviewed_at = CURRENT_TIMESTAMP, "
+                "claimed_by = NULL, claimed_until = NULL WHERE id = ? "
+                "AND (claimed_by = ? OR claimed_until IS NULL OR claimed_until < datetime('now')) "
+                "RETURNING user_id, module_id",
+                (feedback, submission_id, curator)
             )
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return False
+            _record_change(cursor, row[0], 'feedback', row[1], submission_id)
+            if notification:
+                digest = hashlib.sha256(feedback.encode()).hexdigest()[:16]
+                enqueue_message(cursor, f"submission-feedback:{submission_id}:{digest}",
+                                row[0], 'submission_feedback', notification)
             conn.commit()
+            change_feed.wake()
             return True
     except sqlite3.Error as e:
-        logging.error(f"Error adding homework submission: {e}")
+        logging.error(f"Error saving submission feedback: {e}")
         return False
 
+# Curator review queue. Submissions awaiting feedback are served oldest
+# first from partial indexes; a curator claims one with a lease so that
+# others skip it until the feedback is saved, the claim is released or
+# the lease runs out.
+REVIEW_ORDERS = {
+    'oldest': "submitted_date, id",
+    'module': "module_id, submitted_date, id",
+}
+
+def claim_next_submission(curator, lease_seconds, module_id=None, order='oldest'):
+    """Claim the next unreviewed submission; returns its id or None."""
+    where = ["feedback IS NULL",
+             "(claimed_until IS NULL OR claimed_until < datetime('now') OR claimed_by = ?)"]
+    params = [curator]
+    if module_id:
+        where.append("module_id = ?")
+        params.append(module_id)
+
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # A single UPDATE is atomic, so two curators never get the same row
+            cursor.execute(
+                "UPDATE homework_submissions SET claimed_by = ?, "
+                "claimed_until = datetime('now', ?) "
+                "WHERE id = (SELECT id FROM homework_submissions WHERE "
+                + " AND ".join(where) +
+                f" ORDER BY {REVIEW_ORDERS[order]} LIMIT 1) RETURNING id",
+                [curator, f'+{int(lease_seconds)} seconds'] + params
+            )
+            row = cursor.fetchone()
+            conn.commit()
+            return row[0] if row else None
+    except sqlite3.Error as e:
+        logging.error(f"Error claiming submission: {e}")
+        return None
+
+def release_submission_claim(submission_id, curator):
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE homework_submissions SET claimed_by = NULL, claimed_until = NULL "
+                "WHERE id = ? AND claimed_by = ?",
+                (submission_id, curator)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logging.error(f"Error releasing submission claim: {e}")
+        return False
+
+def get_review_queue_stats():
+    """Queue depth, active claims and the age of the oldest waiting submission,
+    overall and per module"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT module_id, COUNT(*), MIN(submitted_date), "
+                "SUM(claimed_until >= datetime('now')), "
+                "CAST(strftime('%s', 'now') - strftime('%s', MIN(submitted_date)) AS INTEGER) "
+                "FROM homework_submissions WHERE feedback IS NULL "
+                "GROUP BY module_id ORDER BY module_id"
+            )
+            modules = [{
+                'module_id': module_id,
+                'depth': depth,
+                'oldest': oldest,
+                'claimed': claimed or 0,
+                'oldest_age_seconds': age,
+            } for module_id, depth, oldest, claimed, age in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Error getting review queue stats: {e}")
+        return None
+
+    oldest = min(modules, key=lambda m: m['oldest'], default=None)
+    return {
+        'depth': sum(m['depth'] for m in modules),
+        'claimed': sum(m['claimed'] for m in modules),
+        'oldest': oldest['oldest'] if oldest else None,
+        'oldest_age_seconds': oldest['oldest_age_seconds'] if oldest else 0,
+        'modules': modules,
+    }
+
 def get_homework_submissions(user_id, module_id=None):
     try:
         with get_db_connection() as conn:
@@ -201,5 +615,694 @@ def get_homework_submissions(user_id, module_id=None):
         logging.error(f"Error getting homework submissions: {e}")
         return []
 
+# Access code database operations
+def redeem_access_code(code, user_id, username='', first_name='', last_name=''):
+    """Atomically consume one use of a code and give its tariff to the user.
+
+    The use, its row in access_code_redemptions and the user's registration
+    or tariff change are committed together, so a failed registration never
+    uses up the code. Returns (tariff, created), where created is True for a
+    newly registered user, or None if the code does not exist, has expired,
+    has no uses left or the transaction failed.
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "UPDATE access_codes SET uses = uses + 1 "
+                "WHERE code = ? "
+                "AND (max_uses IS NULL OR uses < max_uses) "
+                "AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)",
+                (code,)
+            )
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return None
+
+            cursor.execute("SELECT id, tariff FROM access_codes WHERE code = ?", (code,))
+            code_id, tariff = cursor.fetchone()
+            cursor.execute(
+                "INSERT INTO access_code_redemptions (code_id, user_id, tariff) VALUES (?, ?, ?)",
+                (code_id, user_id, tariff)
+            )
+
+            cursor.execute("UPDATE users SET tariff = ? WHERE user_id = ?", (tariff, user_id))
+            created = cursor.rowcount == 0
+            if created:
+                cursor.execute(
+                    "INSERT INTO users (user_id, username, first_name, last_name, tariff) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, username, first_name, last_name, tariff)
+                )
+            else:
+                _update_user_summary(cursor, user_id, 'tariff')
+            conn.commit()
+            user_cache.invalidate(user_id)
+            change_feed.wake()
+            return tariff, created
+    except sqlite3.Error as e:
+        logging.error(f"Error redeeming access code: {e}")
+        return None
+
+def get_access_code(code):
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, code, tariff, max_uses, uses, expires_at, created_date FROM access_codes WHERE code = ?",
+                (code,)
+            )
+            return cursor.fetchone()
+    except sqlite3.Error as e:
+        logging.error(f"Error getting access code: {e}")
+        return None
+
+def get_access_codes(tariff, limit=200):
+    """Most recently created codes of a tariff."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, code, tariff, max_uses, uses, expires_at, created_date FROM access_codes "
+                "WHERE tariff = ? ORDER BY id DESC LIMIT ?",
+                (tariff, limit)
+            )
+            return cursor.fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Error getting access codes: {e}")
+        return []
+
+# Accepted spellings of an expiry date; a bare date means the start of that day
+EXPIRES_AT_FORMATS = (
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d',
+    '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y',
+)
+
+def normalize_expires_at(value):
+    """Return expires_at as 'YYYY-MM-DD HH:MM:SS' (UTC, like CURRENT_TIMESTAMP).
+
+    Codes are compared with CURRENT_TIMESTAMP as strings, so any other
+    spelling would expire at the wrong time. Empty input means no expiry;
+    anything unparsable raises ValueError.
+    """
+    if value is None or not value.strip():
+        return None
+    for fmt in EXPIRES_AT_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"invalid expiry date: {value!r}")
+
+def add_access_code(code, tariff, max_uses=None, expires_at=None):
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO access_codes (code, tariff, max_uses, expires_at) VALUES (?, ?, ?, ?)",
+                (code, tariff, max_uses, expires_at)
+            )
+            conn.commit()
+            return True
+    except sqlite3.Error as e:
+        logging.error(f"Error adding access code: {e}")
+        return False
+
+def delete_access_code(code):
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM access_codes WHERE code = ?", (code,))
+            conn.commit()
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logging.error(f"Error deleting access code: {e}")
+        return False
+
+# Unambiguous characters for generated codes (no 0/O, 1/I/L)
+CODE_ALPHABET = 'ABCDEFGHJKMNPQRSTUVWXYZ23456789'
+
+def _random_code(prefix, length):
+    # One draw from the OS CSPRNG per code, written out in base len(CODE_ALPHABET)
+    n = secrets.randbelow(len(CODE_ALPHABET) ** length)
+    chars = []
+    for _ in range(length):
+        n, index = divmod(n, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[index])
+    return prefix + ''.join(chars)
+
+def generate_access_codes(tariff, count, prefix='', max_uses=1, expires_at=None,
+                          length=BULK_CODES_LENGTH, chunk_size=1000):
+    """Create ``count`` unique random codes in one transaction.
+
+    Codes are inserted in chunks with INSERT OR IGNORE on the unique code
+    index; collisions are simply regenerated until ``count`` rows exist.
+    Returns the batch id to read the codes back with iter_access_code_batch,
+    or None on error.
+    """
+    batch_id = secrets.token_hex(8)
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            created = 0
+            while created < count:
+                size = min(chunk_size, count - created)
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO access_codes (code, tariff, max_uses, expires_at, batch_id) VALUES (?, ?, ?, ?, ?)",
+                    ((_random_code(prefix, length), tariff, max_uses, expires_at, batch_id) for _ in range(size))
+                )
+                created += cursor.rowcount
+            conn.commit()
+            return batch_id
+    except sqlite3.Error as e:
+        logging.error(f"Error generating access codes: {e}")
+        return None
+
+def iter_access_code_batch(batch_id, chunk_size=1000):
+    """Yield the codes of a batch in id order, one chunk per query."""
+    last_id = 0
+    while True:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, code, tariff, max_uses, expires_at FROM access_codes "
+                "WHERE batch_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (batch_id, last_id, chunk_size)
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row[1:]
+        last_id = rows[-1][0]
+
+# Broadcasts. A broadcast row is both the job and its checkpoint: the
+# runner streams recipients in user_id order after last_user_id and moves
+# the checkpoint forward with the counters after every batch. A lease in
+# locked_until keeps two processes from running the same broadcast.
+def create_broadcast(admin_id, text, tariff=None, min_completed=None, max_completed=None):
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO broadcasts (admin_id, text, tariff, min_completed, max_completed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (admin_id, text, tariff, min_completed, max_completed)
+            )
+            conn.commit()
+            return cursor.lastrowid
+    except sqlite3.Error as e:
+        logging.error(f"Error creating broadcast: {e}")
+        return None
+
+def get_broadcast(broadcast_id):
+    """(id, admin_id, text, tariff, min_completed, max_completed, status,
+    last_user_id, sent, failed, blocked)"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, admin_id, text, tariff, min_completed, max_completed, status, "
+                "last_user_id, sent, failed, blocked FROM broadcasts WHERE id = ?",
+                (broadcast_id,)
+            )
+            return cursor.fetchone()
+    except sqlite3.Error as e:
+        logging.error(f"Error getting broadcast: {e}")
+        return None
+
+def get_running_broadcast_ids():
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Error getting running broadcasts: {e}")
+        return []
+
+def claim_broadcast(broadcast_id, owner, lease_seconds):
+    """Take or extend the lease on a running broadcast; False if someone else holds it."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE broadcasts SET locked_until = datetime('now', ?), locked_by = ? "
+                "WHERE id = ? AND status = 'running' "
+                "AND (locked_until IS NULL OR locked_until < datetime('now') OR locked_by = ?)",
+                (f'+{int(lease_seconds)} seconds', owner, broadcast_id, owner)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logging.error(f"Error claiming broadcast: {e}")
+        return False
+
+def release_broadcast(broadcast_id, owner):
+    """Drop our lease on a running broadcast so another process can resume it at once."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE broadcasts SET locked_until = NULL, locked_by = NULL "
+                "WHERE id = ? AND status = 'running' AND locked_by = ?",
+                (broadcast_id, owner)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logging.error(f"Error releasing broadcast: {e}")
+        return False
+
+def get_broadcast_recipients(broadcast, after_user_id, limit):
+    """Next user ids for a broadcast row from get_broadcast, in user_id order"""
+    _, _, _, tariff, min_completed, max_completed = broadcast[:6]
+    where = ["u.user_id > ?", "u.blocked_at IS NULL"]
+    params = [after_user_id]
+    if tariff:
+        # Match tariffs the way the bot's access checks do (they lower() the
+        # stored value). The admin list filters and exports still compare
+        # exactly, so they can use idx_users_tariff_registration.
+        where.append("LOWER(u.tariff) = ?")
+        params.append(tariff.lower())
+    if min_completed is not None:
+        where.append("COALESCE(s.completed_count, 0) >= ?")
+        params.append(min_completed)
+    if max_completed is not None:
+        where.append("COALESCE(s.completed_count, 0) <= ?")
+        params.append(max_completed)
+    params.append(limit)
+
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT u.user_id FROM users u LEFT JOIN user_summary s ON s.user_id = u.user_id "
+                "WHERE " + " AND ".join(where) + " ORDER BY u.user_id LIMIT ?",
+                params
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logging.error(f"Error getting broadcast recipients: {e}")
+        return None
+
+def checkpoint_broadcast(broadcast_id, last_user_id, sent, failed, blocked_user_ids):
+    """Advance the checkpoint, add the batch counters and mark blocked users, atomically."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "UPDATE users SET blocked_at = CURRENT_TIMESTAMP WHERE user_id = ?",
+                [(user_id,) for user_id in blocked_user_ids]
+            )
+            cursor.execute(
+                "UPDATE broadcasts SET last_user_id = ?, sent = sent + ?, failed = failed + ?, "
+                "blocked = blocked + ? WHERE id = ?",
+                (last_user_id, sent, failed, len(blocked_user_ids), broadcast_id)
+            )
+            conn.commit()
+            for user_id in blocked_user_ids:
+                user_cache.invalidate(user_id)
+            return True
+    except sqlite3.Error as e:
+        logging.error(f"Error checkpointing broadcast: {e}")
+        return False
+
+def finish_broadcast(broadcast_id, status='done'):
+    """Mark a broadcast done or cancelled; only a running one can change."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP, "
+                "locked_until = NULL WHERE id = ? AND status = 'running'",
+                (status, broadcast_id)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logging.error(f"Error finishing broadcast: {e}")
+        return False
+
+def unblock_user(user_id):
+    """Clear blocked_at once a user who blocked the bot talks to it again"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET blocked_at = NULL WHERE user_id = ? AND blocked_at IS NOT NULL",
+                (user_id,)
+            )
+            conn.commit()
+            user_cache.invalidate(user_id)
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logging.error(f"Error unblocking user: {e}")
+        return False
+
+# Scheduled jobs. The jobs table is the timer queue: pending rows ordered by
+# due_at through a partial index, so finding what is due (or when the next
+# job is due) is one index seek no matter how many jobs are done. A job is
+# claimed (status 'running') before it runs; one interrupted by a crash is
+# failed rather than run again, recurring jobs are simply rescheduled.
+def _module_reminder_key(user_id, module_id):
+    return f"module-reminder:{user_id}:{module_id}"
+
+def _insert_job(cursor, kind, job_key, delay_seconds, user_id=None, module_id=None,
+                payload=None, interval_seconds=None):
+    # A pending or running job with the key is left alone; a finished one
+    # (done, cancelled, skipped, failed) is scheduled again
+    cursor.execute(
+        "INSERT INTO jobs (kind, job_key, user_id, module_id, payload, due_at, interval_seconds) "
+        "VALUES (?, ?, ?, ?, ?, datetime('now', ?), ?) "
+        "ON CONFLICT (job_key) DO UPDATE SET kind = excluded.kind, user_id = excluded.user_id, "
+        "module_id = excluded.module_id, payload = excluded.payload, due_at = excluded.due_at, "
+        "interval_seconds = excluded.interval_seconds, status = 'pending', locked_by = NULL, "
+        "locked_until = NULL, last_error = NULL, finished_at = NULL "
+        "WHERE jobs.status NOT IN ('pending', 'running')",
+        (kind, job_key, user_id, module_id, payload, f'+{int(delay_seconds)} seconds', interval_seconds)
+    )
+
+def _cancel_job(cursor, job_key):
+    cursor.execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP "
+        "WHERE job_key = ? AND status = 'pending'",
+        (job_key,)
+    )
+
+def schedule_job(kind, job_key, delay_seconds, user_id=None, module_id=None, payload=None,
+                 interval_seconds=None, wait=True):
+    """Schedule a job unless one with the same key is already pending or running"""
+    return write_queue.submit(_insert_job, kind, job_key, delay_seconds, user_id, module_id,
+                              payload, interval_seconds, wait=wait)
+
+def schedule_module_reminder(user_id, module_id, days=MODULE_REMINDER_DAYS, wait=False):
+    """Remind the user about a module they opened if it is not completed in time.
+
+    Opening the module again does not push a pending reminder back;
+    completing it cancels the reminder. Once the reminder has fired or was
+    cancelled, opening the module again schedules a new one.
+    """
+    return schedule_job('module_reminder', _module_reminder_key(user_id, module_id),
+                        days * 86400, user_id, module_id, wait=wait)
+
+def claim_due_jobs(owner, lease_seconds, limit):
+    """Atomically mark up to `limit` due jobs as running:
+    [(id, kind, user_id, module_id, payload), ...] in due order
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE jobs SET status = 'running', locked_by = ?, locked_until = datetime('now', ?) "
+                "WHERE id IN (SELECT id FROM jobs WHERE status = 'pending' "
+                "AND due_at <= datetime('now') ORDER BY due_at, id LIMIT ?) "
+                "RETURNING id, kind, user_id, module_id, payload, due_at",
+                (owner, f'+{int(lease_seconds)} seconds', limit)
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+            # RETURNING order is unspecified; sort by due_at, id like the claim
+            return [row[:5] for row in sorted(rows, key=lambda row: (row[5], row[0]))]
+    except sqlite3.Error as e:
+        logging.error(f"Error claiming jobs: {e}")
+        return []
+
+def get_next_job_delay():
+    """Seconds until the earliest pending job is due, or None if there is none"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT (julianday(MIN(due_at)) - julianday('now')) * 86400 "
+                "FROM jobs WHERE status = 'pending'"
+            )
+            return cursor.fetchone()[0]
+    except sqlite3.Error as e:
+        logging.error(f"Error getting next job: {e}")
+        return None
+
+def get_module_reminder_targets(job_ids):
+    """{job_id: (user_id, module_id, tariff)} for the reminders that should
+    still be sent: the user exists, has not blocked the bot and has not
+    completed the module.
+    """
+    if not job_ids:
+        return {}
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ', '.join('?' * len(job_ids))
+            cursor.execute(
+                "SELECT j.id, j.user_id, j.module_id, u.tariff FROM jobs j "
+                "JOIN users u ON u.user_id = j.user_id AND u.blocked_at IS NULL "
+                f"WHERE j.id IN ({placeholders}) AND NOT EXISTS ("
+                "SELECT 1 FROM module_progress p WHERE p.user_id = j.user_id "
+                "AND p.module_id = j.module_id AND p.completed)",
+                list(job_ids)
+            )
+            return {row[0]: row[1:] for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        logging.error(f"Error getting reminder targets: {e}")
+        return None
+
+def finish_jobs(results):
+    """Record job outcomes [(job_id, status, error), ...] in one transaction.
+
+    Recurring jobs go back to pending for their next run. Status 'blocked'
+    means the recipient blocked the bot; the user is marked like after a
+    broadcast.
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            blocked = []
+            for job_id, status, error in results:
+                cursor.execute(
+                    "UPDATE jobs SET "
+                    "status = CASE WHEN interval_seconds IS NULL THEN ? ELSE 'pending' END, "
+                    "due_at = CASE WHEN interval_seconds IS NULL THEN due_at "
+                    "ELSE datetime('now', '+' || interval_seconds || ' seconds') END, "
+                    "finished_at = CURRENT_TIMESTAMP, last_error = ?, locked_until = NULL "
+                    "WHERE id = ?",
+                    (status, error, job_id)
+                )
+                if status == 'blocked':
+                    cursor.execute(
+                        "UPDATE users SET blocked_at = CURRENT_TIMESTAMP "
+                        "WHERE user_id = (SELECT user_id FROM jobs WHERE id = ?) RETURNING user_id",
+                        (job_id,)
+                    )
+                    blocked.extend(row[0] for row in cursor.fetchall())
+            conn.commit()
+            for user_id in blocked:
+                user_cache.invalidate(user_id)
+            return True
+    except sqlite3.Error as e:
+        logging.error(f"Error finishing jobs: {e}")
+        return False
+
+def fail_interrupted_jobs():
+    """Settle jobs whose runner died mid-run (lease expired).
+
+    One-off jobs may already have sent their message, so they are failed
+    instead of run twice; recurring ones are rescheduled.
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN interval_seconds IS NULL THEN 'failed' ELSE 'pending' END, "
+                "due_at = CASE WHEN interval_seconds IS NULL THEN due_at "
+                "ELSE datetime('now', '+' || interval_seconds || ' seconds') END, "
+                "last_error = 'interrupted', finished_at = CURRENT_TIMESTAMP, locked_until = NULL "
+                "WHERE status = 'running' AND locked_until < datetime('now')"
+            )
+            conn.commit()
+            return cursor.rowcount
+    except sqlite3.Error as e:
+        logging.error(f"Error recovering jobs: {e}")
+        return 0
+
+# Bulk exports: header, query and the date column used for range filters.
+# Every query is joined with users so rows carry the student's name.
+EXPORTS = {
+    'submissions': (
+        ['id', 'user_id', 'username', 'first_name', 'last_name', 'tariff',
+         'module_id', 'submission', 'submitted_date', 'feedback'],
+        "SELECT s.id, s.user_id, u.username, u.first_name, u.last_name, u.tariff, "
+        "s.module_id, s.submission, s.submitted_date, s.feedback "
+        "FROM homework_submissions s JOIN users u ON s.user_id = u.user_id",
+        "s.submitted_date",
+        "s.id",
+    ),
+    'feedback': (
+        ['id', 'user_id', 'username', 'first_name', 'last_name', 'tariff',
+         'message', 'sent_date'],
+        "SELECT f.id, f.user_id, u.username, u.first_name, u.last_name, u.tariff, "
+        "f.message, f.sent_date "
+        "FROM feedback f JOIN users u ON f.user_id = u.user_id",
+        "f.sent_date",
+        "f.id",
+    ),
+    'progress': (
+        ['user_id', 'username', 'first_name', 'last_name', 'tariff',
+         'module_id', 'completed', 'completion_date'],
+        "SELECT p.user_id, u.username, u.first_name, u.last_name, u.tariff, "
+        "p.module_id, p.completed, p.completion_date "
+        "FROM module_progress p JOIN users u ON p.user_id = u.user_id",
+        "p.completion_date",
+        "p.user_id, p.module_id",
+    ),
+    'users': (
+        ['user_id', 'username', 'first_name', 'last_name', 'tariff', 'registration_date'],
+        "SELECT u.user_id, u.username, u.first_name, u.last_name, u.tariff, "
+        "u.registration_date FROM users u",
+        "u.registration_date",
+        "u.user_id",
+    ),
+}
+
+def iter_export(name, tariff=None, date_from=None, date_to=None, fetch_size=1000):
+    """Yield the rows of an export one fetchmany() chunk at a time.
+
+    The export reads through its own connection rather than the pool, so a
+    long download neither holds a pooled connection nor loads the table
+    into memory, and sees one consistent snapshot from start to finish.
+    A database error is logged and re-raised, so a streamed response is
+    aborted instead of ending like a complete download.
+    """
+    _, select, date_column, order = EXPORTS[name]
+    where, params = _date_range(date_column, date_from, date_to)
+    if tariff:
+        where.append("u.tariff = ?")
+        params.append(tariff)
+
+    sql = select
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order}"
+
+    conn = create_connection()
+    if conn is None:
+        raise sqlite3.OperationalError(f"cannot open the database for export {name}")
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            yield from rows
+    except sqlite3.Error as e:
+        logging.error(f"Error exporting {name}: {e}")
+        raise
+    finally:
+        conn.close()
+
+# Keyset pagination for the admin lists. A page is read by seeking the
+# (sort column, id) index past the last row of the previous page, so every
+# page costs the same no matter how deep it is.
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    return values
+
+def _date_range(column, date_from, date_to):
+    where, params = [], []
+    if date_from:
+        where.append(f"{column} >= ?")
+        params.append(date_from)
+    if date_to:
+        # date_to is inclusive: everything before the start of the next day
+        where.append(f"{column} < date(?, '+1 day')")
+        params.append(date_to)
+    return where, params
+
+def _keyset_page(select, where, params, sort_column, id_column, cursor, limit):
+    """Run a newest-first page query; returns (rows, next_cursor)."""
+    where = list(where)
+    params = list(params)
+    after = decode_cursor(cursor)
+    if after:
+        where.append(f"({sort_column}, {id_column}) < (?, ?)")
+        params.extend(after)
+
+    sql = select
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {sort_column} DESC, {id_column} DESC LIMIT ?"
+    params.append(limit + 1)
+
+    try:
+        with get_db_connection() as conn:
+            cursor_ = conn.cursor()
+            cursor_.execute(sql, params)
+            rows = cursor_.fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"Error reading page: {e}")
+        return [], None
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1][-1], rows[-1][-2]])
+
+def get_users_page(limit, cursor=None, tariff=None, date_from=None, date_to=None):
+    where, params = _date_range("registration_date", date_from, date_to)
+    if tariff:
+        where.append("tariff = ?")
+        params.append(tariff)
+    rows, next_cursor = _keyset_page(
+        "SELECT *, user_id, registration_date FROM users",
+        where, params, "registration_date", "user_id", cursor, limit
+    )
+    return [row[:-2] for row in rows], next_cursor
+
+def get_feedback_page(limit, cursor=None, tariff=None, date_from=None, date_to=None):
+    where, params = _date_range("f.sent_date", date_from, date_to)
+    if tariff:
+        where.append("u.tariff = ?")
+        params.append(tariff)
+    rows, next_cursor = _keyset_page(
+        "SELECT f.*, u.username, u.first_name, u.last_name, f.id, f.sent_date "
+        "FROM feedback f JOIN users u ON f.user_id = u.user_id",
+        where, params, "f.sent_date", "f.id", cursor, limit
+    )
+    return [row[:-2] for row in rows], next_cursor
+
+def get_submissions_page(limit, cursor=None, module_id=None, tariff=None,
+                         date_from=None, date_to=None, reviewed=None):
+    where, params = _date_range("s.submitted_date", date_from, date_to)
+    if module_id:
+        where.append("s.module_id = ?")
+        params.append(module_id)
+    if tariff:
+        where.append("u.tariff = ?")
+        params.append(tariff)
+    if reviewed is True:
+        where.append("s.feedback IS NOT NULL")
+    elif reviewed is False:
+        where.append("s.feedback IS NULL")
+    rows, next_cursor = _keyset_page(
+        "SELECT s.id, s.user_id, s.module_id, s.submission, s.submitted_date, s.feedback, "
+        "u.username, u.first_name, u.last_name, s.id, s.submitted_date "
+        "FROM homework_submissions s JOIN users u ON s.user_id = u.user_id",
+        where, params, "s.submitted_date", "s.id", cursor, limit
+    )
+    return [row[:-2] for row in rows], next_cursor
+
 # Initialize the database on import
 init_db()
@@ -0,0 +1,100 @@
+import logging
+import queue
+import threading
+import telebot
+
+logger = logging.getLogger(__name__)
+
+# Update fields that carry the user who triggered them
+_UPDATE_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query',
+    'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+    'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request'
+)
+
+
+def update_user_id(update):
+    """Return the id of the user an update belongs to, if any."""
+    for field in _UPDATE_FIELDS:
+        obj = getattr(update, field, None)
+        if obj is None:
+            continue
+        user = getattr(obj, 'from_user', None) or getattr(obj, 'user', None)
+        if user is not None:
+            return user.id
+    return None
+
+
+class ShardedDispatcher:
+    """Fixed pool of worker threads with one FIFO queue per worker.
+
+    Tasks submitted with the same key always land on the same worker, so they
+    run one at a time and in submission order, while tasks for other keys run
+    in parallel on the remaining workers. Queues are bounded: when a shard is
+    full ``submit`` blocks, which pushes back on the update source.
+    """
+
+    def __init__(self, num_workers=8, queue_size=1000, name='dispatch'):
+        self.num_workers = num_workers
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self._threads = []
+        for index, shard in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._run, args=(shard,), name=f'{name}-{index}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, fn, *args, **kwargs):
+        shard = self._queues[hash(key) % self.num_workers]
+        shard.put((fn, args, kwargs))
+
+    def shutdown(self, timeout=None):
+        """Let workers finish everything queued so far, then stop them."""
+        for shard in self._queues:
+            shard.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        return {
+            'workers': self.num_workers,
+            'queued': [shard.qsize() for shard in self._queues]
+        }
+
+    def _run(self, shard):
+        while True:
+            task = shard.get()
+            if task is None:
+                return
+            fn, args, kwargs = task
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f"Unhandled error while processing update: {e}")
+
+
+class OrderedTeleBot(telebot.TeleBot):
+    """TeleBot that processes updates on a sharded worker pool.
+
+    Updates from the same user are handled strictly in order on one worker,
+    so conversation state (user_states / temp_data) is never raced, while a
+    slow Telegram call or database write for one user does not stall others.
+    """
+
+    def __init__(self, token, num_workers=8, queue_size=1000, **kwargs):
+        # Handlers run inline on the dispatcher workers, not on telebot's pool
+        kwargs['threaded'] = False
+        super().__init__(token, **kwargs)
+        self.dispatcher = ShardedDispatcher(num_workers, queue_size, name='bot-worker')
+
+    def process_new_updates(self, updates):
+        process = super().process_new_updates
+        for update in updates:
+            # Advance the polling offset now; processing happens asynchronously
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+
+            user_id = update_user_id(update)
+            key = user_id if user_id is not None else update.update_id
+            self.dispatcher.submit(key, process, [update])
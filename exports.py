@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+
+# Rows are grouped into chunks of about this size before being sent
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def iter_csv(header, rows, chunk_bytes=STREAM_CHUNK_BYTES):
+    """Yield CSV text in chunks; only one chunk is held in memory."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_jsonl(header, rows, chunk_bytes=STREAM_CHUNK_BYTES):
+    """Yield one JSON object per line, keyed by header, in chunks."""
+    lines = []
+    size = 0
+
+    for row in rows:
+        line = json.dumps(dict(zip(header, row)), ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+
+    if lines:
+        yield ''.join(lines)
+
+
+# Export format -> (writer, mimetype, file extension)
+FORMATS = {
+    'csv': (iter_csv, 'text/csv', 'csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson', 'jsonl'),
+}
@@ -0,0 +1,14 @@
+from config import WEB_WORKERS, WEB_THREADS
+
+# The mini-app keeps a Server-Sent Events stream open for up to
+# SSE_MAX_DURATION seconds. Sync workers would be blocked by a single
+# stream, so requests run on threads; SSE_MAX_CONNECTIONS is derived from
+# WEB_THREADS so streams can never take every thread.
+# With BOT_MODE=webhook the workers only queue updates (main.py handles
+# them and sends), so WEB_WORKERS can be raised freely.
+bind = '0.0.0.0:8000'
+worker_class = 'gthread'
+workers = WEB_WORKERS
+threads = WEB_THREADS
+# Streams send a heartbeat every SSE_HEARTBEAT seconds
+timeout = 60
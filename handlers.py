@@ -4,22 +4,83 @@ from telebot import types
 import re
 import os
 from flask import request
-from config import TOKEN, ACCESS_CODES, TARIFF_DESCRIPTIONS, MODULE_ACCESS, ADMIN_IDS
+from config import TOKEN, TARIFF_DESCRIPTIONS, MODULE_ACCESS, ADMIN_IDS
 from database import (
-    get_user, add_user, update_user_tariff, add_feedback, 
+    get_user, add_feedback, 
     update_module_progress, get_module_progress, add_homework_submission,
-    get_homework_submissions
+    get_homework_submissions, redeem_access_code, create_broadcast,
+    finish_broadcast, unblock_user, schedule_module_reminder
 )
 from modules_content import MODULES, MODULE_DESCRIPTIONS, HOMEWORK, ADDITIONAL_MATERIALS
 from keyboards import (
     get_main_menu_keyboard, get_back_keyboard, get_modules_keyboard, 
     get_homework_keyboard, get_module_content_keyboard, get_access_keyboard,
     get_submit_homework_keyboard, get_additional_materials_keyboard,
-    get_feedback_confirm_keyboard
+    get_feedback_confirm_keyboard, get_back_to_modules_keyboard
 )
+from callback_router import CallbackRouter
+from outbound import NOTIFY
 
 logger = logging.getLogger(__name__)
 
+# Homework can be sent as text or as a photo, document or voice message
+HOMEWORK_CONTENT_TYPES = ['text', 'photo', 'document', 'voice']
+
+ATTACHMENT_LABELS = {
+    'photo': "📎 Фото",
+    'document': "📎 Документ",
+    'voice': "🎤 Голосовое сообщение",
+}
+
+
+def get_submission_attachment(message):
+    """Telegram file of a photo/document/voice message as a dict for
+    add_homework_submission, or None for text. Works with telebot and
+    aiogram messages alike.
+    """
+    if message.photo:
+        photo = message.photo[-1]  # Largest size
+        return {
+            'file_type': 'photo',
+            'file_id': photo.file_id,
+            'file_unique_id': photo.file_unique_id,
+            'file_name': None,
+            'mime_type': 'image/jpeg',
+            'file_size': photo.file_size,
+        }
+    for file_type in ('document', 'voice'):
+        media = getattr(message, file_type)
+        if media:
+            return {
+                'file_type': file_type,
+                'file_id': media.file_id,
+                'file_unique_id': media.file_unique_id,
+                'file_name': getattr(media, 'file_name', None),
+                'mime_type': media.mime_type,
+                'file_size': media.file_size,
+            }
+    return None
+
+
+def escape_markdown(text):
+    """Escape user text for parse_mode="Markdown" (the legacy syntax only
+    treats _ * ` [ as markup)"""
+    return re.sub(r'([_*`\[])', r'\\\1', text)
+
+
+def submission_preview(text, attachment):
+    """Submission as shown back to the student before sending, escaped for
+    parse_mode="Markdown": a file name like homework_1.docx would otherwise
+    make Telegram reject the message"""
+    text = escape_markdown(text)
+    if not attachment:
+        return text
+    label = ATTACHMENT_LABELS[attachment['file_type']]
+    if attachment.get('file_name'):
+        label = f"{label}: {escape_markdown(attachment['file_name'])}"
+    return f"{label}\n{text}" if text else label
+
+
 class BotStates:
     AWAITING_ACCESS_CODE = 'awaiting_access_code'
     AWAITING_FEEDBACK = 'awaiting_feedback'
@@ -43,6 +104,8 @@ def register_command_handlers(bot, user_states, temp_data):
         # Check if user exists in database
         if user:
             tariff = user[4]  # Index 4 corresponds to tariff in the database row
+            if user[6]:  # blocked_at: the user had blocked the bot and is back
+                unblock_user(user_id)
             bot.send_message(
                 user_id, 
                 f"{welcome_text}\n\nВаш текущий тариф: *{tariff}*",
@@ -311,52 +374,30 @@ def register_message_handlers(bot, user_states, temp_data):
         # Clear user state
         user_states.pop(user_id, None)
         
-        # Check if access code is valid
-        valid_tariff = None
-        for tariff, codes in ACCESS_CODES.items():
-            if access_code in codes:
-                valid_tariff = tariff
-                break
+        # Consume the access code and register the user or change the tariff
+        # in one transaction
+        username = message.from_user.username if message.from_user.username else ""
+        first_name = message.from_user.first_name if message.from_user.first_name else ""
+        last_name = message.from_user.last_name if message.from_user.last_name else ""
+        redeemed = redeem_access_code(access_code, user_id, username, first_name, last_name)
         
-        if valid_tariff:
-            user = get_user(user_id)
-            if user:
-                # Update existing user's tariff
-                success = update_user_tariff(user_id, valid_tariff)
-                if success:
-                    bot.send_message(
-                        user_id,
-                        f"✅ Ваш тариф успешно обновлен до *{valid_tariff}*!",
-                        parse_mode="Markdown",
-                        reply_markup=get_main_menu_keyboard()
-                    )
-                else:
-                    bot.send_message(
-                        user_id,
-                        "❌ Произошла ошибка при обновлении тарифа. Пожалуйста, попробуйте позже.",
-                        reply_markup=get_main_menu_keyboard()
-                    )
+        if redeemed:
+            valid_tariff, created = redeemed
+            if created:
+                bot.send_message(
+                    user_id,
+                    f"✅ Добро пожаловать в курс! Ваш тариф: *{valid_tariff}*\n\n"
+                    f"{TARIFF_DESCRIPTIONS.get(valid_tariff, '')}",
+                    parse_mode="Markdown",
+                    reply_markup=get_main_menu_keyboard()
+                )
             else:
-                # Add new user
-                username = message.from_user.username if message.from_user.username else ""
-                first_name = message.from_user.first_name if message.from_user.first_name else ""
-                last_name = message.from_user.last_name if message.from_user.last_name else ""
-                
-                success = add_user(user_id, username, first_name, last_name, valid_tariff)
-                if success:
-                    bot.send_message(
-                        user_id,
-                        f"✅ Добро пожаловать в курс! Ваш тариф: *{valid_tariff}*\n\n"
-                        f"{TARIFF_DESCRIPTIONS.get(valid_tariff, '')}",
-                        parse_mode="Markdown",
-                        reply_markup=get_main_menu_keyboard()
-                    )
-                else:
-                    bot.send_message(
-                        user_id,
-                        "❌ Произошла ошибка при регистрации. Пожалуйста, попробуйте позже.",
-                        reply_markup=types.ReplyKeyboardRemove()
-                    )
+                bot.send_message(
+                    user_id,
+                    f"✅ Ваш тариф успешно обновлен до *{valid_tariff}*!",
+                    parse_mode="Markdown",
+                    reply_markup=get_main_menu_keyboard()
+                )
         else:
             bot.send_message(
                 user_id,
@@ -381,7 +422,10 @@ def register_message_handlers(bot, user_states, temp_data):
             reply_markup=get_feedback_confirm_keyboard()
         )
     
-    @bot.message_handler(func=lambda message: user_states.get(message.from_user.id) == BotStates.AWAITING_HOMEWORK_SUBMISSION)
+    @bot.message_handler(
+        content_types=HOMEWORK_CONTENT_TYPES,
+        func=lambda message: user_states.get(message.from_user.id) == BotStates.AWAITING_HOMEWORK_SUBMISSION
+    )
     def handle_homework_submission(message):
         user_id = message.from_user.id
         module_id = temp_data.get(user_id, {}).get("module_id")
@@ -396,14 +440,24 @@ def register_message_handlers(bot, user_states, temp_data):
             temp_data.pop(user_id, None)
             return
         
-        # Store submission in temp_data
-        temp_data[user_id]["submission"] = message.text.strip()
+        attachment = get_submission_attachment(message)
+        text = (message.text or message.caption or "").strip()
+        if not text and not attachment:
+            bot.send_message(user_id, "Отправьте текст, фото, документ или голосовое сообщение.")
+            return
+        
+        # Store submission in temp_data (stores return copies, so write it back).
+        # Files are kept as Telegram file_ids and downloaded after submission.
+        draft = temp_data.get(user_id, {})
+        draft["submission"] = text
+        draft["attachment"] = attachment
+        temp_data[user_id] = draft
         
         # Ask for confirmation
         bot.send_message(
             user_id,
             f"*Ваше решение домашнего задания для модуля {module_id}:*\n\n"
-            f"{temp_data[user_id]['submission']}\n\nОтправить?",
+            f"{submission_preview(text, attachment)}\n\nОтправить?",
             parse_mode="Markdown",
             reply_markup=get_submit_homework_keyboard(module_id)
         )
@@ -526,243 +580,258 @@ def register_message_handlers(bot, user_states, temp_data):
             )
 
 
+# Inline keyboard callbacks are dispatched through this table. Other
+# register_* functions may add their own verbs with callback_router.register.
+callback_router = CallbackRouter()
+
+
 def register_callback_handlers(bot, user_states, temp_data):
     @bot.callback_query_handler(func=lambda call: True)
     def handle_callback_query(call):
-        user_id = call.from_user.id
-        callback_data = call.data
+        callback_router.dispatch(call)
+
+    # Buttons of old messages after a bot update: answer so the spinner stops
+    @callback_router.fallback
+    def handle_unknown_callback(call):
+        bot.answer_callback_query(
+            call.id,
+            text="Эта кнопка больше не действует. Откройте меню заново: /menu"
+        )
+    
+    # Handle locked module
+    @callback_router.register('locked_module', arg_type=int)
+    def handle_locked_module(call, module_id):
+        bot.answer_callback_query(
+            call.id,
+            text=f"Модуль {module_id} недоступен на вашем тарифе. Обновите тариф для доступа.",
+            show_alert=True
+        )
+    
+    # Handle locked homework
+    @callback_router.register('locked_homework', arg_type=int)
+    def handle_locked_homework(call, module_id):
+        bot.answer_callback_query(
+            call.id,
+            text=f"Домашнее задание {module_id} недоступно на вашем тарифе. Обновите тариф для доступа.",
+            show_alert=True
+        )
+    
+    # Handle navigation
+    @callback_router.register('back_to_main')
+    def handle_back_to_main(call):
+        bot.edit_message_reply_markup(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=None
+        )
+        show_main_menu(call.message, bot)
+    
+    @callback_router.register('back_to_modules')
+    def handle_back_to_modules(call):
+        user = get_user(call.from_user.id)
+        if user:
+            tariff = user[4]
+            available_modules = MODULE_ACCESS.get(tariff.lower(), [])
+            
+            try:
+                bot.edit_message_text(
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id,
+                    text="*Доступные модули курса:*",
+                    parse_mode="Markdown",
+                    reply_markup=get_modules_keyboard(tariff, available_modules)
+                )
+            except Exception as e:
+                # Если сообщение не изменилось или другая ошибка
+                logging.warning(f"Ошибка при редактировании сообщения: {str(e)}")
+    
+    # Handle module materials
+    @callback_router.register('materials', arg_type=int)
+    def handle_materials(call, module_id):
+        # Show additional materials for the module
+        materials = ADDITIONAL_MATERIALS.get(module_id, [])
+        materials_text = f"*Дополнительные материалы для модуля {module_id}:*\n\n"
+        
+        for i, material in enumerate(materials, 1):
+            materials_text += f"{i}. {material}\n"
         
-        # Handle module selection
-        if callback_data.startswith('module_'):
-            module_id = int(callback_data.split('_')[1])
-            handle_module_selection(call, module_id)
+        try:
+            bot.edit_message_text(
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=materials_text,
+                parse_mode="Markdown",
+                reply_markup=get_additional_materials_keyboard(module_id)
+            )
+        except Exception as e:
+            logging.warning(f"Ошибка при редактировании сообщения материалов: {str(e)}")
+    
+    # Handle module completion
+    @callback_router.register('complete_module', arg_type=int)
+    def handle_complete_module(call, module_id):
+        success = update_module_progress(call.from_user.id, module_id, True)
         
-        # Handle locked module
-        elif callback_data.startswith('locked_module_'):
-            module_id = int(callback_data.split('_')[2])
+        if success:
             bot.answer_callback_query(
                 call.id,
-                text=f"Модуль {module_id} недоступен на вашем тарифе. Обновите тариф для доступа.",
-                show_alert=True
+                text=f"Модуль {module_id} отмечен как пройденный! 🎉",
+                show_alert=False
             )
-        
-        # Handle homework selection
-        elif callback_data.startswith('homework_'):
-            module_id = int(callback_data.split('_')[1])
-            handle_homework_selection(call, module_id)
-        
-        # Handle locked homework
-        elif callback_data.startswith('locked_homework_'):
-            module_id = int(callback_data.split('_')[2])
+        else:
             bot.answer_callback_query(
                 call.id,
-                text=f"Домашнее задание {module_id} недоступно на вашем тарифе. Обновите тариф для доступа.",
+                text="Произошла ошибка. Пожалуйста, попробуйте позже.",
                 show_alert=True
             )
+    
+    # Handle homework submission
+    @callback_router.register('submit_homework', arg_type=int)
+    def handle_submit_homework(call, module_id):
+        user_id = call.from_user.id
+        draft = temp_data.get(user_id, {})
+        submission = draft.get("submission", "")
+        attachment = draft.get("attachment")
         
-        # Handle navigation
-        elif callback_data == 'back_to_main':
-            bot.edit_message_reply_markup(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                reply_markup=None
+        if submission or attachment:
+            success = add_homework_submission(
+                user_id, module_id, submission or ATTACHMENT_LABELS[attachment["file_type"]], attachment
             )
-            show_main_menu(call.message, bot)
-        
-        elif callback_data == 'back_to_modules':
-            user = get_user(user_id)
-            if user:
-                tariff = user[4]
-                available_modules = MODULE_ACCESS.get(tariff.lower(), [])
+            
+            if success:
+                # Clear states
+                user_states.pop(user_id, None)
+                temp_data.pop(user_id, None)
                 
                 try:
                     bot.edit_message_text(
                         chat_id=call.message.chat.id,
                         message_id=call.message.message_id,
-                        text="*Доступные модули курса:*",
-                        parse_mode="Markdown",
-                        reply_markup=get_modules_keyboard(tariff, available_modules)
+                        text="✅ Ваше домашнее задание успешно отправлено! Куратор скоро его проверит.",
+                        reply_markup=None
                     )
                 except Exception as e:
-                    # Если сообщение не изменилось или другая ошибка
-                    logging.warning(f"Ошибка при редактировании сообщения: {str(e)}")
-        
-        # Handle module materials
-        elif callback_data.startswith('materials_'):
-            module_id = int(callback_data.split('_')[1])
-            # Show additional materials for the module
-            materials = ADDITIONAL_MATERIALS.get(module_id, [])
-            materials_text = f"*Дополнительные материалы для модуля {module_id}:*\n\n"
-            
-            for i, material in enumerate(materials, 1):
-                materials_text += f"{i}. {material}\n"
-            
-            try:
-                bot.edit_message_text(
-                    chat_id=call.message.chat.id,
-                    message_id=call.message.message_id,
-                    text=materials_text,
-                    parse_mode="Markdown",
-                    reply_markup=get_additional_materials_keyboard(module_id)
-                )
-            except Exception as e:
-                logging.warning(f"Ошибка при редактировании сообщения материалов: {str(e)}")
+                    logging.warning(f"Ошибка при отправке успешного задания: {str(e)}")
+                
+                show_main_menu(call.message, bot)
+            else:
+                try:
+                    bot.edit_message_text(
+                        chat_id=call.message.chat.id,
+                        message_id=call.message.message_id,
+                        text="❌ Произошла ошибка при отправке домашнего задания. Пожалуйста, попробуйте позже.",
+                        reply_markup=None
+                    )
+                except Exception as e:
+                    logging.warning(f"Ошибка при отображении сообщения об ошибке: {str(e)}")
+                
+                show_main_menu(call.message, bot)
+        else:
+            bot.answer_callback_query(
+                call.id,
+                text="Домашнее задание не может быть пустым.",
+                show_alert=True
+            )
+    
+    # Handle homework cancellation
+    @callback_router.register('cancel_homework', arg_type=int)
+    def handle_cancel_homework(call, module_id):
+        user_id = call.from_user.id
+        # Clear states
+        user_states.pop(user_id, None)
+        temp_data.pop(user_id, None)
+        
+        bot.edit_message_text(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            text="❌ Отправка домашнего задания отменена.",
+            reply_markup=None
+        )
+        
+        show_main_menu(call.message, bot)
+    
+    # Handle feedback submission
+    @callback_router.register('submit_feedback')
+    def handle_submit_feedback(call):
+        user_id = call.from_user.id
+        feedback_text = temp_data.get(user_id, {}).get("feedback", "")
         
-        # Handle module completion
-        elif callback_data.startswith('complete_module_'):
-            module_id = int(callback_data.split('_')[2])
-            success = update_module_progress(user_id, module_id, True)
+        if feedback_text:
+            success = add_feedback(user_id, feedback_text)
             
             if success:
-                bot.answer_callback_query(
-                    call.id,
-                    text=f"Модуль {module_id} отмечен как пройденный! 🎉",
-                    show_alert=False
-                )
-            else:
-                bot.answer_callback_query(
-                    call.id,
-                    text="Произошла ошибка. Пожалуйста, попробуйте позже.",
-                    show_alert=True
+                # Clear states
+                user_states.pop(user_id, None)
+                temp_data.pop(user_id, None)
+                
+                try:
+                    bot.edit_message_text(
+                        chat_id=call.message.chat.id,
+                        message_id=call.message.message_id,
+                        text="✅ Ваша обратная связь успешно отправлена! Спасибо за ваш отзыв.",
+                        reply_markup=None
+                    )
+                except Exception as e:
+                    logging.warning(f"Ошибка при отправке сообщения об успешном отзыве: {str(e)}")
+                
+                # Notify admins about new feedback without waiting for delivery
+                notify_admins(
+                    bot,
+                    f"*Новая обратная связь от пользователя {user_id}:*\n\n{feedback_text}",
+                    parse_mode="Markdown"
                 )
-        
-        # Handle homework submission
-        elif callback_data.startswith('submit_homework_'):
-            module_id = int(callback_data.split('_')[2])
-            submission = temp_data.get(user_id, {}).get("submission", "")
-            
-            if submission:
-                success = add_homework_submission(user_id, module_id, submission)
                 
-                if success:
-                    # Clear states
-                    user_states.pop(user_id, None)
-                    temp_data.pop(user_id, None)
-                    
-                    try:
-                        bot.edit_message_text(
-                            chat_id=call.message.chat.id,
-                            message_id=call.message.message_id,
-                            text="✅ Ваше домашнее задание успешно отправлено! Куратор скоро его проверит.",
-                            reply_markup=None
-                        )
-                    except Exception as e:
-                        logging.warning(f"Ошибка при отправке успешного задания: {str(e)}")
-                    
-                    show_main_menu(call.message, bot)
-                else:
-                    try:
-                        bot.edit_message_text(
-                            chat_id=call.message.chat.id,
-                            message_id=call.message.message_id,
-                            text="❌ Произошла ошибка при отправке домашнего задания. Пожалуйста, попробуйте позже.",
-                            reply_markup=None
-                        )
-                    except Exception as e:
-                        logging.warning(f"Ошибка при отображении сообщения об ошибке: {str(e)}")
-                    
-                    show_main_menu(call.message, bot)
+                show_main_menu(call.message, bot)
             else:
-                bot.answer_callback_query(
-                    call.id,
-                    text="Домашнее задание не может быть пустым.",
-                    show_alert=True
-                )
-        
-        # Handle homework cancellation
-        elif callback_data.startswith('cancel_homework_'):
-            # Clear states
-            user_states.pop(user_id, None)
-            temp_data.pop(user_id, None)
-            
-            bot.edit_message_text(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                text="❌ Отправка домашнего задания отменена.",
-                reply_markup=None
+                try:
+                    bot.edit_message_text(
+                        chat_id=call.message.chat.id,
+                        message_id=call.message.message_id,
+                        text="❌ Произошла ошибка при отправке обратной связи. Пожалуйста, попробуйте позже.",
+                        reply_markup=None
+                    )
+                except Exception as e:
+                    logging.warning(f"Ошибка при отправке сообщения об ошибке отзыва: {str(e)}")
+                
+                show_main_menu(call.message, bot)
+        else:
+            bot.answer_callback_query(
+                call.id,
+                text="Обратная связь не может быть пустой.",
+                show_alert=True
             )
-            
-            show_main_menu(call.message, bot)
+    
+    # Handle feedback cancellation
+    @callback_router.register('cancel_feedback')
+    def handle_cancel_feedback(call):
+        user_id = call.from_user.id
+        # Clear states
+        user_states.pop(user_id, None)
+        temp_data.pop(user_id, None)
         
-        # Handle feedback submission
-        elif callback_data == 'submit_feedback':
-            feedback_text = temp_data.get(user_id, {}).get("feedback", "")
-            
-            if feedback_text:
-                success = add_feedback(user_id, feedback_text)
-                
-                if success:
-                    # Clear states
-                    user_states.pop(user_id, None)
-                    temp_data.pop(user_id, None)
-                    
-                    try:
-                        bot.edit_message_text(
-                            chat_id=call.message.chat.id,
-                            message_id=call.message.message_id,
-                            text="✅ Ваша обратная связь успешно отправлена! Спасибо за ваш отзыв.",
-                            reply_markup=None
-                        )
-                    except Exception as e:
-                        logging.warning(f"Ошибка при отправке сообщения об успешном отзыве: {str(e)}")
-                    
-                    # Notify admins about new feedback
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            bot.send_message(
-                                admin_id,
-                                f"*Новая обратная связь от пользователя {user_id}:*\n\n{feedback_text}",
-                                parse_mode="Markdown"
-                            )
-                        except Exception as e:
-                            logger.error(f"Failed to notify admin {admin_id}: {e}")
-                    
-                    show_main_menu(call.message, bot)
-                else:
-                    try:
-                        bot.edit_message_text(
-                            chat_id=call.message.chat.id,
-                            message_id=call.message.message_id,
-                            text="❌ Произошла ошибка при отправке обратной связи. Пожалуйста, попробуйте позже.",
-                            reply_markup=None
-                        )
-                    except Exception as e:
-                        logging.warning(f"Ошибка при отправке сообщения об ошибке отзыва: {str(e)}")
-                    
-                    show_main_menu(call.message, bot)
-            else:
-                bot.answer_callback_query(
-                    call.id,
-                    text="Обратная связь не может быть пустой.",
-                    show_alert=True
-                )
+        bot.edit_message_text(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            text="❌ Отправка обратной связи отменена.",
+            reply_markup=None
+        )
         
-        # Handle feedback cancellation
-        elif callback_data == 'cancel_feedback':
-            # Clear states
-            user_states.pop(user_id, None)
-            temp_data.pop(user_id, None)
-            
-            bot.edit_message_text(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                text="❌ Отправка обратной связи отменена.",
-                reply_markup=None
-            )
-            
-            show_main_menu(call.message, bot)
+        show_main_menu(call.message, bot)
+    
+    # Handle access code entry
+    @callback_router.register('enter_access_code')
+    def handle_enter_access_code(call):
+        user_id = call.from_user.id
+        bot.send_message(
+            user_id,
+            "Пожалуйста, введите код доступа:",
+            reply_markup=types.ReplyKeyboardRemove()
+        )
         
-        # Handle access code entry
-        elif callback_data == 'enter_access_code':
-            bot.send_message(
-                user_id,
-                "Пожалуйста, введите код доступа:",
-                reply_markup=types.ReplyKeyboardRemove()
-            )
-            
-            # Set user state to awaiting access code
-            user_states[user_id] = BotStates.AWAITING_ACCESS_CODE
+        # Set user state to awaiting access code
+        user_states[user_id] = BotStates.AWAITING_ACCESS_CODE
     
+    # Handle module selection
+    @callback_router.register('module', arg_type=int)
     def handle_module_selection(call, module_id):
         user_id = call.from_user.id
         user = get_user(user_id)
@@ -786,6 +855,8 @@ def register_callback_handlers(bot, user_states, temp_data):
             )
             return
         
+        schedule_module_reminder(user_id, module_id)
+
         # Get module content
         module_title = MODULES.get(module_id, f"Модуль {module_id}")
         module_description = MODULE_DESCRIPTIONS.get(module_id, "Описание отсутствует")
@@ -803,6 +874,8 @@ def register_callback_handlers(bot, user_states, temp_data):
         except Exception as e:
             logging.warning(f"Ошибка при отображении модуля: {str(e)}")
     
+    # Handle homework selection
+    @callback_router.register('homework', arg_type=int)
     def handle_homework_selection(call, module_id):
         user_id = call.from_user.id
         user = get_user(user_id)
@@ -848,15 +921,44 @@ def register_callback_handlers(bot, user_states, temp_data):
                 message_id=call.message.message_id,
                 text=f"{homework_text}{submission_text}",
                 parse_mode="Markdown",
-                reply_markup=types.InlineKeyboardMarkup().add(
-                    types.InlineKeyboardButton("↩️ Назад к модулям", callback_data="back_to_modules")
-                )
+                reply_markup=get_back_to_modules_keyboard()
             )
         except Exception as e:
             logging.warning(f"Ошибка при отображении домашнего задания: {str(e)}")
 
 
-def register_admin_handlers(bot, user_states, temp_data):
+BROADCAST_USAGE = (
+    "Использование:\n"
+    "/broadcast [tariff=basic] [min_completed=N] [max_completed=N] текст сообщения\n\n"
+    "min_completed и max_completed отбирают по числу завершенных модулей.\n"
+    "/broadcast_cancel ID - остановить рассылку"
+)
+
+
+def parse_broadcast_command(text):
+    """Разбирает параметры /broadcast; возвращает (параметры, текст) или None"""
+    parts = text.split(maxsplit=1)
+    rest = parts[1] if len(parts) > 1 else ''
+    options = {}
+    while True:
+        match = re.match(r'(tariff|min_completed|max_completed)=(\S+)\s+', rest)
+        if not match:
+            break
+        key, value = match.groups()
+        if key == 'tariff':
+            if value not in MODULE_ACCESS:
+                return None
+            options[key] = value
+        elif value.isdigit():
+            options[key] = int(value)
+        else:
+            return None
+        rest = rest[match.end():]
+    rest = rest.strip()
+    return (options, rest) if rest else None
+
+
+def register_admin_handlers(bot, user_states, temp_data, broadcaster=None):
     @bot.message_handler(commands=['admin'], func=lambda message: message.from_user.id in ADMIN_IDS)
     def admin_command(message):
         admin_text = (
@@ -865,6 +967,8 @@ def register_admin_handlers(bot, user_states, temp_data):
             "/users - показать список пользователей\n"
             "/feedback - показать отзывы\n"
             "/broadcast - отправить сообщение всем пользователям\n"
+            "/broadcast_cancel - остановить рассылку\n"
+            "/outbound - статистика отправки сообщений\n"
             "/adduser - добавить пользователя\n"
             "/updatetariff - обновить тариф пользователя"
         )
@@ -874,6 +978,52 @@ def register_admin_handlers(bot, user_states, temp_data):
             admin_text,
             parse_mode="Markdown"
         )
+
+    @bot.message_handler(commands=['outbound'], func=lambda message: message.from_user.id in ADMIN_IDS)
+    def outbound_command(message):
+        stats = bot.outbound_stats()
+        lanes = "\n".join(
+            f"{name}: в очереди {lane['queued']}, ожидание {lane['wait_avg_ms']} мс (макс. {lane['wait_max_ms']} мс)"
+            for name, lane in stats['lanes'].items()
+        )
+        bot.send_message(
+            message.from_user.id,
+            f"Отправлено: {stats['sent']}\n"
+            f"Ошибок: {stats['failed']}\n"
+            f"Ограничений 429: {stats['rate_limited']}\n\n{lanes}"
+        )
+    
+    @bot.message_handler(commands=['broadcast'], func=lambda message: message.from_user.id in ADMIN_IDS)
+    def broadcast_command(message):
+        parsed = parse_broadcast_command(message.text)
+        if not parsed or broadcaster is None:
+            bot.send_message(message.from_user.id, BROADCAST_USAGE)
+            return
+
+        options, text = parsed
+        broadcast_id = create_broadcast(message.from_user.id, text, **options)
+        if not broadcast_id:
+            bot.send_message(message.from_user.id, "❌ Не удалось создать рассылку.")
+            return
+
+        broadcaster.start(broadcast_id)
+        bot.send_message(
+            message.from_user.id,
+            f"📣 Рассылка #{broadcast_id} запущена. Отчет о ходе придет по мере отправки.\n"
+            f"Остановить: /broadcast_cancel {broadcast_id}"
+        )
+
+    @bot.message_handler(commands=['broadcast_cancel'], func=lambda message: message.from_user.id in ADMIN_IDS)
+    def broadcast_cancel_command(message):
+        parts = message.text.split()
+        if len(parts) != 2 or not parts[1].isdigit():
+            bot.send_message(message.from_user.id, BROADCAST_USAGE)
+            return
+
+        if finish_broadcast(int(parts[1]), 'cancelled'):
+            bot.send_message(message.from_user.id, f"Рассылка #{parts[1]} остановлена.")
+        else:
+            bot.send_message(message.from_user.id, f"Рассылка #{parts[1]} не найдена или уже завершена.")
     
     # Other admin handlers can be added here
 
@@ -884,6 +1034,17 @@ def register_state_handlers(bot, user_states, temp_data):
     pass
 
 
+def notify_admins(bot, text, **kwargs):
+    """Queue a message to every admin in the notification lane"""
+    notify = bot.lane(NOTIFY, wait=False)
+    for admin_id in ADMIN_IDS:
+        future = notify.send_message(admin_id, text, **kwargs)
+        future.add_done_callback(
+            lambda f, admin_id=admin_id: f.exception() and logger.error(
+                f"Failed to notify admin {admin_id}: {f.exception()}")
+        )
+
+
 # Helper function to show main menu
 def show_main_menu(message, bot_instance):
     user_id = message.from_user.id
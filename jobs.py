@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+from concurrent.futures import wait
+from config import MODULE_ACCESS, CHANGE_EVENTS_RETENTION_DAYS
+from database import (
+    schedule_job, claim_due_jobs, get_next_job_delay, get_module_reminder_targets,
+    finish_jobs, fail_interrupted_jobs, prune_change_events
+)
+from modules_content import MODULES
+from outbox import is_blocked_error
+
+logger = logging.getLogger(__name__)
+
+MODULE_REMINDER_TEXT = (
+    "⏰ Напоминание: модуль {module_id} «{title}» еще не завершен.\n\n"
+    "Продолжите обучение — откройте /modules и отметьте модуль пройденным, когда закончите."
+)
+
+
+class JobScheduler:
+    """Runs jobs from the persistent jobs table when they are due.
+
+    A background thread claims due jobs in batches with one indexed query,
+    runs each kind's handler on its whole batch and records the outcomes
+    in one transaction. It sleeps until the next job is due (at most
+    ``poll_interval``, so jobs added by other processes are noticed).
+    ``send(chat_id, text)`` must return a Future so a batch of messages is
+    queued at once and the rate limiter paces it.
+
+    Handlers take the claimed rows ``(id, kind, user_id, module_id,
+    payload)`` and return ``[(job_id, status, error), ...]``.
+    """
+
+    def __init__(self, send, batch_size=200, poll_interval=30.0, lease_seconds=600):
+        self.send = send
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.handlers = {
+            'module_reminder': self._run_module_reminders,
+            'prune_change_events': self._run_prune_change_events,
+        }
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def owner(self):
+        return f"{os.uname().nodename}-{os.getpid()}"
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        # Daily maintenance; the fixed key keeps a single row for all processes
+        schedule_job('prune_change_events', 'prune-change-events', 3600, interval_seconds=86400)
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='job-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            fail_interrupted_jobs()
+            jobs = claim_due_jobs(self.owner, self.lease_seconds, self.batch_size)
+            if jobs:
+                self._run_batch(jobs)
+                if len(jobs) == self.batch_size:
+                    continue
+
+            delay = get_next_job_delay()
+            timeout = self.poll_interval if delay is None else min(max(delay, 1), self.poll_interval)
+            self._stop.wait(timeout)
+
+    def _run_batch(self, jobs):
+        by_kind = {}
+        for job in jobs:
+            by_kind.setdefault(job[1], []).append(job)
+
+        results = []
+        for kind, batch in by_kind.items():
+            handler = self.handlers.get(kind)
+            if handler is None:
+                results.extend((job[0], 'failed', f"unknown job kind {kind}") for job in batch)
+                continue
+            try:
+                results.extend(handler(batch))
+            except Exception as e:
+                logger.error(f"Jobs of kind {kind} failed: {e}")
+                results.extend((job[0], 'failed', str(e)) for job in batch)
+
+        while not finish_jobs(results):
+            if self._stop.wait(1):
+                return
+
+    def _run_module_reminders(self, jobs):
+        targets = get_module_reminder_targets([job[0] for job in jobs])
+        if targets is None:
+            raise RuntimeError("reminder targets unavailable")
+
+        results = []
+        sends = []
+        for job in jobs:
+            target = targets.get(job[0])
+            user_id, module_id, tariff = target if target else (None, None, None)
+            # Completed, blocked or no longer in the user's tariff
+            if target is None or module_id not in MODULE_ACCESS.get((tariff or '').lower(), []):
+                results.append((job[0], 'skipped', None))
+                continue
+            text = MODULE_REMINDER_TEXT.format(
+                module_id=module_id, title=MODULES.get(module_id, f"Модуль {module_id}")
+            )
+            sends.append((job[0], self.send(user_id, text)))
+
+        wait([future for _, future in sends])
+        for job_id, future in sends:
+            error = future.exception()
+            if error is None:
+                results.append((job_id, 'done', None))
+            elif is_blocked_error(error):
+                results.append((job_id, 'blocked', str(error)))
+            else:
+                logger.warning(f"Reminder job {job_id} failed: {error}")
+                results.append((job_id, 'failed', str(error)))
+        return results
+
+    def _run_prune_change_events(self, jobs):
+        removed = prune_change_events(CHANGE_EVENTS_RETENTION_DAYS)
+        logger.info(f"Pruned {removed} change events")
+        return [(job[0], 'done', None) for job in jobs]
@@ -1,8 +1,57 @@
 from telebot import types
 from modules_content import MODULES
+from config import MODULE_ACCESS
+
+
+class FrozenMarkup(types.JsonSerializable):
+    """Prebuilt keyboard whose JSON is serialized once and shared.
+
+    telebot sends any JsonSerializable as ``to_json()``, so handlers can pass
+    it as reply_markup like a regular markup. It must not be modified.
+    """
+
+    def __init__(self, markup):
+        self._json = markup.to_json()
+
+    def to_json(self):
+        return self._json
+
+
+# Keyboards depend only on MODULES and the tariff's module list, so each
+# variant is built once. The module list is part of the cache key, so
+# MODULE_ACCESS changes need nothing; edits to MODULES are noticed by
+# comparing it with the copy the cache was built from (eight entries, far
+# cheaper than building a keyboard). invalidate_keyboard_cache() also
+# rebuilds the keyboards of the current MODULE_ACCESS right away.
+_keyboard_cache = {}
+_cached_modules = {}
+
+def _cached(key, build, *args):
+    if MODULES != _cached_modules:
+        _keyboard_cache.clear()
+        _cached_modules.clear()
+        _cached_modules.update(MODULES)
+    markup = _keyboard_cache.get(key)
+    if markup is None:
+        markup = FrozenMarkup(build(*args))
+        _keyboard_cache[key] = markup
+    return markup
+
+def invalidate_keyboard_cache():
+    _keyboard_cache.clear()
+    warm_keyboard_cache()
+
+def warm_keyboard_cache():
+    for available_modules in MODULE_ACCESS.values():
+        get_modules_keyboard(None, available_modules)
+        get_homework_keyboard(None, available_modules)
+    get_main_menu_keyboard()
 
 # Main menu keyboard
 def get_main_menu_keyboard():
+    return _cached('main_menu', _build_main_menu_keyboard)
+
+def _build_main_menu_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     buttons = [
         types.KeyboardButton('📚 Модули курса'),
@@ -18,12 +67,21 @@ def get_main_menu_keyboard():
 
 # Back to main menu button
 def get_back_keyboard():
+    return _cached('back', _build_back_keyboard)
+
+def _build_back_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add(types.KeyboardButton('↩️ Вернуться в главное меню'))
     return markup
 
 # Modules selection keyboard
 def get_modules_keyboard(user_tariff=None, available_modules=None):
+    if available_modules is None and user_tariff:
+        available_modules = MODULE_ACCESS.get(user_tariff.lower())
+    key = ('modules', tuple(available_modules) if available_modules else None)
+    return _cached(key, _build_modules_keyboard, available_modules)
+
+def _build_modules_keyboard(available_modules):
     markup = types.InlineKeyboardMarkup(row_width=2)
     
     if not available_modules:
@@ -53,6 +111,12 @@ def get_modules_keyboard(user_tariff=None, available_modules=None):
 
 # Homework selection keyboard
 def get_homework_keyboard(user_tariff=None, available_modules=None):
+    if available_modules is None and user_tariff:
+        available_modules = MODULE_ACCESS.get(user_tariff.lower())
+    key = ('homework', tuple(available_modules) if available_modules else None)
+    return _cached(key, _build_homework_keyboard, available_modules)
+
+def _build_homework_keyboard(available_modules):
     markup = types.InlineKeyboardMarkup(row_width=2)
     
     if not available_modules:
@@ -80,8 +144,18 @@ def get_homework_keyboard(user_tariff=None, available_modules=None):
     
     return markup
 
+# Per-module keyboards are cached only for known modules, so arbitrary ids
+# from callback data cannot grow the cache
+def _cached_for_module(kind, build, module_id):
+    if module_id not in MODULES:
+        return build(module_id)
+    return _cached((kind, module_id), build, module_id)
+
 # Module content keyboard
 def get_module_content_keyboard(module_id):
+    return _cached_for_module('module_content', _build_module_content_keyboard, module_id)
+
+def _build_module_content_keyboard(module_id):
     markup = types.InlineKeyboardMarkup(row_width=2)
     
     markup.add(
@@ -96,14 +170,29 @@ def get_module_content_keyboard(module_id):
     
     return markup
 
+# Back to modules list keyboard
+def get_back_to_modules_keyboard():
+    return _cached('back_to_modules', _build_back_to_modules_keyboard)
+
+def _build_back_to_modules_keyboard():
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("↩️ Назад к модулям", callback_data="back_to_modules"))
+    return markup
+
 # Access code request keyboard
 def get_access_keyboard():
+    return _cached('access', _build_access_keyboard)
+
+def _build_access_keyboard():
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton("Ввести код доступа", callback_data="enter_access_code"))
     return markup
 
 # Confirm homework submission keyboard
 def get_submit_homework_keyboard(module_id):
+    return _cached_for_module('submit_homework', _build_submit_homework_keyboard, module_id)
+
+def _build_submit_homework_keyboard(module_id):
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
         types.InlineKeyboardButton("✅ Отправить", callback_data=f"submit_homework_{module_id}"),
@@ -113,15 +202,24 @@ def get_submit_homework_keyboard(module_id):
 
 # Additional materials keyboard
 def get_additional_materials_keyboard(module_id):
+    return _cached_for_module('materials', _build_additional_materials_keyboard, module_id)
+
+def _build_additional_materials_keyboard(module_id):
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton("↩️ Назад к модулю", callback_data=f"module_{module_id}"))
     return markup
 
 # Feedback confirmation keyboard
 def get_feedback_confirm_keyboard():
+    return _cached('feedback_confirm', _build_feedback_confirm_keyboard)
+
+def _build_feedback_confirm_keyboard():
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
         types.InlineKeyboardButton("✅ Отправить", callback_data="submit_feedback"),
         types.InlineKeyboardButton("❌ Отмена", callback_data="cancel_feedback")
     )
     return markup
+
+
+warm_keyboard_cache()
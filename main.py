@@ -1,7 +1,10 @@
 import logging
 import os
-from bot import bot
+import threading
+from bot import bot, setup_webhook, shutdown_bot, start_background_workers, update_worker
 from app import app  # Import app from app.py for Flask web application
+from database import write_queue
+from config import BOT_MODE, BOT_RUNTIME
 
 # This file serves dual purpose: it can start the bot directly (run_telegram_bot workflow)
 # or expose app for gunicorn (Start application workflow)
@@ -11,7 +14,34 @@ if __name__ == "__main__":
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    logging.info("Starting bot...")
-    
-    # Initialize and start the bot
-    bot.polling(none_stop=True, interval=0)
+    if BOT_RUNTIME == 'aiogram':
+        import asyncio
+        from async_bot import run_polling
+
+        try:
+            asyncio.run(run_polling())
+        finally:
+            write_queue.shutdown()
+    elif BOT_MODE == 'webhook':
+        # The gunicorn workers queue updates from the /telegram/webhook route;
+        # this process handles them and does all the sending
+        setup_webhook()
+        start_background_workers()
+        update_worker.start()
+        try:
+            threading.Event().wait()
+        finally:
+            shutdown_bot()
+            write_queue.shutdown()
+    else:
+        logging.info("Starting bot...")
+
+        # Initialize and start the bot
+        bot.remove_webhook()
+        start_background_workers()
+        try:
+            bot.polling(none_stop=True, interval=0)
+        finally:
+            # Drain accepted updates, then commit queued submissions/progress
+            shutdown_bot()
+            write_queue.shutdown()
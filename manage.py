@@ -0,0 +1,89 @@
+import argparse
+import sqlite3
+import sys
+from config import MODULE_ACCESS, BULK_CODES_MAX, CHANGE_EVENTS_RETENTION_DAYS
+from database import (generate_access_codes, iter_access_code_batch, normalize_expires_at,
+                      EXPORTS, iter_export, prune_change_events)
+from exports import iter_csv, FORMATS
+
+# Administrative commands, e.g.:
+#   python manage.py generate-codes --tariff basic --count 50000 --output basic.csv
+#   python manage.py export submissions --format jsonl --output submissions.jsonl
+#   python manage.py prune-changes --days 30
+
+
+def generate_codes(args):
+    if args.count < 1 or args.count > BULK_CODES_MAX:
+        sys.exit(f"--count must be between 1 and {BULK_CODES_MAX}")
+
+    try:
+        expires_at = normalize_expires_at(args.expires_at)
+    except ValueError as e:
+        sys.exit(f"--expires-at: {e}")
+
+    batch_id = generate_access_codes(args.tariff, args.count, args.prefix, args.max_uses, expires_at)
+    if not batch_id:
+        sys.exit("Failed to generate access codes")
+
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in iter_csv(['code', 'tariff', 'max_uses', 'expires_at'], iter_access_code_batch(batch_id)):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"Generated {args.count} codes in batch {batch_id}", file=sys.stderr)
+
+
+def export(args):
+    writer = FORMATS[args.format][0]
+    rows = iter_export(args.name, args.tariff, args.date_from, args.date_to)
+
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in writer(EXPORTS[args.name][0], rows):
+            out.write(chunk)
+    except sqlite3.Error as e:
+        sys.exit(f"Export failed, the output is incomplete: {e}")
+    finally:
+        if args.output:
+            out.close()
+
+
+def prune_changes(args):
+    removed = prune_change_events(args.days)
+    print(f"Removed {removed} change events older than {args.days} days", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Course bot administration")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate-codes', help="Bulk-create unique access codes as CSV")
+    generate.add_argument('--tariff', required=True, choices=sorted(MODULE_ACCESS))
+    generate.add_argument('--count', required=True, type=int)
+    generate.add_argument('--prefix', default='')
+    generate.add_argument('--max-uses', type=int, default=1)
+    generate.add_argument('--expires-at', default=None, help="e.g. '2025-12-31 23:59:59'")
+    generate.add_argument('--output', help="CSV file to write (default: stdout)")
+    generate.set_defaults(func=generate_codes)
+
+    dump = commands.add_parser('export', help="Stream a table joined with user names as CSV or JSONL")
+    dump.add_argument('name', choices=sorted(EXPORTS))
+    dump.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    dump.add_argument('--tariff', choices=sorted(MODULE_ACCESS))
+    dump.add_argument('--date-from', help="YYYY-MM-DD, inclusive")
+    dump.add_argument('--date-to', help="YYYY-MM-DD, inclusive")
+    dump.add_argument('--output', help="File to write (default: stdout)")
+    dump.set_defaults(func=export)
+
+    prune = commands.add_parser('prune-changes', help="Delete old mini-app change events")
+    prune.add_argument('--days', type=int, default=CHANGE_EVENTS_RETENTION_DAYS)
+    prune.set_defaults(func=prune_changes)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
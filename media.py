@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from outbox import classify_error
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def media_path(media_root, sha256):
+    """Location of a stored file: <root>/ab/cd/abcd..."""
+    return os.path.join(media_root, sha256[:2], sha256[2:4], sha256)
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+def describe_error(error):
+    """Error text that is safe to log and store.
+
+    Download and API URLs contain the bot token, and requests puts the URL
+    into its messages, so only the status or the error class is kept.
+    """
+    if isinstance(error, requests.RequestException):
+        if error.response is not None:
+            return f"HTTP {error.response.status_code} {error.response.reason}"
+        return type(error).__name__
+    return str(error)
+
+
+class MediaDownloader:
+    """Downloads homework attachments into content-addressed storage.
+
+    Submissions only record the Telegram file_id; this worker claims
+    pending rows of submission_files with a lease (like the outbox, so
+    several processes can run it) and downloads them on a pool of
+    ``workers`` threads, never claiming more rows than it has threads.
+    Each file is streamed to a temporary file while it is hashed and then
+    moved to ``media_path(sha256)``; if that path already exists the copy
+    is dropped, so identical files are stored once. ``resolve_url(file_id)``
+    returns the download URL (it calls getFile).
+    """
+
+    def __init__(self, resolve_url, connection_factory, media_root, workers=2,
+                 poll_interval=5.0, lease_seconds=300, max_attempts=5, max_bytes=20 * 1024 * 1024,
+                 timeout=60, backoff_base=30):
+        self.resolve_url = resolve_url
+        self.connection_factory = connection_factory
+        self.media_root = media_root
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._executor = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        os.makedirs(os.path.join(self.media_root, 'tmp'), exist_ok=True)
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='media')
+        self._thread = threading.Thread(target=self._run, name='media-downloader', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+            self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming media downloads: {e}")
+                batch = []
+            # Wait for the whole batch so at most `workers` files are in flight
+            list(self._executor.map(lambda row: self._download(*row), batch))
+            if len(batch) < self.workers:
+                self._stop.wait(self.poll_interval)
+
+    def _claim(self):
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE submission_files SET locked_until = datetime('now', ?), attempts = attempts + 1 "
+                "WHERE id IN (SELECT id FROM submission_files WHERE status = 'pending' "
+                "AND (locked_until IS NULL OR locked_until < datetime('now')) ORDER BY id LIMIT ?) "
+                "RETURNING id, file_id, attempts",
+                (f'+{self.lease_seconds} seconds', self.workers)
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+            return sorted(rows)
+
+    def _download(self, file_row_id, file_id, attempts):
+        try:
+            sha256, size = self._fetch(self.resolve_url(file_id))
+        except Exception as e:
+            permanent, retry_after = classify_error(e)
+            error = describe_error(e)
+            if isinstance(e, FileTooLarge):
+                permanent = True
+            if permanent or attempts >= self.max_attempts:
+                logger.error(f"Download of submission file {file_row_id} failed: {error}")
+                self._update(
+                    "UPDATE submission_files SET status = 'failed', last_error = ?, "
+                    "locked_until = NULL WHERE id = ?",
+                    (error, file_row_id)
+                )
+            else:
+                delay = retry_after or self.backoff_base * 2 ** (attempts - 1)
+                logger.warning(f"Download of submission file {file_row_id} retry in {delay}s: {error}")
+                # The lease doubles as "not before" for the next attempt
+                self._update(
+                    "UPDATE submission_files SET last_error = ?, locked_until = datetime('now', ?) "
+                    "WHERE id = ?",
+                    (error, f'+{int(delay)} seconds', file_row_id)
+                )
+            return
+
+        self._update(
+            "UPDATE submission_files SET status = 'stored', sha256 = ?, file_size = ?, "
+            "last_error = NULL, locked_until = NULL WHERE id = ?",
+            (sha256, size, file_row_id)
+        )
+
+    def _fetch(self, url):
+        """Stream url into storage; returns (sha256, size)"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.media_root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as tmp, \
+                    requests.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise FileTooLarge(f"file is larger than {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            sha256 = digest.hexdigest()
+            path = media_path(self.media_root, sha256)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return sha256, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _update(self, sql, params):
+        try:
+            with self.connection_factory() as conn:
+                conn.execute(sql, params)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error updating submission file: {e}")
@@ -0,0 +1,440 @@
+import logging
+import sqlite3
+import json
+from config import ACCESS_CODES, MODULE_ACCESS
+
+logger = logging.getLogger(__name__)
+
+def _seed_access_codes(cursor):
+    # Codes from config.py were reusable, so they stay unlimited
+    cursor.executemany(
+        "INSERT OR IGNORE INTO access_codes (code, tariff) VALUES (?, ?)",
+        [(code, tariff) for tariff, codes in ACCESS_CODES.items() for code in codes]
+    )
+
+
+def _backfill_user_summary(cursor):
+    cursor.execute("SELECT user_id, tariff FROM users")
+    users = cursor.fetchall()
+    for user_id, tariff in users:
+        cursor.execute(
+            "SELECT module_id FROM module_progress WHERE user_id = ? AND completed = 1",
+            (user_id,)
+        )
+        completed = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT module_id, COUNT(*), MAX(submitted_date) FROM homework_submissions "
+            "WHERE user_id = ? GROUP BY module_id",
+            (user_id,)
+        )
+        submissions = cursor.fetchall()
+
+        mask = 0
+        for module_id in completed:
+            mask |= 1 << module_id
+        available = MODULE_ACCESS.get((tariff or '').lower(), [])
+        percentage = round(len(completed) / len(available) * 100) if available else 0
+        counts = {str(module_id): count for module_id, count, _ in submissions}
+        last_activity = max((last for _, _, last in submissions), default=None)
+        cursor.execute(
+            "INSERT OR REPLACE INTO user_summary "
+            "(user_id, completed_mask, completed_count, percentage, submission_counts, last_activity) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, mask, len(completed), percentage, json.dumps(counts), last_activity)
+        )
+
+
+# Ordered schema migrations: (version, description, steps).
+# A step is either an SQL string or a callable taking a cursor. Every
+# migration runs in its own transaction and is recorded in schema_version,
+# so new schema changes are rolled out by appending to this list.
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            tariff TEXT,
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            message TEXT,
+            sent_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        );
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS module_progress (
+            user_id INTEGER,
+            module_id INTEGER,
+            completed BOOLEAN DEFAULT 0,
+            completion_date TIMESTAMP,
+            PRIMARY KEY (user_id, module_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        );
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS homework_submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            module_id INTEGER,
+            submission TEXT,
+            submitted_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            feedback TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        );
+        ''',
+    ]),
+    (2, 'hot-path indexes', [
+        # get_homework_submissions and the per-module submission counts
+        '''
+        CREATE INDEX IF NOT EXISTS idx_homework_submissions_user_module
+        ON homework_submissions (user_id, module_id, submitted_date);
+        ''',
+        # Admin /submissions page, newest first
+        '''
+        CREATE INDEX IF NOT EXISTS idx_homework_submissions_submitted
+        ON homework_submissions (submitted_date);
+        ''',
+        # Per-user feedback history on the admin user page
+        '''
+        CREATE INDEX IF NOT EXISTS idx_feedback_user_sent
+        ON feedback (user_id, sent_date);
+        ''',
+        # Admin /feedback page, newest first
+        '''
+        CREATE INDEX IF NOT EXISTS idx_feedback_sent
+        ON feedback (sent_date);
+        ''',
+        # Admin /users page, newest first
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_registration
+        ON users (registration_date);
+        ''',
+        # Covers get_module_progress without touching the table
+        '''
+        CREATE INDEX IF NOT EXISTS idx_module_progress_user
+        ON module_progress (user_id, module_id, completed);
+        ''',
+    ]),
+    (3, 'conversation state store', [
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            namespace TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (namespace, user_id)
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_conversation_state_expires
+        ON conversation_state (namespace, expires_at);
+        ''',
+    ]),
+    (4, 'access code registry', [
+        '''
+        CREATE TABLE IF NOT EXISTS access_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT NOT NULL,
+            tariff TEXT NOT NULL,
+            max_uses INTEGER,
+            uses INTEGER NOT NULL DEFAULT 0,
+            expires_at TIMESTAMP,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_access_codes_code
+        ON access_codes (code);
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_access_codes_tariff
+        ON access_codes (tariff, id);
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS access_code_redemptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            tariff TEXT NOT NULL,
+            redeemed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (code_id) REFERENCES access_codes (id)
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_access_code_redemptions_code
+        ON access_code_redemptions (code_id);
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_access_code_redemptions_user
+        ON access_code_redemptions (user_id);
+        ''',
+        _seed_access_codes,
+    ]),
+    (5, 'access code batches', [
+        'ALTER TABLE access_codes ADD COLUMN batch_id TEXT;',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_access_codes_batch
+        ON access_codes (batch_id, id);
+        ''',
+    ]),
+    (6, 'admin list filter indexes', [
+        # /users?tariff=...
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_tariff_registration
+        ON users (tariff, registration_date);
+        ''',
+        # /submissions?module_id=...
+        '''
+        CREATE INDEX IF NOT EXISTS idx_homework_submissions_module_submitted
+        ON homework_submissions (module_id, submitted_date);
+        ''',
+    ]),
+    (7, 'per-user summary for the mini-app', [
+        # completed_mask has bit (1 << module_id) set for every completed
+        # module; submission_counts is a JSON object {module_id: count}
+        '''
+        CREATE TABLE IF NOT EXISTS user_summary (
+            user_id INTEGER PRIMARY KEY,
+            completed_mask INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            percentage INTEGER NOT NULL DEFAULT 0,
+            submission_counts TEXT NOT NULL DEFAULT '{}',
+            last_activity TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        );
+        ''',
+        _backfill_user_summary,
+    ]),
+    (8, 'user summary version stamp', [
+        # Bumped on every summary change; the mini-app API derives its
+        # ETag/Last-Modified from these two columns
+        "ALTER TABLE user_summary ADD COLUMN version INTEGER NOT NULL DEFAULT 0;",
+        "ALTER TABLE user_summary ADD COLUMN updated_at TIMESTAMP;",
+    ]),
+    (9, 'per-user change log', [
+        # One row per user-visible change, stamped with the user_summary
+        # version it produced; tailed by the live-update feed
+        '''
+        CREATE TABLE IF NOT EXISTS change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            module_id INTEGER,
+            ref_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_change_events_user_version
+        ON change_events (user_id, version);
+        ''',
+    ]),
+    (10, 'change log retention index', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_change_events_created
+        ON change_events (created_at);
+        ''',
+    ]),
+    (11, 'curator review queue', [
+        "ALTER TABLE homework_submissions ADD COLUMN claimed_by TEXT;",
+        "ALTER TABLE homework_submissions ADD COLUMN claimed_until TIMESTAMP;",
+        "ALTER TABLE homework_submissions ADD COLUMN reviewed_at TIMESTAMP;",
+        # Only submissions still awaiting feedback are indexed, so the queue
+        # index stays as small as the backlog rather than the whole history
+        '''
+        CREATE INDEX IF NOT EXISTS idx_homework_submissions_pending
+        ON homework_submissions (submitted_date, id) WHERE feedback IS NULL;
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_homework_submissions_pending_module
+        ON homework_submissions (module_id, submitted_date, id) WHERE feedback IS NULL;
+        ''',
+    ]),
+    (12, 'notification outbox', [
+        # Messages for students written by the web app and delivered by the
+        # bot; idempotency_key makes a repeated enqueue a no-op
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            chat_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            locked_until TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox (next_attempt_at, id) WHERE status = 'pending';
+        ''',
+    ]),
+    (13, 'resumable broadcasts', [
+        # Set when Telegram reports the user blocked the bot; such users are
+        # skipped by broadcasts until they /start the bot again
+        "ALTER TABLE users ADD COLUMN blocked_at TIMESTAMP;",
+        # last_user_id is the checkpoint: recipients are streamed in user_id
+        # order and everything up to it has been sent
+        '''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            tariff TEXT,
+            min_completed INTEGER,
+            max_completed INTEGER,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            locked_by TEXT,
+            locked_until TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_broadcasts_running
+        ON broadcasts (id) WHERE status = 'running';
+        ''',
+    ]),
+    (14, 'scheduled jobs', [
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            job_key TEXT NOT NULL UNIQUE,
+            user_id INTEGER,
+            module_id INTEGER,
+            payload TEXT,
+            due_at TIMESTAMP NOT NULL,
+            interval_seconds INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            locked_by TEXT,
+            locked_until TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_jobs_due
+        ON jobs (due_at, id) WHERE status = 'pending';
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_jobs_running
+        ON jobs (locked_until) WHERE status = 'running';
+        ''',
+    ]),
+    (15, 'homework attachments', [
+        '''
+        CREATE TABLE IF NOT EXISTS submission_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL UNIQUE,
+            file_type TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT NOT NULL,
+            file_name TEXT,
+            mime_type TEXT,
+            file_size INTEGER,
+            sha256 TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            locked_until TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (submission_id) REFERENCES homework_submissions (id)
+        );
+        ''',
+        # Download queue
+        '''
+        CREATE INDEX IF NOT EXISTS idx_submission_files_pending
+        ON submission_files (id) WHERE status = 'pending';
+        ''',
+        # The same Telegram file sent again is not downloaded twice
+        '''
+        CREATE INDEX IF NOT EXISTS idx_submission_files_unique
+        ON submission_files (file_unique_id) WHERE status = 'stored';
+        ''',
+    ]),
+    (16, 'webhook update queue', [
+        # Keyed by update_id, so Telegram's redeliveries are stored once
+        '''
+        CREATE TABLE IF NOT EXISTS telegram_updates (
+            update_id INTEGER PRIMARY KEY,
+            payload TEXT NOT NULL,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ''',
+    ]),
+]
+
+
+def get_schema_version(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "description TEXT, "
+        "applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def run_migrations(conn, migrations=MIGRATIONS):
+    """Apply every migration newer than the recorded schema version.
+
+    Returns the schema version after the run.
+    """
+    current = get_schema_version(conn)
+    cursor = conn.cursor()
+
+    for version, description, steps in sorted(migrations, key=lambda m: m[0]):
+        if version <= current:
+            continue
+
+        # BEGIN IMMEDIATE serializes the bot and web processes starting at once
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+            if cursor.fetchone():
+                conn.rollback()
+                current = version
+                continue
+
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            logger.error(f"Migration {version} ({description}) failed")
+            raise
+
+        logger.info(f"Applied migration {version}: {description}")
+        current = version
+
+    return current
@@ -0,0 +1,290 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from outbox import classify_error
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, served strictly in this order
+INTERACTIVE = 0  # Replies to the user who is waiting on the other end
+NOTIFY = 1       # Notifications to admins and students
+BULK = 2         # Broadcasts and other mass sends
+LANE_NAMES = ('interactive', 'notify', 'bulk')
+
+# How many queued jobs of a lane are inspected for a chat that may send now
+SCAN_LIMIT = 64
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def idle(self, now):
+        return now >= self.blocked_until and self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('chat_id', 'fn', 'args', 'kwargs', 'lane', 'future', 'enqueued', 'retries')
+
+    def __init__(self, chat_id, fn, args, kwargs, lane):
+        self.chat_id = chat_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.lane = lane
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.retries = 0
+
+
+class OutboundScheduler:
+    """Schedules Bot API calls within Telegram's flood limits.
+
+    Every call is queued in a priority lane and released by one scheduler
+    thread when both the global token bucket (``global_rate`` per second,
+    bursts of ``global_burst``) and the chat's bucket allow it: ``chat_rate`` per second with bursts of
+    ``chat_burst`` for private chats, ``group_rate`` for groups. A chat
+    never has two calls in flight, so messages to one chat keep their
+    order. Calls run on a small pool; on 429 the chat is paused for
+    retry_after and the call is re-queued at the head of its lane.
+
+    The buckets live in this process only, so exactly one process may send
+    for the bot: main.py, in both polling and webhook mode (the web
+    workers only queue webhook updates for it).
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1.0, chat_burst=3, group_rate=20 / 60,
+                 workers=4, max_retries=3, max_bulk_queue=10000, max_chats=50000, global_burst=3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_bulk_queue = max_bulk_queue
+        self.max_chats = max_chats
+        self._lanes = tuple(deque() for _ in LANE_NAMES)
+        # A small global burst keeps any one-second window close to global_rate
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._chats = {}
+        self._in_flight = set()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='outbound')
+        self._thread = None
+        self._closed = False
+        self._metrics = {
+            'sent': 0,
+            'failed': 0,
+            'rate_limited': 0,
+            'wait_avg': [0.0] * len(LANE_NAMES),
+            'wait_max': [0.0] * len(LANE_NAMES),
+        }
+
+    def submit(self, chat_id, fn, *args, lane=INTERACTIVE, **kwargs):
+        """Queue ``fn(*args, **kwargs)`` for ``chat_id``; returns a Future."""
+        job = _Job(chat_id, fn, args, kwargs, lane)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Outbound scheduler is shut down")
+            # Bulk producers are slowed down instead of growing the queue
+            while lane == BULK and len(self._lanes[BULK]) >= self.max_bulk_queue:
+                self._cond.wait()
+            self._lanes[lane].append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='outbound-scheduler', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return job.future
+
+    def call(self, chat_id, fn, *args, lane=INTERACTIVE, **kwargs):
+        """Queue a call and wait for its result (or exception)."""
+        return self.submit(chat_id, fn, *args, lane=lane, **kwargs).result()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'sent': self._metrics['sent'],
+                'failed': self._metrics['failed'],
+                'rate_limited': self._metrics['rate_limited'],
+                'in_flight': len(self._in_flight),
+                'chats_tracked': len(self._chats),
+                'lanes': {
+                    name: {
+                        'queued': len(self._lanes[lane]),
+                        'wait_avg_ms': round(self._metrics['wait_avg'][lane] * 1000, 1),
+                        'wait_max_ms': round(self._metrics['wait_max'][lane] * 1000, 1),
+                    }
+                    for lane, name in enumerate(LANE_NAMES)
+                },
+            }
+
+    def shutdown(self, timeout=30):
+        """Send what is queued, then stop."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._closed = True
+            while (any(self._lanes) or self._in_flight) and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            self._cond.notify_all()
+        self._executor.shutdown(wait=False)
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id is not None and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1, now)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _next_job(self, now):
+        """Pop the first job allowed to run now; otherwise return how long to wait."""
+        global_delay = self._global.delay(now)
+        if global_delay:
+            return None, global_delay
+
+        wait = None
+        for lane in self._lanes:
+            for index, job in enumerate(lane):
+                if index >= SCAN_LIMIT:
+                    break
+                if job.chat_id in self._in_flight:
+                    continue
+                delay = self._chat_bucket(job.chat_id, now).delay(now)
+                if delay:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+                del lane[index]
+                return job, None
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not any(self._lanes):
+                        return
+                    now = time.monotonic()
+                    job, wait = self._next_job(now)
+                    if job is not None:
+                        break
+                    self._cond.wait(wait)
+                self._global.take()
+                self._chat_bucket(job.chat_id, now).take()
+                self._in_flight.add(job.chat_id)
+                waited = now - job.enqueued
+                averages, maxima = self._metrics['wait_avg'], self._metrics['wait_max']
+                averages[job.lane] += (waited - averages[job.lane]) * 0.1
+                maxima[job.lane] = max(maxima[job.lane], waited)
+                if job.lane == BULK:
+                    self._cond.notify_all()
+            try:
+                self._executor.submit(self._execute, job)
+            except RuntimeError as e:
+                # The pool is gone (interpreter exit); fail what is left
+                job.future.set_exception(e)
+                return
+
+    def _execute(self, job):
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except Exception as e:
+            _, retry_after = classify_error(e)
+            with self._cond:
+                self._in_flight.discard(job.chat_id)
+                if retry_after is not None and job.retries < self.max_retries:
+                    # Flood control: pause this chat and retry first in line
+                    self._metrics['rate_limited'] += 1
+                    self._chat_bucket(job.chat_id, time.monotonic()).blocked_until = \
+                        time.monotonic() + retry_after
+                    job.retries += 1
+                    self._lanes[job.lane].appendleft(job)
+                    logger.warning(f"Rate limited sending to {job.chat_id}, retry in {retry_after}s")
+                    self._cond.notify_all()
+                    return
+                self._metrics['failed'] += 1
+                self._cond.notify_all()
+            job.future.set_exception(e)
+            return
+
+        with self._cond:
+            self._in_flight.discard(job.chat_id)
+            self._metrics['sent'] += 1
+            if len(self._chats) > self.max_chats:
+                self._forget_idle_chats()
+            self._cond.notify_all()
+        job.future.set_result(result)
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items()
+                        if chat_id not in self._in_flight and bucket.idle(now)]:
+            del self._chats[chat_id]
+
+
+class RateLimitedBot:
+    """TeleBot proxy that routes outgoing messages through the scheduler.
+
+    Sends and edits go through ``OutboundScheduler`` in the proxy's lane
+    and, by default, block until Telegram answered so handlers still get
+    the Message back. ``lane(BULK, wait=False)`` returns a proxy that
+    queues and returns a Future instead. Everything else (handler
+    decorators, answer_callback_query, ...) goes straight to the bot.
+    """
+
+    # Method name -> position of chat_id in the positional arguments
+    SCHEDULED = {
+        'send_message': 0,
+        'send_photo': 0,
+        'send_document': 0,
+        'send_voice': 0,
+        'copy_message': 0,
+        'forward_message': 0,
+        'edit_message_text': 1,
+        'edit_message_reply_markup': 0,
+    }
+
+    def __init__(self, bot, scheduler, lane=INTERACTIVE, wait=True):
+        self._bot = bot
+        self._scheduler = scheduler
+        self._lane = lane
+        self._wait = wait
+
+    def lane(self, lane, wait=True):
+        return RateLimitedBot(self._bot, self._scheduler, lane, wait)
+
+    def outbound_stats(self):
+        return self._scheduler.stats()
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        if name not in self.SCHEDULED:
+            return attr
+
+        position = self.SCHEDULED[name]
+
+        def scheduled(*args, **kwargs):
+            chat_id = kwargs.get('chat_id', args[position] if len(args) > position else None)
+            future = self._scheduler.submit(chat_id, attr, *args, lane=self._lane, **kwargs)
+            return future.result() if self._wait else future
+
+        return scheduled
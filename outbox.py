@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def classify_error(error):
+    """Return (permanent, retry_after) for a failed send.
+
+    Works with both telebot's ApiTelegramException (error_code and
+    result_json) and aiogram's exceptions (retry_after, class names).
+    """
+    retry_after = getattr(error, 'retry_after', None)
+    result = getattr(error, 'result_json', None) or {}
+    if retry_after is None:
+        retry_after = (result.get('parameters') or {}).get('retry_after')
+    if retry_after is not None:
+        return False, int(retry_after)
+
+    error_code = getattr(error, 'error_code', None)
+    name = type(error).__name__
+    # Blocked by the user, deleted account, chat not found: retrying won't help
+    if error_code in (400, 403) or 'Forbidden' in name or 'BadRequest' in name:
+        return True, None
+    return False, None
+
+
+def is_blocked_error(error):
+    """True if the user blocked the bot or deleted the account (403)."""
+    return getattr(error, 'error_code', None) == 403 or 'Forbidden' in type(error).__name__
+
+
+class OutboxWorker:
+    """Delivers queued outbox messages through the bot.
+
+    A background thread claims a batch of due rows with a short lease (so
+    several bot processes can run workers without double-sending), sends
+    them with ``send(chat_id, text)`` and marks each one sent. Failures
+    are retried with exponential backoff, or after Telegram's retry_after
+    on 429; permanent errors and rows out of attempts are marked failed.
+    Delivery is at-least-once: a crash between sending and marking a row
+    can repeat that one message, while the idempotency key keeps the same
+    notification from being queued twice.
+    """
+
+    def __init__(self, send, connection_factory, batch_size=50, poll_interval=2.0,
+                 lease_seconds=60, max_attempts=8, backoff_base=5, backoff_max=3600):
+        self.send = send
+        self.connection_factory = connection_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming outbox messages: {e}")
+                batch = []
+            for row in batch:
+                if self._stop.is_set():
+                    break
+                self._deliver(*row)
+            if len(batch) < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def _claim(self):
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE outbox SET locked_until = datetime('now', ?), attempts = attempts + 1 "
+                "WHERE id IN (SELECT id FROM outbox WHERE status = 'pending' "
+                "AND next_attempt_at <= datetime('now') "
+                "AND (locked_until IS NULL OR locked_until < datetime('now')) "
+                "ORDER BY next_attempt_at, id LIMIT ?) "
+                "RETURNING id, chat_id, payload, attempts",
+                (f'+{self.lease_seconds} seconds', self.batch_size)
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+            return sorted(rows)
+
+    def _deliver(self, outbox_id, chat_id, payload, attempts):
+        try:
+            self.send(chat_id, json.loads(payload)['text'])
+        except Exception as e:
+            permanent, retry_after = classify_error(e)
+            if permanent or attempts >= self.max_attempts:
+                logger.error(f"Outbox message {outbox_id} to {chat_id} failed: {e}")
+                self._finish(outbox_id, 'failed', str(e))
+            else:
+                delay = retry_after or min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+                logger.warning(f"Outbox message {outbox_id} to {chat_id} retry in {delay}s: {e}")
+                self._retry(outbox_id, delay, str(e))
+            return
+        self._finish(outbox_id, 'sent')
+
+    def _finish(self, outbox_id, status, error=None):
+        self._update(
+            "UPDATE outbox SET status = ?, last_error = ?, locked_until = NULL, "
+            "sent_at = CASE WHEN ? = 'sent' THEN CURRENT_TIMESTAMP END WHERE id = ?",
+            (status, error, status, outbox_id)
+        )
+
+    def _retry(self, outbox_id, delay, error):
+        self._update(
+            "UPDATE outbox SET next_attempt_at = datetime('now', ?), last_error = ?, "
+            "locked_until = NULL WHERE id = ?",
+            (f'+{int(delay)} seconds', error, outbox_id)
+        )
+
+    def _update(self, sql, params):
+        try:
+            with self.connection_factory() as conn:
+                conn.execute(sql, params)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error updating outbox: {e}")
@@ -0,0 +1,153 @@
+import logging
+import os
+import queue
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Queue of change events for one connected client.
+
+    ``get`` returns an event dict, raises ``queue.Empty`` on timeout, or
+    returns None once the feed dropped the subscriber (it fell too far
+    behind), after which the client is expected to reconnect.
+    """
+
+    def __init__(self, user_id, max_pending):
+        self.user_id = user_id
+        self._queue = queue.Queue(max_pending)
+        self.closed = False
+
+    def get(self, timeout):
+        if self.closed:
+            return None
+        return self._queue.get(timeout=timeout)
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.closed = True
+
+
+class ChangeFeed:
+    """Per-process fan-out of the change_events table to live subscribers.
+
+    Writes from every process (bot, gunicorn workers) append to
+    change_events inside their own transactions. One tailer thread per
+    process reads rows past the last seen id and hands them to the
+    subscribers of that user. Local commits call ``wake()`` so they are
+    pushed immediately; writes from other processes are picked up within
+    ``poll_interval`` seconds. The thread only runs while someone listens.
+    """
+
+    def __init__(self, connection_factory, poll_interval=1.0, max_subscribers=1000,
+                 max_per_user=3, max_pending=100):
+        self.connection_factory = connection_factory
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self.max_per_user = max_per_user
+        self.max_pending = max_pending
+        self._subscribers = defaultdict(set)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._last_id = 0
+
+    def subscribe(self, user_id):
+        """Register a listener; returns None if the connection limits are reached."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Subscribers and the tailer thread do not survive fork
+                self._subscribers = defaultdict(set)
+                self._count = 0
+                self._thread = None
+                self._pid = os.getpid()
+            if self._count >= self.max_subscribers:
+                return None
+            if len(self._subscribers.get(user_id, ())) >= self.max_per_user:
+                return None
+            subscription = Subscription(user_id, self.max_pending)
+            self._subscribers[user_id].add(subscription)
+            self._count += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._last_id = self._max_id()
+                self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+                self._thread.start()
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            listeners = self._subscribers.get(subscription.user_id)
+            if listeners and subscription in listeners:
+                listeners.discard(subscription)
+                self._count -= 1
+                if not listeners:
+                    del self._subscribers[subscription.user_id]
+
+    def wake(self):
+        """Called after a local commit that appended change events."""
+        self._wakeup.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': self._count,
+                'users': len(self._subscribers),
+                'max_subscribers': self.max_subscribers,
+                'last_event_id': self._last_id,
+            }
+
+    def _max_id(self):
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_events")
+            return cursor.fetchone()[0]
+
+    def _fetch(self):
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, user_id, version, kind, module_id, ref_id, created_at "
+                "FROM change_events WHERE id > ? ORDER BY id LIMIT 500",
+                (self._last_id,)
+            )
+            return cursor.fetchall()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._count:
+                    # Last listener left; the next subscribe restarts the thread
+                    self._thread = None
+                    return
+            try:
+                rows = self._fetch()
+                while rows:
+                    self._publish(rows)
+                    self._last_id = rows[-1][0]
+                    rows = self._fetch() if len(rows) == 500 else []
+            except Exception as e:
+                logger.error(f"Change feed error: {e}")
+
+    def _publish(self, rows):
+        with self._lock:
+            for event_id, user_id, version, kind, module_id, ref_id, created_at in rows:
+                listeners = self._subscribers.get(user_id)
+                if not listeners:
+                    continue
+                event = {
+                    'version': version,
+                    'kind': kind,
+                    'module_id': module_id,
+                    'ref_id': ref_id,
+                    'created_at': created_at,
+                }
+                for subscription in listeners:
+                    subscription._put(event)
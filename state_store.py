@@ -0,0 +1,209 @@
+import asyncio
+import copy
+import json
+import logging
+import threading
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from config import STATE_STORE, STATE_TTL, STATE_MAX_SIZE, STATE_EXPIRY_INTERVAL
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore(MutableMapping):
+    """Per-user conversation state with a time-to-live.
+
+    Behaves like the plain dicts the handlers used before (``get``, ``pop``,
+    item assignment), so stores are interchangeable. Every store hands out
+    and keeps copies of the values, so they are never mutated in place:
+    read, modify and assign back. Every write refreshes the entry's TTL.
+
+    ``aget``/``aset``/``apop`` are the same operations for asyncio code:
+    they run in a thread, so a store that does I/O never blocks the
+    event loop. The memory store answers them directly.
+    """
+
+    def __init__(self, ttl=STATE_TTL):
+        self.ttl = ttl
+        self._expiry_thread = None
+
+    async def aget(self, key, default=None):
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key, value):
+        await asyncio.to_thread(self.__setitem__, key, value)
+
+    async def apop(self, key, default=None):
+        return await asyncio.to_thread(self.pop, key, default)
+
+    @abstractmethod
+    def expire(self):
+        """Drop expired entries; returns how many were removed."""
+
+    def start_expiry(self, interval=STATE_EXPIRY_INTERVAL):
+        """Run expire() every ``interval`` seconds on a daemon thread."""
+        if self._expiry_thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    removed = self.expire()
+                    if removed:
+                        logger.info(f"Expired {removed} stale conversation states")
+                except Exception as e:
+                    logger.error(f"Error expiring conversation states: {e}")
+
+        self._expiry_thread = threading.Thread(target=run, name='state-expiry', daemon=True)
+        self._expiry_thread.start()
+
+
+def _copy(value):
+    # States are plain strings; drafts are small dicts
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return copy.deepcopy(value)
+
+
+class MemoryStateStore(StateStore):
+    """In-process store with TTL eviction and an LRU size cap."""
+
+    def __init__(self, ttl=STATE_TTL, max_size=STATE_MAX_SIZE):
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            value, expires_at = self._data[key]
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                raise KeyError(key)
+            return _copy(value)
+
+    def __setitem__(self, key, value):
+        value = _copy(value)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+
+    def __iter__(self):
+        now = time.monotonic()
+        with self._lock:
+            return iter([key for key, (_, expires_at) in self._data.items() if expires_at > now])
+
+    def __len__(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for _, expires_at in self._data.values() if expires_at > now)
+
+    # Nothing here blocks, so skip the thread hop
+    async def aget(self, key, default=None):
+        return self.get(key, default)
+
+    async def aset(self, key, value):
+        self[key] = value
+
+    async def apop(self, key, default=None):
+        return self.pop(key, default)
+
+    def expire(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = [key for key, (_, expires_at) in self._data.items() if expires_at <= now]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+
+class SQLiteStateStore(StateStore):
+    """Store backed by the conversation_state table.
+
+    Survives restarts and is shared by every bot process (polling, webhook
+    workers) using the same database file. Values are stored as JSON.
+    """
+
+    def __init__(self, namespace, ttl=STATE_TTL):
+        super().__init__(ttl)
+        self.namespace = namespace
+
+    def __getitem__(self, key):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT value FROM conversation_state WHERE namespace = ? AND user_id = ? AND expires_at > ?",
+                (self.namespace, key, time.time())
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        with get_db_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO conversation_state (namespace, user_id, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl)
+            )
+            conn.commit()
+
+    def __delitem__(self, key):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM conversation_state WHERE namespace = ? AND user_id = ?",
+                (self.namespace, key)
+            )
+            conn.commit()
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT user_id FROM conversation_state WHERE namespace = ? AND expires_at > ?",
+                (self.namespace, time.time())
+            )
+            keys = [row[0] for row in cursor.fetchall()]
+        return iter(keys)
+
+    def __len__(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT COUNT(*) FROM conversation_state WHERE namespace = ? AND expires_at > ?",
+                (self.namespace, time.time())
+            )
+            return cursor.fetchone()[0]
+
+    def expire(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM conversation_state WHERE namespace = ? AND expires_at <= ?",
+                (self.namespace, time.time())
+            )
+            conn.commit()
+            return cursor.rowcount
+
+
+def create_state_store(namespace):
+    """Build the store selected by STATE_STORE and start its expiry thread."""
+    if STATE_STORE == 'sqlite':
+        store = SQLiteStateStore(namespace)
+    else:
+        store = MemoryStateStore()
+    store.start_expiry()
+    return store
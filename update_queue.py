@@ -0,0 +1,71 @@
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueueWorker:
+    """Feeds webhook updates queued by the web workers to the bot.
+
+    In webhook mode any number of gunicorn workers store incoming updates
+    in the telegram_updates table (database.enqueue_update) and return at
+    once; this worker runs in the one bot process, which also owns the
+    rate-limited sender. A background thread takes up to ``batch_size``
+    updates in update_id order with a single DELETE ... RETURNING, so a
+    row is handed out once even if several consumers run, and passes
+    their JSON to ``process(payloads)``. Like the in-process webhook
+    before it, an update is at-most-once: it is gone from the table once
+    it was handed to the dispatcher.
+    """
+
+    def __init__(self, process, connection_factory, batch_size=100, poll_interval=0.2):
+        self.process = process
+        self.connection_factory = connection_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='update-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._take()
+            except sqlite3.Error as e:
+                logger.error(f"Error reading queued updates: {e}")
+                batch = []
+            if batch:
+                try:
+                    self.process([payload for _, payload in batch])
+                except Exception as e:
+                    logger.error(f"Error processing updates {batch[0][0]}-{batch[-1][0]}: {e}")
+            if len(batch) < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def _take(self):
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM telegram_updates WHERE update_id IN "
+                "(SELECT update_id FROM telegram_updates ORDER BY update_id LIMIT ?) "
+                "RETURNING update_id, payload",
+                (self.batch_size,)
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+            return sorted(rows)
@@ -0,0 +1,53 @@
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import parse_qsl
+from itsdangerous import URLSafeTimedSerializer
+
+# Telegram WebApp authentication. The mini-app posts Telegram's initData
+# once; it is checked against the bot token and exchanged for a short-lived
+# signed token, so later API calls are verified without touching SQLite.
+# https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+
+
+def validate_init_data(init_data, bot_token, max_age):
+    """Return the Telegram user dict from initData, or None if it is forged or stale."""
+    if not init_data or not bot_token:
+        return None
+
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received_hash = fields.pop('hash', None)
+    if not received_hash:
+        return None
+
+    data_check_string = '\n'.join(f"{key}={value}" for key, value in sorted(fields.items()))
+    secret_key = hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+    expected_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        return None
+
+    try:
+        auth_date = int(fields.get('auth_date', 0))
+        user = json.loads(fields.get('user', ''))
+    except ValueError:
+        return None
+    if time.time() - auth_date > max_age or not isinstance(user, dict) or 'id' not in user:
+        return None
+    return user
+
+
+class TokenSigner:
+    """Issues and checks the signed {user_id, tariff} session tokens"""
+
+    def __init__(self, secret_key, max_age):
+        self.max_age = max_age
+        self._serializer = URLSafeTimedSerializer(secret_key, salt='mini-app-token')
+
+    def issue(self, user_id, tariff):
+        return self._serializer.dumps({'user_id': user_id, 'tariff': tariff})
+
+    def load(self, token):
+        """Return the token payload; raises SignatureExpired or BadSignature."""
+        return self._serializer.loads(token, max_age=self.max_age)
+
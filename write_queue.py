@@ -0,0 +1,155 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _WriteRequest:
+    __slots__ = ('fn', 'args', 'done', 'result')
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+
+
+class WriteQueue:
+    """Background writer that group-commits small writes.
+
+    Callers submit ``fn(cursor, *args)`` callables. A single thread drains
+    the queue, runs everything that arrived within ``flush_interval`` seconds
+    (up to ``max_batch`` writes) inside one transaction and commits once.
+    Each write runs under its own savepoint, so one failing row does not
+    roll back the rest of the batch. ``on_commit`` is called after every
+    committed batch.
+    """
+
+    def __init__(self, connection_factory, flush_interval=0.005, max_batch=500, wait_timeout=30,
+                 on_commit=None):
+        self.connection_factory = connection_factory
+        self.on_commit = on_commit
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.wait_timeout = wait_timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def start(self):
+        with self._lock:
+            # Threads do not survive fork, so gunicorn workers start their own
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._closed = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, fn, *args, wait=True, timeout=None):
+        """Queue a write.
+
+        With ``wait=True`` blocks until the batch holding the write is
+        committed and returns whether it succeeded. Otherwise returns True
+        as soon as the write is queued.
+        """
+        if self._closed:
+            logger.error(f"Write {fn.__name__} rejected: writer is shut down")
+            return False
+        self.start()
+
+        request = _WriteRequest(fn, args)
+        self._queue.put(request)
+        if not wait:
+            return True
+
+        if not request.done.wait(timeout or self.wait_timeout):
+            logger.error(f"Timed out waiting for write {fn.__name__}")
+            return False
+        return request.result
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been committed."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        barrier = _WriteRequest(None, ())
+        self._queue.put(barrier)
+        return barrier.done.wait(timeout or self.wait_timeout)
+
+    def shutdown(self, timeout=None):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout or self.wait_timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish the current batch first, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Write batch of {len(batch)} failed: {e}")
+                for request in batch:
+                    request.result = False
+            for request in batch:
+                request.done.set()
+
+    def _write_batch(self, batch):
+        writes = [request for request in batch if request.fn is not None]
+        for request in batch:
+            if request.fn is None:
+                request.result = True
+        if not writes:
+            return
+
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for request in writes:
+                    cursor.execute("SAVEPOINT queued_write")
+                    try:
+                        request.fn(cursor, *request.args)
+                        request.result = True
+                    except Exception as e:
+                        # Bugs (bad arguments, KeyError, ...) fail only their own write
+                        logger.error(f"Error in queued write {request.fn.__name__}: {e}")
+                        cursor.execute("ROLLBACK TO queued_write")
+                        request.result = False
+                    cursor.execute("RELEASE queued_write")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if self.on_commit:
+            self.on_commit()